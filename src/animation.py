@@ -1,6 +1,6 @@
 # Python built-in modules
-from bisect import bisect_left
-import random      # search sorted keyframe lists
+from bisect import bisect_left     # search sorted keyframe lists
+import weakref                      # keyframes composed while they live
 
 # External, non built-in modules
 import OpenGL.GL as GL              # standard Python OpenGL wrapper
@@ -8,19 +8,30 @@ import glfw                         # lean window system wrapper for OpenGL
 import numpy as np                  # all matrix manipulations & OpenGL args
 
 
-from core import Node
-from transform import (lerp, quaternion, quaternion_from_euler, quaternion_slerp, quaternion_matrix, translate,
-                       scale, identity, vec)
+from core import Node, UNIFORM_BLOCKS
+from importer import MAX_BONES
+from transform import (lerp, quaternion, vec)
+from batched import trs
+from motion import reduce_track, TOLERANCES, Line, Circle, Spin
 
 
 # -------------- Keyframing Utilities TP6 ------------------------------------
 class KeyFrames:
-    """ Stores keyframe pairs for any value type with interpolation_function"""
-    def __init__(self, time_value_pairs, interpolation_function=lerp):
+    """ Stores keyframe pairs for any value type with interpolation_function.
+        With a tolerance, keys that lerping their neighbours reproduces
+        within tolerance are dropped: distance, or angle if angular, i.e.
+        for quaternions """
+    def __init__(self, time_value_pairs, interpolation_function=lerp,
+                 tolerance=None, angular=False):
         if isinstance(time_value_pairs, dict):  # convert to list of pairs
             time_value_pairs = time_value_pairs.items()
-        keyframes = sorted(((key[0], key[1]) for key in time_value_pairs))
+        keyframes = sorted(((key[0], key[1]) for key in time_value_pairs),
+                           key=lambda pair: pair[0])
         self.times, self.values = zip(*keyframes)  # pairs list -> 2 lists
+        if tolerance is not None and interpolation_function is lerp:
+            times, values = reduce_track(self.times, self.values, tolerance,
+                                         angular)
+            self.times, self.values = tuple(times), tuple(values)
         self.interpolate = interpolation_function
 
     def value(self, time):
@@ -41,36 +52,90 @@ class KeyFrames:
         return self.interpolate(self.values[t_i], self.values[t_i + 1], f)
 
 
+class TransformBatch:
+    """ Matrices of all live TransformKeyFrames, composed together: the
+        first value() call at a new time samples every member's keys, then
+        builds all their TRS matrices with a single batched trs() call """
+    def __init__(self):
+        self.members = weakref.WeakSet()
+        self.rows = weakref.WeakKeyDictionary()   # member -> matrix row
+        self.time = None
+        self.matrices = np.empty((0, 4, 4), np.float32)
+
+    def compose(self, time):
+        """ sample all members at time, compose their matrices in one call,
+            buffers being reallocated only when the member count changes """
+        members = list(self.members)
+        count = len(members)
+        if count != len(self.matrices):
+            self.translations = np.empty((count, 3), np.float32)
+            self.rotations = np.empty((count, 4), np.float32)
+            self.scales = np.empty((count, 3), np.float32)
+            self.matrices = np.empty((count, 4, 4), np.float32)
+        self.rows.clear()
+        for row, member in enumerate(members):
+            (self.translations[row], self.rotations[row],
+             self.scales[row]) = member.sample(time)
+            self.rows[member] = row
+        trs(self.translations, self.rotations, self.scales,
+            out=self.matrices)
+        self.time = time
+
+
 class TransformKeyFrames:
-    """ KeyFrames-like object dedicated to 3D transforms """
-    def __init__(self, translate_keys, rotate_keys, scale_keys, NodeName=None, boucle=10):
-        """ stores 3 keyframe sets for translation, rotation, scale """
-        self.translate_keys = KeyFrames(translate_keys)
-        self.rotate_keys = KeyFrames(rotate_keys)
-        self.scale_keys = KeyFrames(scale_keys)
+    """ KeyFrames-like object dedicated to 3D transforms, its matrix being
+        composed along with those of all others in the shared batch """
+    batch = TransformBatch()
+
+    def __init__(self, translate_keys, rotate_keys, scale_keys, NodeName=None, boucle=10,
+                 tolerances=TOLERANCES):
+        """ stores 3 keyframe sets for translation, rotation, scale: each
+            either time -> value keys, reduced within tolerances, or any
+            object with a value(time) method such as a motion path """
+        tolerances = tolerances or (None, None, None)
+        self.translate_keys, self.rotate_keys, self.scale_keys = (
+            keys if hasattr(keys, 'value') else
+            KeyFrames(keys, tolerance=tolerance, angular=angular)
+            for keys, tolerance, angular in zip(
+                (translate_keys, rotate_keys, scale_keys), tolerances,
+                (False, True, False)))
         self.NodeName = NodeName
         self.boucle = boucle
+        self.batch.members.add(self)
+
+    def sample(self, time):
+        """ interpolated translation, rotation & scale at time """
+        return (self.translate_keys.value(time),
+                self.rotate_keys.value(time % self.boucle),
+                self.scale_keys.value(time % self.boucle))
 
     def value(self, time):
-        """ Compute each component's interpolation and compose TRS matrix """
-        translate_mat = translate(self.translate_keys.value(time))
-        rotate_mat = quaternion_matrix(self.rotate_keys.value(time % self.boucle))
-        scale_mat = scale(self.scale_keys.value(time % self.boucle))
+        """ TRS matrix at time, from the batch composed for that time, and
+            overwritten by the next composition """
+        if self.batch.time != time or self not in self.batch.rows:
+            self.batch.compose(time)
         if time > 41:
             glfw.set_time(0.0)
-        return translate_mat @ rotate_mat @ scale_mat
+        return self.batch.matrices[self.batch.rows[self]]
         #return translate_mat @ scale_mat
 
 class KeyFrameControlNode(Node):
     """ Place node with transform keys above a controlled subtree """
-    def __init__(self, trans_keys, rot_keys, scale_keys, name=None, transform=identity()):
+    ground = None     # ground_height(points, exclude) of the drawing viewer
+    def __init__(self, trans_keys, rot_keys, scale_keys, name=None, transform=None):
         super().__init__(transform=transform)
         self.keyframes = TransformKeyFrames(trans_keys, rot_keys, scale_keys, name)
         self.name = name
+        self.animated = True
 
     def draw(self, primitives=GL.GL_TRIANGLES, **uniforms):
-        """ When redraw requested, interpolate our node transform from keys """
-        self.transform = self.keyframes.value(glfw.get_time())
+        """ When redraw requested, interpolate our node transform from keys
+            at the frame time, keeping the ground lookup passed along by
+            the viewer """
+        self.ground = uniforms.get('ground')
+        time = uniforms.get('time')
+        self.transform = self.keyframes.value(
+            glfw.get_time() if time is None else time)
         super().draw(primitives=primitives, **uniforms)
 
     def key_handler(self, key):
@@ -90,11 +155,40 @@ class KeyFrameControlNode(Node):
                     transkey, rotkey, scalekey = sens_rotation(-3, 0, 'pointeur', lastPos)     
                 elif key == glfw.KEY_U:
                     transkey, rotkey, scalekey = sens_rotation(3, 0, 'pointeur', lastPos)      
+                if self.ground is not None and key in list_key[:4]:
+                    self.snap(transkey, lastPos)
                 self.keyframes = TransformKeyFrames(transkey, rotkey, scalekey)
             
+    def snap(self, translate_keys, last):
+        """ keep the subtree's clearance above ground over a horizontal
+            move from last to the single translation key, measured under
+            the origin of the first child, for a node at the scene root """
+        child = self.children[0] if self.children else None
+        anchor = getattr(child, 'transform', np.identity(4))[:3, 3]
+        moved = np.asarray(translate_keys[0], np.float64)
+        before, after = self.ground(
+            ((last[0] + anchor[0], last[2] + anchor[2]),
+             (moved[0] + anchor[0], moved[2] + anchor[2])), exclude=self)
+        if np.isfinite(before) and np.isfinite(after):
+            translate_keys[0] = vec(moved[0], moved[1] + after - before,
+                                    moved[2])
+
 # -------------- Linear Blend Skinning : TP7 ---------------------------------
 class Skinned:
-    """ Skinned mesh decorator, passes bone world transforms to shader """
+    """ Skinned mesh decorator, passes bone world transforms to shader: as
+        a range of the uniform stream for programs declaring the block
+
+        layout(std140, row_major) uniform Bones {
+            mat4 bone_matrix[MAX_BONES];
+        };
+
+        else as the bone_matrix uniform array. A block program whose palette
+        does not fit in the stream's region skips this frame, rather than
+        skin with a stale range; the stream grows for the next one """
+    BLOCK = 'Bones'
+    BINDING = UNIFORM_BLOCKS[BLOCK]
+    NBYTES = MAX_BONES * 64              # std140 size of the whole block
+
     def __init__(self, mesh, bone_nodes, bone_offsets):
         self.mesh = mesh
 
@@ -102,46 +196,57 @@ class Skinned:
         self.bone_nodes = bone_nodes
         self.bone_offsets = np.array(bone_offsets, np.float32)
 
-    def draw(self, **uniforms):
+    @property
+    def bounds(self):
+        """ box around the skinned mesh, in bind pose """
+        return getattr(self.mesh, 'bounds', None)
+
+    @property
+    def shader(self):
+        """ program of the decorated mesh, under its other decorators """
+        drawable = self.mesh
+        while not hasattr(drawable, 'shader'):
+            drawable = drawable.drawable
+        return drawable.shader
+
+    def draw(self, stream=None, **uniforms):
         world_transforms = [node.world_transform for node in self.bone_nodes]
-        uniforms['bone_matrix'] = world_transforms @ self.bone_offsets
-        self.mesh.draw(**uniforms)
+        palette = (world_transforms @ self.bone_offsets).astype(np.float32)
+        if stream is not None and self.BLOCK in self.shader.blocks:
+            offset = stream.write(palette, self.NBYTES)
+            if offset is None:
+                return
+            stream.bind_range(self.BINDING, offset, self.NBYTES)
+        else:
+            uniforms['bone_matrix'] = palette
+        self.mesh.draw(stream=stream, **uniforms)
 
 def sens_rotation(sens, angle, file=None, lastPos=[0, 0, 0], move=True):
     translate_keys = {}
     rotate_keys = {}
     scale_keys = {}
     if file == 'seagull':
-        for i in range(100):
-            translate_keys[i] = vec(0, 20 + i, 4.5 * i * sens)
-            rotate_keys[i] = quaternion(0, 0, 0)
-            scale_keys[i] = 1
-        
+        # straight line for 99s, as the 100 keys it replaces
+        translate_keys = Line((0, 20, 0), (0, 1, 4.5 * sens), end_time=99)
+        rotate_keys[0] = quaternion(0, 0, 0)
+        scale_keys[0] = 1
 
     elif file == 'pointeur':
-        if not move :
-            for i in range(100):
-                scale_keys[i] = 1
-                rotate_keys[i] =quaternion()
-                translate_keys[i] = vec(lastPos[0], lastPos[1], lastPos[2])
-        else :
-            for i in range(100):
-                scale_keys[i] = 1
-                if sens == -2 or sens == 2:
-                    rotate_keys[i] = quaternion()
-                    translate_keys[i] = vec(int(sens/2) + lastPos[0], lastPos[1], lastPos[2])
-                elif abs(sens) == 1:
-                    rotate_keys[i] = quaternion()
-                    translate_keys[i] = vec(lastPos[0], lastPos[1], sens + lastPos[2])
-                elif abs(sens) == 3:
-                    rotate_keys[i] = quaternion()
-                    translate_keys[i] = vec(lastPos[0], int(sens/3) + lastPos[1], lastPos[2])
+        # constant pose, a single key each
+        scale_keys[0] = 1
+        rotate_keys[0] = quaternion()
+        translate_keys[0] = vec(lastPos[0], lastPos[1], lastPos[2])
+        if move :
+            if sens == -2 or sens == 2:
+                translate_keys[0] = vec(int(sens/2) + lastPos[0], lastPos[1], lastPos[2])
+            elif abs(sens) == 1:
+                translate_keys[0] = vec(lastPos[0], lastPos[1], sens + lastPos[2])
+            elif abs(sens) == 3:
+                translate_keys[0] = vec(lastPos[0], int(sens/3) + lastPos[1], lastPos[2])
     elif file == 'boat':
-        for i in range(1000):
-            translate_keys[i] = vec(10 * 2*np.cos(i), 0,  10 * 2*np.sin(i))
-            if i == 0:
-                rotate_keys[0] = quaternion()
-            else :
-                rotate_keys[i] = quaternion_from_euler(0, i * sens * angle, 0)
-            scale_keys[i] = 1
+        # circle of radius 20 at 1 rad/s, spinning about y at sens * angle
+        # degrees per second, as the 1000 keys it replaces
+        translate_keys = Circle((0, 0, 0), 20, speed=1, end_time=999)
+        rotate_keys = Spin((0, 1, 0), sens * angle)
+        scale_keys[0] = 1
     return translate_keys, rotate_keys, scale_keys
\ No newline at end of file
@@ -1,12 +1,22 @@
 #version 330 core
 // TODO: complete the loop for TP7 exercise 1
 
-// ---- camera geometry
-uniform mat4 projection, view, model;
-
-// ---- skinning globals and attributes
+// ---- frame globals, one uniform buffer shared by all programs
+layout(std140, row_major) uniform Frame {
+    mat4 view, projection;
+    vec3 w_camera_position;
+    float time;
+    vec3 light_dir;
+};
+
+// ---- object placement
+uniform mat4 model;
+
+// ---- skinning globals and attributes, palette streamed as a buffer range
 const int MAX_VERTEX_BONES=4, MAX_BONES=128;
-uniform mat4 bone_matrix[MAX_BONES];
+layout(std140, row_major) uniform Bones {
+    mat4 bone_matrix[MAX_BONES];
+};
 
 // ---- vertex attributes
 in vec3 position;
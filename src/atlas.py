@@ -0,0 +1,161 @@
+# Python built-in modules
+from collections import namedtuple
+
+# External, non built-in modules
+import OpenGL.GL as GL              # standard Python OpenGL wrapper
+import numpy as np                  # all matrix manipulations & OpenGL args
+
+from resources import RESOURCES     # GPU memory accounting
+from bundle import find             # compiled textures
+
+ATLAS_UNIT = 8                      # texture unit reserved to texture arrays
+_BOUND = {}                         # texture unit -> array bound on it
+
+Layer = namedtuple('Layer', 'array index file')
+
+
+def source_image(file):
+    """ RGBA image of a texture file, from a mounted bundle if compiled """
+    from PIL import Image           # load texture maps, on first use
+    found = find(file, 'texture')
+    if found is not None:
+        bundle, member = found
+        return Image.fromarray(np.array(bundle.texture_level(member)), 'RGBA')
+    return Image.open(file).convert('RGBA')
+
+
+def source_size(file):
+    """ (width, height) of a texture file, without decoding its pixels """
+    found = find(file, 'texture')
+    if found is not None:
+        bundle, member = found
+        height, width = bundle.texture_level(member).shape[:2]
+        return width, height
+    from PIL import Image
+    with Image.open(file) as image:
+        return image.size
+
+
+# -------------- Texture arrays grouping same size textures -------------------
+class TextureArray:
+    """ GL_TEXTURE_2D_ARRAY whose layers are texture files resized to one
+        common size, uploaded again whenever layers were added """
+    def __init__(self, size, wrap_mode=GL.GL_REPEAT):
+        self.size, self.wrap_mode = size, wrap_mode
+        self.files = []
+        self.glid = None
+        self.uploaded = 0         # number of layers in GL texture object
+
+    def add(self, file):
+        """ new layer for file, index stays valid across re-uploads """
+        self.files.append(file)
+        return Layer(self, len(self.files) - 1, file)
+
+    def upload(self):
+        """ (re-)create GL texture array holding every layer, with mipmaps """
+        if self.glid is not None:
+            self.evict()
+        width, height = self.size
+        self.glid = GL.glGenTextures(1)
+        GL.glActiveTexture(GL.GL_TEXTURE0 + ATLAS_UNIT)
+        GL.glBindTexture(GL.GL_TEXTURE_2D_ARRAY, self.glid)
+        _BOUND[ATLAS_UNIT] = self.glid
+        GL.glTexImage3D(GL.GL_TEXTURE_2D_ARRAY, 0, GL.GL_RGBA8, width, height,
+                        len(self.files), 0, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE,
+                        None)
+        from PIL import Image
+        for index, file in enumerate(self.files):
+            try:
+                image = source_image(file)
+            except FileNotFoundError:
+                print("ERROR: unable to load texture file %s" % file)
+                image = Image.new('RGBA', (1, 1), (255, 255, 255, 255))
+            if image.size != self.size:
+                image = image.resize(self.size, Image.BILINEAR)
+            GL.glTexSubImage3D(GL.GL_TEXTURE_2D_ARRAY, 0, 0, 0, index, width,
+                               height, 1, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE,
+                               image.tobytes())
+        for wrap in (GL.GL_TEXTURE_WRAP_S, GL.GL_TEXTURE_WRAP_T):
+            GL.glTexParameteri(GL.GL_TEXTURE_2D_ARRAY, wrap, self.wrap_mode)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D_ARRAY, GL.GL_TEXTURE_MIN_FILTER,
+                           GL.GL_LINEAR_MIPMAP_LINEAR)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D_ARRAY, GL.GL_TEXTURE_MAG_FILTER,
+                           GL.GL_LINEAR)
+        GL.glGenerateMipmap(GL.GL_TEXTURE_2D_ARRAY)
+        self.uploaded = len(self.files)
+        print(f'Loaded texture array {width}x{height} '
+              f'({self.uploaded} layers)')
+        nbytes = 4 * width * height * self.uploaded * 4 // 3
+        RESOURCES.track(self, nbytes, lambda glid=self.glid:
+                        GL.glDeleteTextures([glid]), 'texture', 'atlas')
+
+    def evict(self):
+        """ free GPU storage, layers get reloaded from files when bound """
+        GL.glDeleteTextures([self.glid])
+        if _BOUND.get(ATLAS_UNIT) == self.glid:
+            del _BOUND[ATLAS_UNIT]
+        self.glid = None
+        RESOURCES.evicted(self)
+
+    def bind(self):
+        """ bind to the atlas texture unit, unless already bound there """
+        if self.glid is None or self.uploaded != len(self.files):
+            self.upload()
+        RESOURCES.touch(self)
+        if _BOUND.get(ATLAS_UNIT) != self.glid:
+            GL.glActiveTexture(GL.GL_TEXTURE0 + ATLAS_UNIT)
+            GL.glBindTexture(GL.GL_TEXTURE_2D_ARRAY, self.glid)
+            _BOUND[ATLAS_UNIT] = self.glid
+
+
+class TextureAtlas:
+    """ Packs texture files into texture arrays, one per layer size: sizes
+        are rounded to powers of two up to max_size, so textures of close
+        sizes share an array. Each file is stored once, whatever the number
+        of meshes or load() calls using it. """
+    def __init__(self, max_size=2048):
+        self.max_size = max_size
+        self.arrays = {}          # layer size -> TextureArray
+        self.layers = {}          # file -> Layer
+
+    def layer_size(self, size):
+        """ power of two size, within max_size, closest to given size """
+        return tuple(int(min(2 ** round(np.log2(max(side, 1))), self.max_size))
+                     for side in size)
+
+    def layer(self, file):
+        """ layer holding texture file, added on first request """
+        if file not in self.layers:
+            try:
+                size = self.layer_size(source_size(file))
+            except FileNotFoundError:
+                print("ERROR: unable to load texture file %s" % file)
+                size = (1, 1)
+            array = self.arrays.get(size)
+            if array is None:
+                array = self.arrays[size] = TextureArray(size)
+            self.layers[file] = array.add(file)
+        return self.layers[file]
+
+    def decorate(self, drawable, file, name='diffuse'):
+        """ drawable sampling file's layer, as name_array & name_layer """
+        return ArrayTextured(drawable, self.layer(file), name)
+
+
+class ArrayTextured:
+    """ Drawable decorator sampling one layer of a texture array: drawables
+        sharing an array bind it once, and only differ by a layer uniform """
+    def __init__(self, drawable, layer, name='diffuse'):
+        self.drawable, self.layer, self.name = drawable, layer, name
+
+    @property
+    def bounds(self):
+        """ box around the decorated drawable, if it has one """
+        return getattr(self.drawable, 'bounds', None)
+
+    def draw(self, primitives=GL.GL_TRIANGLES, **uniforms):
+        self.layer.array.bind()
+        uniforms[self.name + '_array'] = ATLAS_UNIT
+        uniforms[self.name + '_layer'] = self.layer.index
+        uniforms[self.name + '_texture'] = self.layer.array  # for batchers
+        self.drawable.draw(primitives=primitives, **uniforms)
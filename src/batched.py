@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+""" Batched transform math: the transform.py helpers over whole arrays of
+    (N,4,4) matrices, (N,4) quaternions as (w, x, y, z) and (N,3) vectors.
+    Every function writes its result to an optional out= buffer and keeps
+    its temporaries in reused scratch buffers, so steady state calls only
+    allocate numpy's small fixed size iteration buffers, whatever N is.
+    Run this file for a microbenchmark. """
+# Python built-in modules
+import time                         # benchmark timing
+import tracemalloc                  # benchmark allocation tracking
+
+# External, non built-in modules
+import numpy as np                  # all matrix manipulations & OpenGL args
+
+_SCRATCH = {}                       # (name, shape, dtype) -> reused buffer
+
+
+def scratch(name, shape, dtype=np.float32):
+    """ temporary buffer reused across calls with the same name & shape """
+    key = (name, shape, np.dtype(dtype))
+    buffer = _SCRATCH.get(key)
+    if buffer is None:
+        buffer = _SCRATCH[key] = np.empty(shape, dtype)
+    return buffer
+
+
+def result(out, shape, dtype=np.float32):
+    """ out if given, checked against expected shape, else a new array """
+    if out is None:
+        return np.empty(shape, dtype)
+    assert out.shape == shape, 'out has shape %s, not %s' % (out.shape, shape)
+    return out
+
+
+def cross(a, b, out):
+    """ row wise cross products of (N,3) arrays, written to out """
+    tmp = scratch('cross', out.shape[:-1], out.dtype)
+    for i, j, k in ((0, 1, 2), (1, 2, 0), (2, 0, 1)):
+        np.multiply(a[..., j], b[..., k], out=out[..., i])
+        np.multiply(a[..., k], b[..., j], out=tmp)
+        np.subtract(out[..., i], tmp, out=out[..., i])
+    return out
+
+
+# -------------- matrix builders ----------------------------------------------
+def identities(count, out=None):
+    """ count 4x4 identity matrices """
+    out = result(out, (count, 4, 4))
+    out[...] = 0
+    out[:, [0, 1, 2, 3], [0, 1, 2, 3]] = 1
+    return out
+
+
+def quaternion_matrices(quaternions, out=None):
+    """ 4x4 rotation matrices of (N,4) quaternions, normalized on the fly """
+    count = len(quaternions)
+    out = result(out, (count, 4, 4))
+    quaternions = np.asarray(quaternions, out.dtype)
+    outer = scratch('outer', (count, 4, 4))
+    norm2 = scratch('norm2', (count,))
+    np.einsum('ni,nj->nij', quaternions, quaternions, out=outer)
+    np.einsum('nii->n', outer, out=norm2)
+    np.divide(2, norm2, out=norm2)
+    np.multiply(outer, norm2[:, None, None], out=outer)   # 2 q q^T / |q|^2
+    (w, x, y, z) = range(4)
+    for row, col, (a, b), (c, d), sign in (
+            (0, 0, (y, y), (z, z), None), (1, 1, (x, x), (z, z), None),
+            (2, 2, (x, x), (y, y), None),
+            (0, 1, (x, y), (z, w), -1), (1, 0, (x, y), (z, w), 1),
+            (0, 2, (x, z), (y, w), 1), (2, 0, (x, z), (y, w), -1),
+            (1, 2, (y, z), (x, w), -1), (2, 1, (y, z), (x, w), 1)):
+        entry = out[:, row, col]
+        if sign is None:        # diagonal: 1 - 2 (a^2 + c^2)
+            np.add(outer[:, a, b], outer[:, c, d], out=entry)
+            np.subtract(1, entry, out=entry)
+        elif sign > 0:
+            np.add(outer[:, a, b], outer[:, c, d], out=entry)
+        else:
+            np.subtract(outer[:, a, b], outer[:, c, d], out=entry)
+    out[:, 3, :3] = out[:, :3, 3] = 0
+    out[:, 3, 3] = 1
+    return out
+
+
+def trs(translations, rotations, scales, out=None):
+    """ translate @ rotate @ scale matrices, from (N,3) translations, (N,4)
+        quaternions and (N,) uniform or (N,3) per axis scales """
+    count = len(rotations)
+    out = quaternion_matrices(rotations, out)
+    scales = np.reshape(scales, (count, -1))
+    np.multiply(out[:, :3, :3], scales[:, None, :], out=out[:, :3, :3])
+    out[:, :3, 3] = translations
+    return out
+
+
+# -------------- interpolation ------------------------------------------------
+def lerps(start, end, fractions, out=None):
+    """ row wise linear interpolation, fractions scalar or (N,) """
+    out = result(out, np.shape(start))
+    fractions = np.reshape(fractions, (-1,) + (1,) * (np.ndim(start) - 1))
+    np.subtract(end, start, out=out)
+    np.multiply(out, fractions, out=out)
+    np.add(out, start, out=out)
+    return out
+
+
+def slerps(q0, q1, fractions, out=None):
+    """ shortest path spherical interpolation of (N,4) unit quaternions """
+    count = len(q0)
+    out = result(out, (count, 4))
+    q0, q1 = np.asarray(q0, out.dtype), np.asarray(q1, out.dtype)
+    dot, theta, w0, w1 = (scratch(name, (count,)) for name in
+                          ('dot', 'theta', 'w0', 'w1'))
+    np.einsum('ni,ni->n', q0, q1, out=dot)
+    np.copysign(1, dot, out=w1)                     # -q1 if further than q1
+    np.abs(dot, out=dot)
+    np.clip(dot, -1, 1, out=dot)
+    np.arccos(dot, out=theta)
+
+    # w0 = sin((1 - f) theta) / sin(theta), w1 = sin(f theta) / sin(theta)
+    np.multiply(theta, fractions, out=w0)
+    np.sin(w0, out=w0)
+    np.multiply(w1, w0, out=w1)
+    np.multiply(theta, fractions, out=w0)
+    np.subtract(theta, w0, out=w0)
+    np.sin(w0, out=w0)
+    np.sin(theta, out=theta)
+    close = np.greater(dot, 1 - 1e-6, out=scratch('close', (count,), bool))
+    np.maximum(theta, 1e-12, out=theta)
+    np.divide(w0, theta, out=w0)
+    np.divide(w1, theta, out=w1)
+    if close.any():
+        fraction = np.broadcast_to(fractions, (count,))[close]
+        w0[close] = 1 - fraction
+        w1[close] = np.copysign(fraction, np.einsum('ni,ni->n', q0[close],
+                                                    q1[close]))
+
+    np.multiply(q0, w0[:, None], out=out)
+    tmp = scratch('slerp', (count, 4))
+    np.multiply(q1, w1[:, None], out=tmp)
+    np.add(out, tmp, out=out)
+    np.einsum('ni,ni->n', out, out, out=dot)
+    np.sqrt(dot, out=dot)
+    np.divide(out, dot[:, None], out=out)
+    return out
+
+
+# -------------- inverses -----------------------------------------------------
+def _cofactors(matrices):
+    """ cofactor matrices (N,3,3) & determinants (N,) of upper 3x3 blocks """
+    count = len(matrices)
+    cof = scratch('cofactors', (count, 3, 3))
+    det = scratch('determinants', (count,))
+    rows = np.asarray(matrices[:, :3, :3], np.float32)
+    for i in range(3):
+        cross(rows[:, (i + 1) % 3], rows[:, (i + 2) % 3], cof[:, i])
+    np.einsum('ni,ni->n', rows[:, 0], cof[:, 0], out=det)
+    return cof, det
+
+
+def normal_matrices(matrices, out=None):
+    """ inverse transpose of the (N,4,4) matrices upper 3x3 blocks """
+    out = result(out, (len(matrices), 3, 3))
+    cof, det = _cofactors(matrices)
+    np.divide(cof, det[:, None, None], out=out)
+    return out
+
+
+def inverses(matrices, out=None):
+    """ inverses of (N,4,4) affine transforms, i.e. with (0, 0, 0, 1) as
+        last row, such as any product of translate, rotate & scale """
+    count = len(matrices)
+    out = result(out, (count, 4, 4))
+    cof, det = _cofactors(matrices)
+    translation = scratch('translation', (count, 3))
+    translation[...] = matrices[:, :3, 3]    # matrices & out may be the same
+    np.divide(cof.transpose(0, 2, 1), det[:, None, None], out=out[:, :3, :3])
+    np.einsum('nij,nj->ni', out[:, :3, :3], translation, out=out[:, :3, 3])
+    np.negative(out[:, :3, 3], out=out[:, :3, 3])
+    out[:, 3, :3] = 0
+    out[:, 3, 3] = 1
+    return out
+
+
+# -------------- microbenchmark -----------------------------------------------
+def measure(function, repeat=5):
+    """ (seconds per call, bytes allocated per call) of function() """
+    function()                                          # warm up scratch
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    elapsed = (time.perf_counter() - start) / repeat
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def benchmark(count=10000):
+    """ compare per transform transform.py calls to batched calls """
+    from transform import translate, scale, quaternion_matrix, quaternion_slerp
+
+    rng = np.random.default_rng(0)
+    translation = rng.standard_normal((count, 3)).astype(np.float32)
+    rotation = rng.standard_normal((count, 4)).astype(np.float32)
+    rotation /= np.linalg.norm(rotation, axis=1)[:, None]
+    other = rotation[::-1].copy()
+    scaling = rng.uniform(.5, 2, count).astype(np.float32)
+    matrices, quaternions = np.empty((count, 4, 4), np.float32), \
+        np.empty((count, 4), np.float32)
+    normals = np.empty((count, 3, 3), np.float32)
+
+    cases = (
+        ('TRS compose',
+         lambda: [translate(t) @ quaternion_matrix(q) @ scale(s)
+                  for t, q, s in zip(translation, rotation, scaling)],
+         lambda: trs(translation, rotation, scaling, out=matrices)),
+        ('slerp',
+         lambda: [quaternion_slerp(q0, q1, .3)
+                  for q0, q1 in zip(rotation, other)],
+         lambda: slerps(rotation, other, .3, out=quaternions)),
+        ('inverse',
+         lambda: np.linalg.inv(matrices),
+         lambda: inverses(matrices, out=matrices)),
+        ('normal matrix',
+         lambda: np.linalg.inv(matrices[:, :3, :3]).transpose(0, 2, 1),
+         lambda: normal_matrices(matrices, out=normals)))
+
+    print('%d transforms         per call        allocated' % count)
+    for name, single, batched in cases:
+        for label, function in (('reference', single), ('batched', batched)):
+            seconds, nbytes = measure(function)
+            print('%-14s %-9s %9.3f ms %12d bytes' % (
+                name, label, seconds * 1e3, nbytes))
+
+
+if __name__ == '__main__':
+    benchmark()
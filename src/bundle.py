@@ -0,0 +1,130 @@
+# Python built-in modules
+import os                           # os function, i.e. checking file status
+
+# External, non built-in modules
+import OpenGL.GL as GL              # standard Python OpenGL wrapper
+
+from pack import PackReader
+from resources import RESOURCES
+from texture import Texture
+
+MAGIC = b'BUNDLE01'
+SEPARATOR = ':'                     # 'assets.bundle:dir/model.fbx' paths
+
+
+def is_descriptor(value):
+    """ True for dicts standing for an array stored in a pack file """
+    return isinstance(value, dict) and value.keys() == {'offset', 'dtype',
+                                                        'shape'}
+
+
+def resolve(value, pack):
+    """ copy of a JSON structure, array descriptors replaced by array views """
+    if is_descriptor(value):
+        return pack.array(value)
+    if isinstance(value, dict):
+        return {key: resolve(item, pack) for key, item in value.items()}
+    if isinstance(value, list):
+        return [resolve(item, pack) for item in value]
+    return value
+
+
+# -------------- compiled asset bundle, see compiler.py -----------------------
+class Bundle:
+    """ Memory mapped asset bundle: scenes in the plain form of
+        importer.import_scene() with meshes already packed, and textures
+        with their mip chain. Arrays are views on the file mapping, GL
+        uploads read them straight from the page cache. """
+    def __init__(self, path):
+        self.path = path
+        self.pack = PackReader(path, MAGIC)
+        self.sources = self.pack.contents['sources']
+        self.textures = {}                # shared BundleTexture per file
+
+    def kind(self, file):
+        """ 'scene' or 'texture' if file is compiled in bundle, else None """
+        entry = self.sources.get(os.path.normpath(file))
+        return None if entry is None else entry['kind']
+
+    def scene(self, file):
+        """ scene description of a compiled model file """
+        return resolve(self.sources[os.path.normpath(file)]['scene'],
+                       self.pack)
+
+    def texture_level(self, file, level=0):
+        """ RGBA uint8 array of one mip level of a compiled image file """
+        entry = self.sources[os.path.normpath(file)]
+        return self.pack.array(entry['levels'][level])
+
+    def texture(self, file, *modes):
+        """ texture of a compiled image file, created once per modes """
+        key = (os.path.normpath(file), *modes)
+        if key not in self.textures:
+            self.textures[key] = BundleTexture(self, file, *modes)
+        return self.textures[key]
+
+
+class BundleTexture(Texture):
+    """ Texture uploaded from a bundle's precomputed mip levels """
+    def __init__(self, bundle, tex_file, *modes):
+        self.bundle = bundle
+        super().__init__(tex_file, *modes)
+
+    def upload(self, verbose=False):
+        """ (re-)upload all stored mip levels to a new GL texture object """
+        wrap_mode, mag_filter, min_filter = self.modes
+        entry = self.bundle.sources[os.path.normpath(self.tex_file)]
+        levels = [self.bundle.texture_level(self.tex_file, level)
+                  for level in range(len(entry['levels']))]
+        self.glid = GL.glGenTextures(1)
+        GL.glBindTexture(self.type, self.glid)
+        for level, data in enumerate(levels):
+            GL.glTexImage2D(self.type, level, GL.GL_RGBA, data.shape[1],
+                            data.shape[0], 0, GL.GL_RGBA,
+                            GL.GL_UNSIGNED_BYTE, data)
+        GL.glTexParameteri(self.type, GL.GL_TEXTURE_MAX_LEVEL, len(levels) - 1)
+        GL.glTexParameteri(self.type, GL.GL_TEXTURE_WRAP_S, wrap_mode)
+        GL.glTexParameteri(self.type, GL.GL_TEXTURE_WRAP_T, wrap_mode)
+        GL.glTexParameteri(self.type, GL.GL_TEXTURE_MIN_FILTER, min_filter)
+        GL.glTexParameteri(self.type, GL.GL_TEXTURE_MAG_FILTER, mag_filter)
+        if verbose:
+            print(f'Loaded texture {self.tex_file} ({levels[0].shape[1]}x'
+                  f'{levels[0].shape[0]}, {len(levels)} levels from '
+                  f'{self.bundle.path})')
+        RESOURCES.track(self, sum(level.nbytes for level in levels),
+                        lambda glid=self.glid: GL.glDeleteTextures([glid]),
+                        'texture', self.tex_file)
+
+
+# -------------- mounted bundles, searched by load() --------------------------
+BUNDLES = []
+
+
+def mount(path):
+    """ make assets of bundle file at path available to load() """
+    bundle = Bundle(path)
+    BUNDLES.append(bundle)
+    print('Mounted', path, '\t(%d assets)' % len(bundle.sources))
+    return bundle
+
+
+def find(file, kind):
+    """ (bundle, member file) holding file of given kind, either explicitly
+        given as 'bundle_path:member' or found in a mounted bundle """
+    path, _, member = file.rpartition(SEPARATOR)
+    if path and os.path.isfile(path):
+        bundles = [next((b for b in BUNDLES if b.path == path), None) or
+                   mount(path)]
+    else:
+        bundles, member = BUNDLES, file
+    return next(((bundle, member) for bundle in bundles
+                 if bundle.kind(member) == kind), None)
+
+
+def texture(file, *modes):
+    """ texture from a bundle holding file, or else from file itself """
+    found = find(file, 'texture')
+    if found is not None:
+        bundle, member = found
+        return bundle.texture(member, *modes)
+    return Texture(file, *modes)
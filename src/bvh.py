@@ -0,0 +1,406 @@
+# Python built-in modules
+import time                         # query benchmark timing
+from collections import namedtuple
+
+# External, non built-in modules
+import numpy as np                  # all matrix manipulations & OpenGL args
+
+
+# -------------- vectorized primitive tests -----------------------------------
+def ray_boxes(origins, inv_directions, lo, hi):
+    """ slab test of rays against boxes, row by row: (t_near, t_far) """
+    t_0 = (lo - origins) * inv_directions
+    t_1 = (hi - origins) * inv_directions
+    return (np.minimum(t_0, t_1).max(axis=1),
+            np.maximum(t_0, t_1).min(axis=1))
+
+
+def ray_triangles(origins, directions, triangles, eps=1e-12):
+    """ Moller-Trumbore ray/triangle test, row by row, two sided.
+        Returns hit distance along each ray, inf where missed """
+    edge_1 = triangles[:, 1] - triangles[:, 0]
+    edge_2 = triangles[:, 2] - triangles[:, 0]
+    p_vec = np.cross(directions, edge_2)
+    det = np.einsum('ij,ij->i', edge_1, p_vec)
+    valid = np.abs(det) > eps
+    inv_det = 1 / np.where(valid, det, 1)
+    t_vec = origins - triangles[:, 0]
+    u = np.einsum('ij,ij->i', t_vec, p_vec) * inv_det
+    q_vec = np.cross(t_vec, edge_1)
+    v = np.einsum('ij,ij->i', directions, q_vec) * inv_det
+    t = np.einsum('ij,ij->i', edge_2, q_vec) * inv_det
+    hit = valid & (u >= 0) & (v >= 0) & (u + v <= 1) & (t >= 0)
+    return np.where(hit, t, np.inf)
+
+
+def sphere_boxes(centers, radii, lo, hi):
+    """ True where spheres overlap boxes, row by row """
+    delta = np.maximum(np.maximum(lo - centers, centers - hi), 0)
+    return np.einsum('ij,ij->i', delta, delta) <= radii ** 2
+
+
+def segment_distance2(points, start, end):
+    """ squared distance of points to segments, row by row """
+    edge = end - start
+    length2 = np.maximum(np.einsum('ij,ij->i', edge, edge), 1e-30)
+    t = np.clip(np.einsum('ij,ij->i', points - start, edge) / length2, 0, 1)
+    delta = points - (start + t[:, None] * edge)
+    return np.einsum('ij,ij->i', delta, delta)
+
+
+def point_triangles_distance2(points, triangles):
+    """ squared distance of points to triangles, row by row """
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    normal = np.cross(b - a, c - a)
+    norm2 = np.einsum('ij,ij->i', normal, normal)
+    side = [np.einsum('ij,ij->i', np.cross(end - start, points - start), normal)
+            for start, end in ((a, b), (b, c), (c, a))]
+    inside = (norm2 > 1e-30) & (side[0] >= 0) & (side[1] >= 0) & (side[2] >= 0)
+    plane = np.einsum('ij,ij->i', points - a, normal) ** 2 / np.maximum(norm2,
+                                                                        1e-30)
+    edges = np.minimum.reduce([segment_distance2(points, a, b),
+                               segment_distance2(points, b, c),
+                               segment_distance2(points, c, a)])
+    return np.where(inside, plane, edges)
+
+
+def expand_leaves(starts, counts):
+    """ primitive slots of leaves given by start & count: (repeat, slots) """
+    total = counts.sum()
+    repeat = np.repeat(np.arange(len(starts)), counts)
+    first = np.repeat(np.cumsum(counts) - counts, counts)
+    return repeat, np.repeat(starts, counts) + np.arange(total) - first
+
+
+# -------------- Bounding volume hierarchy over boxes -------------------------
+class BoxTree:
+    """ Binary tree of axis aligned boxes, over primitives given by their
+        boxes, stored as flat arrays. Node 0 is the root, inner nodes have
+        children child & child + 1, leaves hold primitives order[start:end]. """
+    def __init__(self, lo, hi, leaf_size=8):
+        centers = (lo + hi) / 2
+        self.order = np.arange(len(lo))
+        child, start, count, depth = [-1], [0], [len(lo)], [0]
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if count[node] <= leaf_size:
+                continue
+            # median split along the largest extent of primitive centers
+            begin, end = start[node], start[node] + count[node]
+            ids = self.order[begin:end]
+            spread = centers[ids].max(axis=0) - centers[ids].min(axis=0)
+            half = count[node] // 2
+            split = np.argpartition(centers[ids, np.argmax(spread)], half)
+            self.order[begin:end] = ids[split]
+            child[node] = len(child)
+            child += [-1, -1]
+            start += [begin, begin + half]
+            count += [half, count[node] - half]
+            depth += [depth[node] + 1] * 2
+            stack += [len(child) - 2, len(child) - 1]
+        self.child, self.start = np.array(child), np.array(start)
+        self.count, self.depth = np.array(count), np.array(depth)
+        self.leaves = np.flatnonzero(self.child < 0)
+        self.leaves = self.leaves[np.argsort(self.start[self.leaves])]
+        self.lo = self.hi = None
+        self.refit(lo, hi)
+
+    def refit(self, lo, hi):
+        """ update node boxes bottom-up for moved primitives, same topology """
+        lo, hi = lo[self.order], hi[self.order]
+        self.lo = np.empty((len(self.child), 3))
+        self.hi = np.empty((len(self.child), 3))
+        starts = self.start[self.leaves]
+        self.lo[self.leaves] = np.minimum.reduceat(lo, starts)
+        self.hi[self.leaves] = np.maximum.reduceat(hi, starts)
+        for level in range(self.depth.max() - 1, -1, -1):
+            inner = np.flatnonzero((self.depth == level) & (self.child >= 0))
+            left = self.child[inner]
+            self.lo[inner] = np.minimum(self.lo[left], self.lo[left + 1])
+            self.hi[inner] = np.maximum(self.hi[left], self.hi[left + 1])
+
+    def traverse(self, overlaps, queries):
+        """ all (query, primitive) pairs whose leaf box passes overlaps test,
+            overlaps(query_ids, node_ids) -> bool array, breadth first """
+        query_ids = np.arange(queries)
+        node_ids = np.zeros(queries, int)
+        found_queries, found_slots = [], []
+        while len(query_ids):
+            keep = overlaps(query_ids, node_ids)
+            query_ids, node_ids = query_ids[keep], node_ids[keep]
+            leaf = self.child[node_ids] < 0
+            repeat, slots = expand_leaves(self.start[node_ids[leaf]],
+                                          self.count[node_ids[leaf]])
+            found_queries.append(query_ids[leaf][repeat])
+            found_slots.append(slots)
+            query_ids = np.tile(query_ids[~leaf], 2)
+            left = self.child[node_ids[~leaf]]
+            node_ids = np.concatenate((left, left + 1))
+        slots = np.concatenate(found_slots) if found_slots else []
+        return (np.concatenate(found_queries).astype(int) if found_queries
+                else np.zeros(0, int), self.order[np.asarray(slots, int)])
+
+
+class MeshBVH(BoxTree):
+    """ BVH over the triangles of a mesh, in model coordinates """
+    def __init__(self, positions, faces, leaf_size=8):
+        self.faces = np.asarray(faces).reshape(-1, 3)
+        self.triangles = np.asarray(positions, np.float64)[self.faces]
+        super().__init__(self.triangles.min(axis=1),
+                         self.triangles.max(axis=1), leaf_size)
+
+    def refit_positions(self, positions):
+        """ refit to deformed vertex positions, keeping the tree topology """
+        self.triangles = np.asarray(positions, np.float64)[self.faces]
+        self.refit(self.triangles.min(axis=1), self.triangles.max(axis=1))
+
+    def intersect_rays(self, origins, directions, t_max=None):
+        """ closest hit distance and triangle per ray, inf & -1 if none """
+        best_t = np.full(len(origins), np.inf) if t_max is None else \
+            np.array(t_max, np.float64)
+        best_triangle = np.full(len(origins), -1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inv_directions = 1 / directions
+        query_ids = np.arange(len(origins))
+        node_ids = np.zeros(len(origins), int)
+        while len(query_ids):
+            with np.errstate(invalid='ignore'):
+                t_near, t_far = ray_boxes(origins[query_ids],
+                                          inv_directions[query_ids],
+                                          self.lo[node_ids], self.hi[node_ids])
+            keep = (t_near <= t_far) & (t_far >= 0) & \
+                (t_near < best_t[query_ids])
+            query_ids, node_ids = query_ids[keep], node_ids[keep]
+
+            # leaves: test their triangles, keep closest hit per ray
+            leaf = self.child[node_ids] < 0
+            repeat, slots = expand_leaves(self.start[node_ids[leaf]],
+                                          self.count[node_ids[leaf]])
+            rays, triangles = query_ids[leaf][repeat], self.order[slots]
+            t = ray_triangles(origins[rays], directions[rays],
+                              self.triangles[triangles])
+            np.minimum.at(best_t, rays, t)
+            closest = np.isfinite(t) & (t == best_t[rays])
+            best_triangle[rays[closest]] = triangles[closest]
+
+            # inner nodes: continue with both children
+            query_ids = np.tile(query_ids[~leaf], 2)
+            left = self.child[node_ids[~leaf]]
+            node_ids = np.concatenate((left, left + 1))
+        return best_t, best_triangle
+
+    def intersect_spheres(self, centers, radii):
+        """ (sphere, triangle) pairs of triangles touching spheres """
+        spheres, triangles = self.traverse(lambda q, n: sphere_boxes(
+            centers[q], radii[q], self.lo[n], self.hi[n]), len(centers))
+        touch = point_triangles_distance2(
+            centers[spheres], self.triangles[triangles]) <= radii[spheres] ** 2
+        return spheres[touch], triangles[touch]
+
+
+# -------------- Scene level queries ------------------------------------------
+RayHits = namedtuple('RayHits', 'distance position instance triangle')
+Instance = namedtuple('Instance', 'node drawable vertex_array')
+
+
+def subtree_nodes(node):
+    """ ids of node and of all nodes below it, empty for None """
+    if node is None:
+        return set()
+    ids = {id(node)}
+    for child in getattr(node, 'children', ()):
+        if hasattr(child, 'children'):
+            ids |= subtree_nodes(child)
+    return ids
+
+
+def base_mesh(drawable):
+    """ innermost drawable of a Textured/Skinned decorator chain """
+    while hasattr(drawable, 'drawable') or hasattr(drawable, 'mesh'):
+        drawable = getattr(drawable, 'drawable', None) or drawable.mesh
+    return drawable
+
+
+class SceneQuery:
+    """ Ray and sphere queries against every triangle mesh of a scene graph.
+        Each mesh gets a BVH in model coordinates, built on first use, and
+        a top level BVH over mesh instances placed by their node's world
+        transform is refit before each query, following moving nodes.
+        Skinned meshes are queried in bind pose. Height field nodes, which
+        have intersect_rays(), are queried as such: their hits come after
+        mesh instances, as instance len(instances) + terrain index. """
+    def __init__(self, root):
+        self.instances = []
+        self.terrains = []
+        self._collect(root)
+        self.mesh_bvhs = {}       # id(vertex_array) -> MeshBVH
+        self.local_bounds = np.array([instance.vertex_array.bounds
+                                      for instance in self.instances])
+        self.world = None
+        self.tree = None
+        self.refit()
+
+    def _collect(self, node):
+        for child in node.children:
+            if hasattr(child, 'intersect_rays'):
+                self.terrains.append(child)
+            elif hasattr(child, 'children'):
+                self._collect(child)
+                continue
+            vertex_array = getattr(base_mesh(child), 'vertex_array', None)
+            if (vertex_array is not None and vertex_array.bounds is not None
+                    and vertex_array.bounds.shape == (2, 3)
+                    and vertex_array.index is not None
+                    and vertex_array.index.size
+                    and vertex_array.index.size % 3 == 0):
+                self.instances.append(Instance(node, child, vertex_array))
+
+    def refit(self):
+        """ update instance world boxes from current node world transforms """
+        if not self.instances:
+            return
+        self.world = np.array([instance.node.world_transform
+                               for instance in self.instances], np.float64)
+        self.inverse = np.linalg.inv(self.world)
+        corners = np.array([[(x, y, z, 1) for x in box[:, 0] for y in box[:, 1]
+                             for z in box[:, 2]] for box in self.local_bounds])
+        corners = np.einsum('nij,nkj->nki', self.world, corners)[..., :3]
+        lo, hi = corners.min(axis=1), corners.max(axis=1)
+        if self.tree is None:
+            self.tree = BoxTree(lo, hi, leaf_size=2)
+        else:
+            self.tree.refit(lo, hi)
+
+    def mesh_bvh(self, index):
+        """ BVH of instance's mesh, built once per vertex array """
+        vertex_array = self.instances[index].vertex_array
+        bvh = self.mesh_bvhs.get(id(vertex_array))
+        if bvh is None:
+            bvh = self.mesh_bvhs[id(vertex_array)] = MeshBVH(
+                vertex_array.vertices['position'], vertex_array.index)
+        return bvh
+
+    def raycast(self, origins, directions, exclude=None):
+        """ closest scene hit of a batch of rays, as RayHits of arrays,
+            ignoring meshes in the subtree of node exclude if given """
+        skipped = subtree_nodes(exclude)
+        origins = np.asarray(origins, np.float64).reshape(-1, 3)
+        directions = np.asarray(directions, np.float64).reshape(-1, 3)
+        self.refit()
+        with np.errstate(divide='ignore'):
+            inv_directions = 1 / directions
+
+        def overlaps(rays, nodes):
+            with np.errstate(invalid='ignore'):
+                t_near, t_far = ray_boxes(origins[rays], inv_directions[rays],
+                                          self.tree.lo[nodes],
+                                          self.tree.hi[nodes])
+            return (t_near <= t_far) & (t_far >= 0)
+        rays, instances = self.tree.traverse(overlaps, len(origins)) \
+            if self.tree else (np.zeros(0, int),) * 2
+
+        # rays in model coordinates keep their parameter t: no renormalizing
+        best_t = np.full(len(origins), np.inf)
+        best_instance = np.full(len(origins), -1)
+        best_triangle = np.full(len(origins), -1)
+        for instance in np.unique(instances):
+            if id(self.instances[instance].node) in skipped:
+                continue
+            ray_ids = rays[instances == instance]
+            inverse = self.inverse[instance]
+            local_origins = origins[ray_ids] @ inverse[:3, :3].T + inverse[:3, 3]
+            local_directions = directions[ray_ids] @ inverse[:3, :3].T
+            t, triangle = self.mesh_bvh(instance).intersect_rays(
+                local_origins, local_directions, best_t[ray_ids])
+            closer = triangle >= 0
+            best_t[ray_ids[closer]] = t[closer]
+            best_instance[ray_ids[closer]] = instance
+            best_triangle[ray_ids[closer]] = triangle[closer]
+
+        # height fields, rays in their coordinates: same parameter t
+        for index, terrain in enumerate(self.terrains):
+            if id(terrain) in skipped:
+                continue
+            inverse = np.linalg.inv(terrain.world_transform)
+            t = terrain.intersect_rays(origins @ inverse[:3, :3].T +
+                                       inverse[:3, 3],
+                                       directions @ inverse[:3, :3].T)
+            closer = t < best_t
+            best_t[closer] = t[closer]
+            best_instance[closer] = len(self.instances) + index
+            best_triangle[closer] = -1
+        with np.errstate(invalid='ignore'):  # inf * 0 for missed rays
+            position = origins + best_t[:, None] * directions
+        return RayHits(best_t, position, best_instance, best_triangle)
+
+    def label(self, instance):
+        """ readable name of a hit instance, mesh or height field """
+        if instance >= len(self.instances):
+            return type(self.terrains[instance - len(self.instances)]).__name__
+        instance = self.instances[instance]
+        return instance.vertex_array.source or type(instance.drawable).__name__
+
+    def overlap(self, centers, radii):
+        """ (sphere, instance, triangle) arrays of triangles touching spheres,
+            spheres are tested in world units, even on scaled instances """
+        centers = np.asarray(centers, np.float64).reshape(-1, 3)
+        radii = np.broadcast_to(np.asarray(radii, np.float64), len(centers))
+        self.refit()
+        spheres, instances = self.tree.traverse(lambda q, n: sphere_boxes(
+            centers[q], radii[q], self.tree.lo[n], self.tree.hi[n]),
+            len(centers)) if self.tree else (np.zeros(0, int),) * 2
+        found = [], [], []
+        for instance in np.unique(instances):
+            sphere_ids = spheres[instances == instance]
+            bvh = self.mesh_bvh(instance)
+            world = self.world[instance]
+            # conservative local radius, exact test redone in world space
+            stretch = np.linalg.norm(self.inverse[instance][:3, :3], 2)
+            local = centers[sphere_ids] @ self.inverse[instance][:3, :3].T + \
+                self.inverse[instance][:3, 3]
+            hit_spheres, triangles = bvh.intersect_spheres(
+                local, radii[sphere_ids] * stretch)
+            world_triangles = bvh.triangles[triangles] @ world[:3, :3].T + \
+                world[:3, 3]
+            touch = point_triangles_distance2(
+                centers[sphere_ids[hit_spheres]], world_triangles) <= \
+                radii[sphere_ids[hit_spheres]] ** 2
+            found[0].append(sphere_ids[hit_spheres][touch])
+            found[1].append(np.full(touch.sum(), instance))
+            found[2].append(triangles[touch])
+        return tuple(np.concatenate(items) if items else np.zeros(0, int)
+                     for items in found)
+
+    def ground_height(self, points, top=1e4, exclude=None):
+        """ height of the first surface below each (x, z) point, nan if none """
+        points = np.asarray(points, np.float64).reshape(-1, 2)
+        origins = np.column_stack((points[:, 0], np.full(len(points), top),
+                                   points[:, 1]))
+        hits = self.raycast(origins, np.tile((0., -1., 0.), (len(points), 1)),
+                            exclude)
+        return np.where(hits.instance >= 0, hits.position[:, 1], np.nan)
+
+
+def benchmark(query, count=100000, seed=0):
+    """ rays & spheres per second on the query's scene, as a report string """
+    if query.tree is None:
+        return 'Scene query: no instances'
+    rng = np.random.default_rng(seed)
+    lo, hi = query.tree.lo[0], query.tree.hi[0]
+    origins = rng.uniform(lo, hi, (count, 3))
+    origins[:, 1] = hi[1] + 1
+    targets = rng.uniform(lo, hi, (count, 3))
+    start = time.perf_counter()
+    hits = query.raycast(origins, targets - origins)
+    ray_time = time.perf_counter() - start
+    start = time.perf_counter()
+    spheres = query.overlap(targets[:count // 10], (hi - lo).max() / 200)
+    sphere_time = time.perf_counter() - start
+    return ('Scene query: %d instances, %d triangles, %.0f rays/s (%d hits), '
+            '%.0f spheres/s (%d contacts)' % (
+                len(query.instances),
+                sum(len(instance.vertex_array.index) // 3
+                    for instance in query.instances),
+                count / ray_time, (hits.instance >= 0).sum(),
+                count // 10 / sphere_time, len(spheres[0])))
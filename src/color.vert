@@ -1,8 +1,14 @@
 #version 330 core
 
+// ---- frame globals, one uniform buffer shared by all programs
+layout(std140, row_major) uniform Frame {
+    mat4 view, projection;
+    vec3 w_camera_position;
+    float time;
+    vec3 light_dir;
+};
+
 // input attribute variable, given per vertex
-uniform mat4 projection;
-uniform mat4 view;
 in vec3 position;
 in vec3 color;
 out vec3 frag_color;
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+""" Offline asset compiler: imports models & textures of asset directories
+    in parallel and writes them to a single bundle that load() maps at run
+    time, e.g.  python compiler.py -o assets.bundle FantasyWorld
+
+    Sources whose size & modification time did not change since the last
+    build are copied from the previous bundle instead of being re-imported.
+"""
+# Python built-in modules
+import argparse                     # command line interface
+import os                           # os function, i.e. checking file status
+import time                         # build timing
+from concurrent.futures import ProcessPoolExecutor
+
+# External, non built-in modules
+import numpy as np                  # all matrix manipulations & OpenGL args
+
+from importer import import_scene, texture_levels, TEXTURE_EXTENSIONS
+from layout import pack_vertices, pack_indices
+from pack import PackWriter, PackReader, stamp
+from bundle import MAGIC, resolve
+
+VERSION = 2                         # bump when compiled entries change
+MODEL_EXTENSIONS = ('.fbx', '.obj')
+ASSET_DIRS = ('FantasyCharacters', 'FantasyWorld', 'central_Island')
+
+
+def scan(directories):
+    """ model & texture source files in directories, sorted """
+    extensions = MODEL_EXTENSIONS + TEXTURE_EXTENSIONS
+    return sorted(os.path.normpath(os.path.join(d, f))
+                  for directory in directories
+                  for d, _, files in os.walk(directory, followlinks=True)
+                  for f in files if f.lower().endswith(extensions))
+
+
+# -------------- per source work, run in worker processes ---------------------
+def compile_model(file):
+    """ imported scene with meshes packed to their final vertex layout """
+    scene = import_scene(file)
+    if scene is None:
+        return None
+    for mesh in scene['meshes']:
+        attributes = mesh.pop('attributes')
+        layout, vertices = pack_vertices(attributes)
+        position = attributes['position']
+        mesh.update(layout=layout.describe(), vertices=vertices.view(np.uint8),
+                    index=pack_indices(mesh['index'], len(vertices)),
+                    bounds=np.array((position.min(axis=0)[:3],
+                                     position.max(axis=0)[:3]))
+                    if len(position) else None)
+    return dict(kind='scene', scene=scene)
+
+
+def compile_source(file):
+    """ bundle entry of a source file, arrays still in memory """
+    try:
+        if file.lower().endswith(MODEL_EXTENSIONS):
+            entry = compile_model(file)
+        else:
+            entry = dict(kind='texture', levels=texture_levels(file))
+    except OSError as exception:
+        print('ERROR compiling', file + ':', exception)
+        entry = None
+    return file, entry
+
+
+def store(value, writer):
+    """ copy of an entry for the table of contents, arrays given to writer """
+    if isinstance(value, np.ndarray):
+        return writer.add(value)
+    if isinstance(value, dict):
+        return {key: store(item, writer) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [store(item, writer) for item in value]
+    return value
+
+
+# -------------- incremental bundle build -------------------------------------
+def build(output, directories, jobs=None):
+    """ (re-)build bundle at output from source files in directories """
+    start = time.perf_counter()
+    previous = None
+    if os.path.exists(output):
+        try:
+            previous = PackReader(output, MAGIC)
+            if previous.contents.get('version') != VERSION:
+                previous = None
+        except ValueError:
+            previous = None
+    old = previous.contents['sources'] if previous else {}
+
+    files = scan(directories)
+    stale = [file for file in files if file not in old or
+             old[file]['stamp'] != stamp(file)]
+    print('Compiling %d of %d sources with %s workers' % (
+        len(stale), len(files), jobs or os.cpu_count()))
+
+    writer, sources = PackWriter(MAGIC), {}
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for file, entry in pool.map(compile_source, stale, chunksize=1):
+            if entry is not None:
+                print('  compiled', file)
+                sources[file] = dict(store(entry, writer), stamp=stamp(file))
+    for file in files:
+        if file not in stale:
+            sources[file] = store(resolve(old[file], previous), writer)
+    sources = {file: sources[file] for file in files if file in sources}
+
+    # write next to the previous bundle, which stays mapped until replaced
+    writer.write(output + '.tmp', dict(version=VERSION, sources=sources))
+    os.replace(output + '.tmp', output)
+    print('Wrote %s (%d sources, %.1f MB) in %.1fs' % (
+        output, len(sources), os.path.getsize(output) / 2**20,
+        time.perf_counter() - start))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directories', nargs='*', default=ASSET_DIRS,
+                        help='asset directories to scan (default: %(default)s)')
+    parser.add_argument('-o', '--output', default='assets.bundle',
+                        help='bundle file to (re-)build')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='worker processes (default: one per CPU)')
+    args = parser.parse_args()
+    build(args.output, args.directories, args.jobs)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,40 +1,103 @@
 # Python built-in modules
 import os                           # os function, i.e. checking file status
+import ctypes                       # buffer offsets for attribute pointers
 from itertools import cycle         # allows easy circular choice list
 import atexit                       # launch a function at exit
+import time                         # frame statistics timing
 
 # External, non built-in modules
 import OpenGL.GL as GL              # standard Python OpenGL wrapper
 import glfw                         # lean window system wrapper for OpenGL
 import numpy as np                  # all matrix manipulations & OpenGL args
-import assimpcy                     # 3D resource loader
 
 # our transform functions
 from transform import Trackball, identity, translate, rotate, scale
+from layout import VertexLayout, pack_vertices, pack_indices, INDEX_TYPES
+from importer import import_scene
+from resources import RESOURCES
+from bvh import SceneQuery, benchmark
+from recorder import FrameRecorder
+from startup import STARTUP
+from streaming import StreamBuffer
 
-# initialize and automatically terminate glfw on exit
-glfw.init()
-atexit.register(glfw.terminate)
+# uniform blocks bound at fixed points in every program declaring them
+UNIFORM_BLOCKS = {'Frame': 0, 'Bones': 1}
+
+
+def init_glfw():
+    """ initialize glfw on first window creation, terminate it on exit """
+    if not init_glfw.done:
+        glfw.init()
+        atexit.register(glfw.terminate)
+        init_glfw.done = True
+
+
+init_glfw.done = False
+
+
+# ------------  axis aligned bounding boxes, as (2, 3) min & max arrays ------
+def union_bounds(boxes):
+    """ smallest box containing all given boxes, None ones ignored """
+    boxes = [box for box in boxes if box is not None]
+    if not boxes:
+        return None
+    return np.array((np.min([box[0] for box in boxes], axis=0),
+                     np.max([box[1] for box in boxes], axis=0)))
+
+
+def transform_bounds(box, matrix):
+    """ axis aligned box around the 8 corners of box transformed by matrix """
+    corners = np.array([(x, y, z, 1) for x in box[:, 0] for y in box[:, 1]
+                        for z in box[:, 2]])
+    corners = corners @ np.asarray(matrix).T
+    corners = corners[:, :3] / corners[:, 3:]
+    return np.array((corners.min(axis=0), corners.max(axis=0)))
 
 
 # ------------  Node is the core drawable for hierarchical scene graphs -------
 class Node:
     """ Scene graph transform and parameter broadcast node """
-    def __init__(self, children=(), transform=identity()):
-        self.transform = transform
+    changes = 0       # count of children additions, in all scene graphs
+
+    def __init__(self, children=(), transform=None):
+        self.transform = identity() if transform is None else transform
         self.world_transform = identity()
         self.children = list(iter(children))
+        self.occlusion_test = False  # draw subtree only if its box is visible
+        self.animated = False        # transform changes from frame to frame
 
     def add(self, *drawables):
         """ Add drawables to this node, simply updating children list """
         self.children.extend(drawables)
+        Node.changes += 1
 
-    def draw(self, model=identity(), **other_uniforms):
-        """ Recursive draw, passing down updated model matrix. """
+    def draw(self, model=None, **other_uniforms):
+        """ Recursive draw, passing down updated model matrix. A 'culler'
+            passed along with uniforms decides if flagged subtrees draw. """
+        model = identity() if model is None else model
         self.world_transform = model @ self.transform
+        culler = other_uniforms.get('culler')
+        if culler is not None and self.occlusion_test:
+            culler.draw(self, **other_uniforms)
+        else:
+            self.draw_children(**other_uniforms)
+
+    def draw_children(self, **other_uniforms):
+        """ draw children, placed relative to this node's world transform """
         for child in self.children:
             child.draw(model=self.world_transform, **other_uniforms)
 
+    def local_bounds(self):
+        """ box around the subtree, in this node's coordinates """
+        return union_bounds(getattr(child, 'bounds', None)
+                            for child in self.children)
+
+    @property
+    def bounds(self):
+        """ box around the subtree, in parent node coordinates """
+        box = self.local_bounds()
+        return None if box is None else transform_bounds(box, self.transform)
+
     def key_handler(self, key):
         """ Dispatch keyboard events to children with key handler """
         for child in (c for c in self.children if hasattr(c, 'key_handler')):
@@ -61,21 +124,52 @@ class Shader:
             os._exit(1)
         return shader
 
-    def __init__(self, vertex_source, fragment_source, debug=False):
-        """ Shader can be initialized with raw strings or source file names """
+    def __init__(self, vertex_source, fragment_source, debug=False,
+                 varyings=None):
+        """ Shader can be initialized with raw strings or source file names.
+            Vertex outputs named in varyings are captured by transform
+            feedback, interleaved; fragment_source may then be None """
+        with STARTUP.phase('shader compile'):
+            self._build(vertex_source, fragment_source, debug, varyings)
+
+    def _build(self, vertex_source, fragment_source, debug, varyings):
+        """ compile & link program, then introspect its uniforms """
+        self.glid = None
+        self.sources = (vertex_source, fragment_source)
+        self.blocks = set()           # names of the shared blocks it declares
         vert = self._compile_shader(vertex_source, GL.GL_VERTEX_SHADER)
-        frag = self._compile_shader(fragment_source, GL.GL_FRAGMENT_SHADER)
-        if vert and frag:
+        frag = self._compile_shader(fragment_source, GL.GL_FRAGMENT_SHADER) \
+            if fragment_source is not None else None
+        if vert and (frag or varyings):
             self.glid = GL.glCreateProgram()  # pylint: disable=E1111
             GL.glAttachShader(self.glid, vert)
-            GL.glAttachShader(self.glid, frag)
+            if frag:
+                GL.glAttachShader(self.glid, frag)
+            if varyings:
+                names = (ctypes.c_char_p * len(varyings))(
+                    *(name.encode() for name in varyings))
+                names = ctypes.cast(names, ctypes.POINTER(
+                    ctypes.POINTER(ctypes.c_char)))
+                GL.glTransformFeedbackVaryings(self.glid, len(varyings), names,
+                                               GL.GL_INTERLEAVED_ATTRIBS)
             GL.glLinkProgram(self.glid)
             GL.glDeleteShader(vert)
-            GL.glDeleteShader(frag)
+            if frag:
+                GL.glDeleteShader(frag)
             status = GL.glGetProgramiv(self.glid, GL.GL_LINK_STATUS)
             if not status:
                 print(GL.glGetProgramInfoLog(self.glid).decode('ascii'))
                 os._exit(1)
+            source = vertex_source if os.path.exists(vertex_source) else None
+            RESOURCES.track(self, 0, lambda glid=self.glid:
+                            GL.glDeleteProgram(glid), 'program', source, False)
+
+            # frame globals & bone palettes come from streamed buffer ranges
+            for name, binding in UNIFORM_BLOCKS.items():
+                block = GL.glGetUniformBlockIndex(self.glid, name)
+                if block != GL.GL_INVALID_INDEX:
+                    GL.glUniformBlockBinding(self.glid, block, binding)
+                    self.blocks.add(name)
 
         # get location, size & type for uniform variables using GL introspection
         self.uniforms = {}
@@ -84,7 +178,10 @@ class Shader:
         for var in range(GL.glGetProgramiv(self.glid, GL.GL_ACTIVE_UNIFORMS)):
             name, size, type_ = GL.glGetActiveUniform(self.glid, var)
             name = name.decode().split('[')[0]   # remove array characterization
-            args = [GL.glGetUniformLocation(self.glid, name), size]
+            location = GL.glGetUniformLocation(self.glid, name)
+            if location < 0:       # uniform block member, set by its buffer
+                continue
+            args = [location, size]
             # add transpose=True as argument for matrix types
             if type_ in {GL.GL_FLOAT_MAT2, GL.GL_FLOAT_MAT3, GL.GL_FLOAT_MAT4}:
                 args.append(True)
@@ -99,9 +196,6 @@ class Shader:
             set_uniform, args = self.uniforms[name]
             set_uniform(*args, uniforms[name])
 
-    def __del__(self):
-        GL.glDeleteProgram(self.glid)  # object dies => destroy GL object
-
     GL_SETTERS = {
         GL.GL_UNSIGNED_INT:      GL.glUniform1uiv,
         GL.GL_UNSIGNED_INT_VEC2: GL.glUniform2uiv,
@@ -113,6 +207,7 @@ class Shader:
         GL.GL_INT_VEC3:   GL.glUniform3iv, GL.GL_INT_VEC4:     GL.glUniform4iv,
         GL.GL_SAMPLER_1D: GL.glUniform1iv, GL.GL_SAMPLER_2D:   GL.glUniform1iv,
         GL.GL_SAMPLER_3D: GL.glUniform1iv, GL.GL_SAMPLER_CUBE: GL.glUniform1iv,
+        GL.GL_SAMPLER_2D_ARRAY: GL.glUniform1iv,
         GL.GL_FLOAT_MAT2: GL.glUniformMatrix2fv,
         GL.GL_FLOAT_MAT3: GL.glUniformMatrix3fv,
         GL.GL_FLOAT_MAT4: GL.glUniformMatrix4fv,
@@ -120,72 +215,142 @@ class Shader:
 
 
 class VertexArray:
-    """ helper class to create and self destroy OpenGL vertex array objects."""
-    def __init__(self, shader, attributes, index=None, usage=GL.GL_STATIC_DRAW):
+    """ helper class to create OpenGL vertex array objects, whose GPU buffers
+        can be evicted and restored on demand from their CPU side copy """
+    def __init__(self, shader, attributes, index=None, usage=GL.GL_STATIC_DRAW,
+                 compact=True, source=None):
         """ Vertex array from attributes and optional index array. Vertex
-            Attributes should be list of arrays with one row per vertex. """
+            Attributes should be list of arrays with one row per vertex.
+            Attributes known to shader are interleaved in a single buffer,
+            using compact storage types when precision allows. """
+
+        # only keep attributes used by the shader
+        attributes = {name: data for name, data in attributes.items()
+                      if GL.glGetAttribLocation(shader.glid, name) >= 0}
+        layout, vertices = pack_vertices(attributes, compact)
+        bounds = None
+        if 'position' in attributes and len(vertices):
+            position = np.asarray(attributes['position'], np.float32)
+            bounds = np.array((position.min(axis=0)[:3],
+                               position.max(axis=0)[:3]))
+        if index is not None:
+            index = pack_indices(index, len(vertices))
+        self.setup(shader, layout, vertices, index, bounds, usage, source)
+
+    @classmethod
+    def from_packed(cls, shader, layout, vertices, index=None, bounds=None,
+                    usage=GL.GL_STATIC_DRAW, source=None):
+        """ Vertex array from already interleaved vertices and typed index,
+            as stored in files: arrays are uploaded as is, without copy. """
+        vertex_array = cls.__new__(cls)
+        vertex_array.setup(shader, layout, vertices, index, bounds, usage,
+                           source)
+        return vertex_array
+
+    def setup(self, shader, layout, vertices, index, bounds, usage, source):
+        """ keep packed arrays and their shader locations, upload them """
+        self.locations = {entry.name: GL.glGetAttribLocation(shader.glid,
+                                                             entry.name)
+                          for entry in layout.entries}
+        self.layout, self.vertices, self.index = layout, vertices, index
+        self.bounds, self.usage, self.source = bounds, usage, source
+
+        # draw command for direct or indexed arrays
+        self.draw_command = GL.glDrawArrays
+        self.arguments = (0, len(self.vertices))
+        if index is not None:
+            self.draw_command = GL.glDrawElements
+            self.arguments = (self.index.size, INDEX_TYPES[self.index.dtype],
+                              None)
+        self.glid = None
+        self.upload()
 
+    def upload(self):
+        """ create vertex array object & buffers from the CPU side arrays """
         # create vertex array object, bind it
         self.glid = GL.glGenVertexArrays(1)
         GL.glBindVertexArray(self.glid)
-        self.buffers = []  # we will store buffers in a list
-        nb_primitives, size = 0, 0
-
-        # load buffer per vertex attribute (in list with index = shader layout)
-        for name, data in attributes.items():
-            loc = GL.glGetAttribLocation(shader.glid, name)
-            if loc >= 0:
-                # bind a new vbo, upload its data to GPU, declare size and type
-                self.buffers.append(GL.glGenBuffers(1))
-                data = np.array(data, np.float32, copy=False)  # ensure format
-                nb_primitives, size = data.shape
-                GL.glEnableVertexAttribArray(loc)
-                GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.buffers[-1])
-                GL.glBufferData(GL.GL_ARRAY_BUFFER, data, usage)
-                GL.glVertexAttribPointer(loc, size, GL.GL_FLOAT, False, 0, None)
-
-        # optionally create and upload an index buffer for this object
-        self.draw_command = GL.glDrawArrays
-        self.arguments = (0, nb_primitives)
-        if index is not None:
+        self.buffers = [GL.glGenBuffers(1)]  # we will store buffers in a list
+
+        # upload interleaved vertices, declare each attribute's type & offset
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.buffers[-1])
+        GL.glBufferData(GL.GL_ARRAY_BUFFER, self.vertices.view(np.uint8),
+                        self.usage)
+        for entry in self.layout.entries:
+            loc, fmt = self.locations[entry.name], entry.format
+            if loc < 0:
+                continue
+            GL.glEnableVertexAttribArray(loc)
+            GL.glVertexAttribPointer(loc, entry.size, fmt.gl_type,
+                                     fmt.normalized, self.layout.stride,
+                                     ctypes.c_void_p(entry.offset))
+
+        nbytes = self.vertices.nbytes
+        if self.index is not None:
             self.buffers += [GL.glGenBuffers(1)]
-            index_buffer = np.array(index, np.int32, copy=False)  # good format
             GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, self.buffers[-1])
-            GL.glBufferData(GL.GL_ELEMENT_ARRAY_BUFFER, index_buffer, usage)
-            self.draw_command = GL.glDrawElements
-            self.arguments = (index_buffer.size, GL.GL_UNSIGNED_INT, None)
+            GL.glBufferData(GL.GL_ELEMENT_ARRAY_BUFFER, self.index, self.usage)
+            nbytes += self.index.nbytes
+
+        def delete(glid=self.glid, buffers=self.buffers):
+            GL.glDeleteVertexArrays(1, [glid])
+            GL.glDeleteBuffers(len(buffers), buffers)
+        RESOURCES.track(self, nbytes, delete, 'buffer', self.source)
+
+    def evict(self):
+        """ free GPU side objects, CPU arrays are kept to restore them """
+        GL.glDeleteVertexArrays(1, [self.glid])
+        GL.glDeleteBuffers(len(self.buffers), self.buffers)
+        self.glid, self.buffers = None, []
+        RESOURCES.evicted(self)
 
     def execute(self, primitive):
         """ draw a vertex array, either as direct array or indexed array """
+        if self.glid is None:
+            self.upload()
+        RESOURCES.touch(self)
         GL.glBindVertexArray(self.glid)
         self.draw_command(primitive, *self.arguments)
 
-    def __del__(self):  # object dies => kill GL array and buffers from GPU
-        GL.glDeleteVertexArrays(1, [self.glid])
-        GL.glDeleteBuffers(len(self.buffers), self.buffers)
-
 
 # ------------  Mesh is the core drawable -------------------------------------
 class Mesh:
     """ Basic mesh class, attributes and uniforms passed as arguments """
-    def __init__(self, shader, attributes, uniforms=None, index=None):
+    def __init__(self, shader, attributes, uniforms=None, index=None,
+                 source=None):
         self.shader = shader
         self.uniforms = uniforms or dict()
-        self.vertex_array = VertexArray(shader, attributes, index)
-
-    def draw(self, primitives=GL.GL_TRIANGLES, **uniforms):
+        self.vertex_array = VertexArray(shader, attributes, index,
+                                        source=source)
+
+    @classmethod
+    def from_vertex_array(cls, shader, vertex_array, uniforms=None):
+        """ mesh drawing an existing vertex array """
+        mesh = cls.__new__(cls)
+        mesh.shader, mesh.uniforms = shader, uniforms or dict()
+        mesh.vertex_array = vertex_array
+        return mesh
+
+    @property
+    def bounds(self):
+        """ box around the mesh vertices, in model coordinates """
+        return self.vertex_array.bounds
+
+    def draw(self, primitives=GL.GL_TRIANGLES, batcher=None, **uniforms):
+        if batcher is not None and batcher.submit(self, primitives, uniforms):
+            return
         GL.glUseProgram(self.shader.glid)
         self.shader.set_uniforms({**self.uniforms, **uniforms})
         self.vertex_array.execute(primitives)
 
 # -------------- 3D resource loader -------------------------------------------
-MAX_BONES = 128
-
-# optionally load texture module
+# optionally load texture module, textures come from bundles when compiled
 try:
     from texture import Texture, Textured
+    from bundle import find, texture as make_texture
 except ImportError:
-    Texture, Textured = None, None
+    Texture, Textured, make_texture = None, None, None
+    find = lambda file, kind: None
 
 # optionally load animation module
 try:
@@ -194,152 +359,138 @@ except ImportError:
     KeyFrameControlNode, Skinned = None, None
 
 
-def load(file, shader, tex_file=None, **params):
-    """load resources from file using assimp, return node hierarchy """
-    try:
-        pp = assimpcy.aiPostProcessSteps
-        flags = pp.aiProcess_JoinIdenticalVertices | pp.aiProcess_FlipUVs
-        flags |= pp.aiProcess_OptimizeMeshes | pp.aiProcess_Triangulate
-        flags |= pp.aiProcess_GenSmoothNormals
-        flags |= pp.aiProcess_ImproveCacheLocality
-        flags |= pp.aiProcess_RemoveRedundantMaterials
-        scene = assimpcy.aiImportFile(file, flags)
-    except assimpcy.all.AssimpError as exception:
-        print('ERROR loading', file + ': ', exception.args[0].decode())
-        return []
-
-    # ----- Pre-load textures; embedded textures not supported at the moment
-    path = os.path.dirname(file) if os.path.dirname(file) != '' else './'
-    for mat in scene.mMaterials:
-        if tex_file:
-            tfile = tex_file
-        elif 'TEXTURE_BASE' in mat.properties:  # texture token
-            name = mat.properties['TEXTURE_BASE'].split('/')[-1].split('\\')[-1]
-            # search texture in file's whole subdir since path often screwed up
-            paths = os.walk(path, followlinks=True)
-            tfile = next((os.path.join(d, f) for d, _, n in paths for f in n
-                     if name.startswith(f) or f.startswith(name)), None)
-            #assert tfile, 'Cannot find texture %s in %s subtree' % (name, path)
-        else:
-            tfile = None
+def load(file, shader, tex_file=None, atlas=None, **params):
+    """load resources from file using assimp, return node hierarchy. Files
+    compiled in a mounted bundle (or given as 'bundle:file') are mapped from
+    it instead, without any import work. With a TextureAtlas, meshes sample
+    a layer of its texture arrays (diffuse_array, diffuse_layer uniforms)
+    instead of binding their own diffuse_map texture. """
+    found = find(file, 'scene')
+    if found is not None:
+        bundle, member = found
+        scene = bundle.scene(member)
+    else:
+        scene = import_scene(file)
+        if scene is None:
+            return []
+
+    # ----- textures, one per file; embedded textures not supported
+    textures = {}
+    for mesh in scene['meshes']:
+        tfile = tex_file or mesh['texture']
+        if not tfile:
             print("Missing texture")
-        if Texture is not None and tfile:
-            mat.properties['diffuse_map'] = Texture(tex_file=tfile)
-
-    # ----- load animations
-    def conv(assimp_keys, ticks_per_second):
-        """ Conversion from assimp key struct to our dict representation """
-        return {key.mTime / ticks_per_second: key.mValue for key in assimp_keys}
-
-    # load first animation in scene file (could be a loop over all animations)
-    transform_keyframes = {}
-    if scene.HasAnimations:
-        anim = scene.mAnimations[0]
-        for channel in anim.mChannels:
-            # for each animation bone, store TRS dict with {times: transforms}
-            transform_keyframes[channel.mNodeName] = (
-                conv(channel.mPositionKeys, anim.mTicksPerSecond),
-                conv(channel.mRotationKeys, anim.mTicksPerSecond),
-                conv(channel.mScalingKeys, anim.mTicksPerSecond)
-            )
-
-    # ---- prepare scene graph nodes
-    nodes = {}                                       # nodes name -> node lookup
-    nodes_per_mesh_id = [[] for _ in scene.mMeshes]  # nodes holding a mesh_id
-
-    def make_nodes(assimp_node):
-        """ Recursively builds nodes for our graph, matching assimp nodes """
-        keyframes = transform_keyframes.get(assimp_node.mName, None)
+        elif atlas is not None:
+            textures[tfile] = atlas.layer(tfile)
+        elif make_texture is not None and tfile not in textures:
+            textures[tfile] = make_texture(tfile)
+
+    # ---- prepare scene graph nodes, keyframed ones drive their animation
+    nodes = {}                                      # nodes name -> node lookup
+    graph = []                                      # our node per scene node
+    for record in scene['nodes']:
+        transform = np.array(record['transform'], np.float32)
+        keyframes = scene['keyframes'].get(record['name'], None)
         if keyframes and KeyFrameControlNode:
-            node = KeyFrameControlNode(*keyframes, assimp_node.mTransformation)
+            node = KeyFrameControlNode(*(dict(zip(times, values))
+                                         for times, values in keyframes),
+                                       transform=transform)
         else:
-            node = Node(transform=assimp_node.mTransformation)
-        nodes[assimp_node.mName] = node
-        for mesh_index in assimp_node.mMeshes:
-            nodes_per_mesh_id[mesh_index] += [node]
-        node.add(*(make_nodes(child) for child in assimp_node.mChildren))
-        return node
-
-    root_node = make_nodes(scene.mRootNode)
+            node = Node(transform=transform)
+        nodes[record['name']] = node
+        graph.append(node)
 
     # ---- create optionally decorated (Skinned, Textured) Mesh objects
-    for mesh_id, mesh in enumerate(scene.mMeshes):
-        # retrieve materials associated to this mesh
-        mat = scene.mMaterials[mesh.mMaterialIndex].properties
-
+    meshes = []
+    for mesh in scene['meshes']:
         # initialize mesh with args from file, merge and override with params
-        index = mesh.mFaces
-        uniforms = dict(
-            k_d=mat.get('COLOR_DIFFUSE', (1, 1, 1)),
-            k_s=mat.get('COLOR_SPECULAR', (1, 1, 1)),
-            k_a=mat.get('COLOR_AMBIENT', (0, 0, 0)),
-            s=mat.get('SHININESS', 16.),
-        )
-        attributes = dict(
-            position=mesh.mVertices,
-            normal=mesh.mNormals,
-        )
-
-        # ---- optionally add texture coordinates attribute if present
-        if mesh.HasTextureCoords[0]:
-            attributes.update(tex_coord=mesh.mTextureCoords[0])
-
-        # --- optionally add vertex colors as attributes if present
-        if mesh.HasVertexColors[0]:
-            attributes.update(color=mesh.mColors[0])
-
-        # ---- compute and add optional skinning vertex attributes
-        if mesh.HasBones:
-            # skinned mesh: weights given per bone => convert per vertex for GPU
-            # first, populate an array with MAX_BONES entries per vertex
-            vbone = np.array([[(0, 0)] * MAX_BONES] * mesh.mNumVertices,
-                             dtype=[('weight', 'f4'), ('id', 'u4')])
-            for bone_id, bone in enumerate(mesh.mBones[:MAX_BONES]):
-                for entry in bone.mWeights:  # need weight,id pairs for sorting
-                    vbone[entry.mVertexId][bone_id] = (entry.mWeight, bone_id)
-
-            vbone.sort(order='weight')   # sort rows, high weights last
-            vbone = vbone[:, -4:]        # limit bone size, keep highest 4
-
-            attributes.update(bone_ids=vbone['id'],
-                              bone_weights=vbone['weight'])
-
-        new_mesh = Mesh(shader=shader, attributes=attributes,
-                        uniforms={**uniforms, **params}, index=index)
-
-        if Textured is not None and 'diffuse_map' in mat:
-            new_mesh = Textured(new_mesh, diffuse_map=mat['diffuse_map'])
-        if Skinned and mesh.HasBones:
+        uniforms = {**mesh['uniforms'], **params}
+        if 'layout' in mesh:      # compiled mesh: upload its packed arrays
+            layout = VertexLayout.from_description(mesh['layout'])
+            vertex_array = VertexArray.from_packed(
+                shader, layout, mesh['vertices'].view(layout.dtype),
+                mesh['index'], mesh['bounds'], source=file)
+            new_mesh = Mesh.from_vertex_array(shader, vertex_array, uniforms)
+        else:
+            new_mesh = Mesh(shader=shader, attributes=mesh['attributes'],
+                            uniforms=uniforms, index=mesh['index'],
+                            source=file)
+
+        tfile = tex_file or mesh['texture']
+        if atlas is not None and tfile in textures:
+            new_mesh = atlas.decorate(new_mesh, tfile)
+        elif tfile in textures:
+            new_mesh = Textured(new_mesh, diffuse_map=textures[tfile])
+        if Skinned and mesh['bones']:
             # make bone lookup array & offset matrix, indexed by bone index (id)
-            bone_nodes = [nodes[bone.mName] for bone in mesh.mBones]
-            bone_offsets = [bone.mOffsetMatrix for bone in mesh.mBones]
-            new_mesh = Skinned(new_mesh, bone_nodes, bone_offsets)
-        for node_to_populate in nodes_per_mesh_id[mesh_id]:
-            node_to_populate.add(new_mesh)
+            bone_nodes = [nodes[bone] for bone in mesh['bones']]
+            new_mesh = Skinned(new_mesh, bone_nodes, mesh['offsets'])
+        meshes.append(new_mesh)
+
+    for node, record in zip(graph, scene['nodes']):
+        node.add(*(graph[child] for child in record['children']))
+        node.add(*(meshes[mesh_id] for mesh_id in record['meshes']))
 
-    nb_triangles = sum((mesh.mNumFaces for mesh in scene.mMeshes))
     print('Loaded', file, '\t(%d meshes, %d faces, %d nodes, %d animations)' %
-          (scene.mNumMeshes, nb_triangles, len(nodes), scene.mNumAnimations))
-    return [root_node]
+          tuple(scene['stats']))
+    return [graph[0]]
+
+
+# ------------  per frame globals, shared by all programs ---------------------
+class FrameUniforms:
+    """ std140 block of data constant over a frame, written once per frame
+        to a uniform stream buffer, whose range is bound to every program
+        declaring the block:
+
+        layout(std140, row_major) uniform Frame {
+            mat4 view, projection;
+            vec3 w_camera_position;
+            float time;
+            vec3 light_dir;
+        };
+    """
+    BLOCK = 'Frame'
+    BINDING = UNIFORM_BLOCKS[BLOCK]
+    DTYPE = np.dtype(dict(
+        names=['view', 'projection', 'w_camera_position', 'time', 'light_dir'],
+        formats=[(np.float32, (4, 4)), (np.float32, (4, 4)),
+                 (np.float32, 3), np.float32, (np.float32, 3)],
+        offsets=[0, 64, 128, 140, 144], itemsize=160))
+
+    def __init__(self, stream):
+        self.data = np.zeros(1, self.DTYPE)
+        self.stream = stream
+
+    def update(self, **values):
+        """ set given block members, write the whole block & bind it; first
+            write of the frame, it always fits in the stream's region """
+        for name, value in values.items():
+            self.data[name] = value
+        offset = self.stream.write(self.data)
+        self.stream.bind_range(self.BINDING, offset, self.data.nbytes)
 
 
 # ------------  Viewer class & window management ------------------------------
 class Viewer(Node):
     """ GLFW viewer window, with classic initialization & graphics loop """
 
-    def __init__(self, width=640, height=480):
+    def __init__(self, width=640, height=480, vram_budget=None):
         super().__init__()
+        RESOURCES.budget = vram_budget  # in bytes, None for no GPU mem limit
 
-        # version hints: create GL window with >= OpenGL 3.3 and core profile
-        glfw.window_hint(glfw.CONTEXT_VERSION_MAJOR, 3)
-        glfw.window_hint(glfw.CONTEXT_VERSION_MINOR, 3)
-        glfw.window_hint(glfw.OPENGL_FORWARD_COMPAT, GL.GL_TRUE)
-        glfw.window_hint(glfw.OPENGL_PROFILE, glfw.OPENGL_CORE_PROFILE)
-        glfw.window_hint(glfw.RESIZABLE, True)
-        self.win = glfw.create_window(width, height, 'Viewer', None, None)
+        with STARTUP.phase('context'):
+            init_glfw()
 
-        # make win's OpenGL context current; no OpenGL calls can happen before
-        glfw.make_context_current(self.win)
+            # version hints: create GL window with >= OpenGL 3.3 & core profile
+            glfw.window_hint(glfw.CONTEXT_VERSION_MAJOR, 3)
+            glfw.window_hint(glfw.CONTEXT_VERSION_MINOR, 3)
+            glfw.window_hint(glfw.OPENGL_FORWARD_COMPAT, GL.GL_TRUE)
+            glfw.window_hint(glfw.OPENGL_PROFILE, glfw.OPENGL_CORE_PROFILE)
+            glfw.window_hint(glfw.RESIZABLE, True)
+            self.win = glfw.create_window(width, height, 'Viewer', None, None)
+
+            # make win's OpenGL context current; no OpenGL calls before that
+            glfw.make_context_current(self.win)
 
         # initialize trackball
         self.trackball = Trackball()
@@ -349,6 +500,7 @@ class Viewer(Node):
         glfw.set_key_callback(self.win, self.on_key)
         glfw.set_cursor_pos_callback(self.win, self.on_mouse_move)
         glfw.set_scroll_callback(self.win, self.on_scroll)
+        glfw.set_mouse_button_callback(self.win, self.on_mouse_button)
         glfw.set_window_size_callback(self.win, self.on_size)
 
         # useful message to check OpenGL renderer characteristics
@@ -364,29 +516,175 @@ class Viewer(Node):
         # cyclic iterator to easily toggle polygon rendering modes
         self.fill_modes = cycle([GL.GL_LINE, GL.GL_POINT, GL.GL_FILL])
 
+        # optional background drawable, rendered after all opaque geometry
+        self.skybox = None
+
+        # optional occlusion culler, deciding if flagged subtrees are drawn
+        self.culler = None
+
+        # optional dynamic resolution, scene rendered offscreen then upscaled
+        self.resolution = None
+
+        # frame recorder while recording, frames read back a few frames late
+        self.recorder = None
+        self.record_encoding = 'png'
+
+        # optional multi draw indirect path, taking meshes it can batch
+        self.batcher = None
+
+        # spatial index for scene queries, built on first query & rebuilt
+        # on the next one once nodes were added, e.g. streamed in
+        self.query, self.query_changes = None, None
+
+        # per frame uniform data, frame globals & bone palettes, written to
+        # a ring of regions while the GPU reads the previous frames' ones
+        self.stream = StreamBuffer(GL.GL_UNIFORM_BUFFER, 1 << 20)
+
+        # camera, light & time shared by all programs, set once per frame
+        self.frame = FrameUniforms(self.stream)
+        self.light_dir = (0, -0.707, 0.707)
+
+        # per frame statistics, shown in window title about every second
+        self.stats = {}
+        self.stats_time, self.stats_frames = time.perf_counter(), 0
+
     def run(self):
         """ Main render loop for this OpenGL window """
+        STARTUP.begin('first frame')
         while not glfw.window_should_close(self.win):
+            # render to offscreen framebuffer at adaptive scale, if enabled
+            if self.resolution is not None:
+                self.resolution.begin(*glfw.get_framebuffer_size(self.win))
+
             # clear draw buffer and depth buffer (<-TP2)
             GL.glClear(GL.GL_COLOR_BUFFER_BIT | GL.GL_DEPTH_BUFFER_BIT)
 
             win_size = glfw.get_window_size(self.win)
 
-            # draw our scene objects
-            cam_pos = np.linalg.inv(self.trackball.view_matrix())[:, 3]
-            self.draw(view=self.trackball.view_matrix(),
-                      projection=self.trackball.projection_matrix(win_size),
-                      model=identity(),
-                      w_camera_position=cam_pos)
+            # frame globals go to the shared uniform buffer; the camera & time
+            # are still passed along for CPU side culling, level of detail &
+            # keyframes, and for programs not using the Frame block
+            view = self.trackball.view_matrix()
+            projection = self.trackball.projection_matrix(win_size)
+            cam_pos = np.linalg.inv(view)[:, 3]
+            now = glfw.get_time()
+            self.stream.begin_frame()
+            self.frame.update(view=view, projection=projection,
+                              w_camera_position=cam_pos[:3],
+                              time=now, light_dir=self.light_dir)
+
+            # draw our scene objects, then meshes queued by the batcher, then
+            # sky where nothing was drawn, then blended effects queued by the
+            # scene, such as particle systems
+            if self.culler is not None:
+                self.culler.begin_frame()
+            if self.batcher is not None:
+                self.batcher.begin_frame()
+            effects = []
+            self.draw(view=view, projection=projection, model=identity(),
+                      w_camera_position=cam_pos, culler=self.culler,
+                      effects=effects, batcher=self.batcher,
+                      stream=self.stream, ground=self.ground_height,
+                      time=now)
+            if self.batcher is not None:
+                self.batcher.end_frame()
+            if self.skybox is not None:
+                self.skybox.draw(view=view, projection=projection)
+            for effect in effects:
+                effect.render(view=view, projection=projection,
+                              w_camera_position=cam_pos)
+            self.stream.end_frame()
+            if self.resolution is not None:
+                self.resolution.end()
+            if self.recorder is not None:
+                self.recorder.capture(*glfw.get_framebuffer_size(self.win))
 
             # flush render commands, and swap draw buffers
             glfw.swap_buffers(self.win)
 
+            # free and evict GPU resources now that the frame is submitted
+            RESOURCES.collect()
+            self.update_stats()
+
+            # first presented frame ends startup trace
+            STARTUP.finish()
+
             # Poll for and process events
             glfw.poll_events()
 
+        # write frames still in flight, then release all GPU objects while
+        # the OpenGL context is still alive
+        if self.recorder is not None:
+            self.recorder.stop()
+        RESOURCES.release_all()
+
+    def toggle_recording(self, directory=None):
+        """ start recording frames to a new directory, or stop recording """
+        if self.recorder is not None:
+            self.recorder.stop()
+            for key in self.recorder.stats:
+                self.stats.pop(key, None)
+            self.recorder = None
+            return
+        directory = directory or os.path.join(
+            'recordings', time.strftime('%Y%m%d-%H%M%S'))
+        self.recorder = FrameRecorder(directory, encoding=self.record_encoding)
+        print('Recording frames to', directory)
+
+    # ------------ scene queries, against last drawn node transforms --------
+    def scene_query(self):
+        """ spatial index of scene meshes, up to date with added nodes """
+        if self.query is None or self.query_changes != Node.changes:
+            self.query, self.query_changes = SceneQuery(self), Node.changes
+        return self.query
+
+    def raycast(self, origins, directions, exclude=None):
+        """ closest scene hits of a batch of world space rays """
+        return self.scene_query().raycast(origins, directions, exclude)
+
+    def overlap(self, centers, radii):
+        """ (sphere, instance, triangle) contacts of a batch of spheres """
+        return self.scene_query().overlap(centers, radii)
+
+    def ground_height(self, points, exclude=None):
+        """ height of the first surface below each (x, z) world point """
+        return self.scene_query().ground_height(points, exclude=exclude)
+
+    def pick(self, x, y):
+        """ scene hit under window position (x, y), origin bottom left """
+        width, height = glfw.get_window_size(self.win)
+        inverse = np.linalg.inv(
+            self.trackball.projection_matrix((width, height)) @
+            self.trackball.view_matrix())
+        ndc = (2 * x / width - 1, 2 * y / height - 1)
+        near, far = (inverse @ (*ndc, depth, 1) for depth in (-1, 1))
+        near, far = near[:3] / near[3], far[:3] / far[3]
+        return self.raycast(near, far - near)
+
+    def update_stats(self):
+        """ gather per frame statistics, refresh window title every second """
+        if self.culler is not None:
+            self.stats.update(self.culler.stats)
+        if self.resolution is not None and self.resolution.enabled:
+            self.stats.update(self.resolution.stats)
+        if self.recorder is not None:
+            self.stats.update(self.recorder.stats)
+        if self.batcher is not None and self.batcher.enabled:
+            self.stats.update(self.batcher.stats)
+        self.stats.update(self.stream.stats)
+        self.stats_frames += 1
+        elapsed = time.perf_counter() - self.stats_time
+        if elapsed >= 1:
+            self.stats['fps'] = self.stats_frames / elapsed
+            self.stats_time, self.stats_frames = time.perf_counter(), 0
+            glfw.set_window_title(self.win, 'Viewer - ' + ', '.join(
+                '%s %.4g' % item for item in self.stats.items()))
+
     def on_key(self, _win, key, _scancode, action, _mods):
-        """ 'Q' or 'Escape' quits """
+        """ 'Q' or 'Escape' quits, 'M' prints GPU memory report,
+            'O' toggles occlusion culling, 'B' benchmarks scene queries,
+            'R' toggles dynamic resolution, 'V' starts or stops recording,
+            'I' toggles multi draw indirect submission """
         if action == glfw.PRESS or action == glfw.REPEAT:
             if key == glfw.KEY_ESCAPE or key == glfw.KEY_Q:
                 glfw.set_window_should_close(self.win, True)
@@ -394,6 +692,20 @@ class Viewer(Node):
                 GL.glPolygonMode(GL.GL_FRONT_AND_BACK, next(self.fill_modes))
             if key == glfw.KEY_SPACE:
                 glfw.set_time(0.0)
+            if key == glfw.KEY_M:
+                print(RESOURCES.report())
+            if key == glfw.KEY_O and self.culler is not None:
+                self.culler.enabled = not self.culler.enabled
+            if key == glfw.KEY_B:
+                print(benchmark(self.scene_query()))
+            if key == glfw.KEY_R and self.resolution is not None:
+                self.resolution.enabled = not self.resolution.enabled
+            if key == glfw.KEY_V and action == glfw.PRESS:
+                self.toggle_recording()
+            if key == glfw.KEY_I and self.batcher is not None:
+                self.batcher.enabled = not self.batcher.enabled
+                for name in self.batcher.stats:
+                    self.stats.pop(name, None)
 
             # call Node.key_handler which calls key_handlers for all drawables
             self.key_handler(key)
@@ -407,6 +719,14 @@ class Viewer(Node):
         if glfw.get_mouse_button(win, glfw.MOUSE_BUTTON_RIGHT):
             self.trackball.pan(old, self.mouse)
 
+    def on_mouse_button(self, _win, button, action, _mods):
+        """ Middle click picks and reports the scene mesh under the cursor """
+        if button == glfw.MOUSE_BUTTON_MIDDLE and action == glfw.PRESS:
+            hits = self.pick(*self.mouse)
+            if hits.instance[0] >= 0:
+                print('Picked', self.scene_query().label(hits.instance[0]),
+                      'at', hits.position[0])
+
     def on_scroll(self, win, _deltax, deltay):
         """ Scroll controls the camera distance to trackball center """
         self.trackball.zoom(deltay, glfw.get_window_size(win)[1])
@@ -417,7 +737,7 @@ class Viewer(Node):
 
 
 class Mannequin(Node):
-    def __init__(self, shader, light_dir, children=(), transform=identity()):
+    def __init__(self, shader, light_dir, children=(), transform=None):
 
         super().__init__(children, transform)
         base_shape = Node(transform=scale(1, 15, 1))
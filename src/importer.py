@@ -0,0 +1,148 @@
+# Python built-in modules
+import os                           # os function, i.e. checking file status
+
+# External, non built-in modules
+import numpy as np                  # all matrix manipulations & OpenGL args
+
+from motion import reduce_track, TOLERANCES
+
+# assimpcy & PIL are imported on first use: loading a compiled bundle needs
+# neither, and both take a noticeable part of startup time
+
+MAX_BONES = 128
+TEXTURE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tga', '.bmp')
+
+
+# -------------- GL free asset import to plain arrays -------------------------
+# Scenes are imported to a plain description: lists, dicts and numpy arrays
+# only, which core.load() turns into nodes and meshes, and which the asset
+# compiler can produce in worker processes and store in bundles.
+def name_of(name):
+    """ assimp names may come as bytes, we always use str """
+    return name.decode() if isinstance(name, bytes) else str(name)
+
+
+def find_texture(path, name):
+    """ texture file matching name in path's whole subdir, since material
+        paths are often screwed up, None if not found """
+    name = name.split('/')[-1].split('\\')[-1]
+    paths = os.walk(path, followlinks=True)
+    return next((os.path.join(d, f) for d, _, n in paths for f in n
+                 if name.startswith(f) or f.startswith(name)), None)
+
+
+def bone_attributes(mesh):
+    """ 4 most influential bone ids & weights per vertex of a skinned mesh """
+    weights = np.zeros((mesh.mNumVertices, MAX_BONES), np.float32)
+    for bone_id, bone in enumerate(mesh.mBones[:MAX_BONES]):
+        entries = [(entry.mVertexId, entry.mWeight) for entry in bone.mWeights]
+        if entries:
+            vertex_ids, bone_weights = zip(*entries)
+            weights[list(vertex_ids), bone_id] = bone_weights
+    ids = np.argsort(weights, axis=1, kind='stable')[:, -4:]  # high ones last
+    weights = np.take_along_axis(weights, ids, axis=1)
+    ids[weights == 0] = 0
+    return ids.astype(np.uint32), weights
+
+
+def import_scene(file):
+    """ import file with assimp to a plain scene description, None if failed:
+        nodes (index 0 is root), keyframes by node name, meshes & stats """
+    import assimpcy                 # 3D resource loader
+    try:
+        pp = assimpcy.aiPostProcessSteps
+        flags = pp.aiProcess_JoinIdenticalVertices | pp.aiProcess_FlipUVs
+        flags |= pp.aiProcess_OptimizeMeshes | pp.aiProcess_Triangulate
+        flags |= pp.aiProcess_GenSmoothNormals
+        flags |= pp.aiProcess_ImproveCacheLocality
+        flags |= pp.aiProcess_RemoveRedundantMaterials
+        scene = assimpcy.aiImportFile(file, flags)
+    except assimpcy.all.AssimpError as exception:
+        print('ERROR loading', file + ': ', exception.args[0].decode())
+        return None
+
+    # ----- texture file of each material; embedded textures not supported
+    path = os.path.dirname(file) if os.path.dirname(file) != '' else './'
+    textures = [find_texture(path, mat.properties['TEXTURE_BASE'])
+                if 'TEXTURE_BASE' in mat.properties else None
+                for mat in scene.mMaterials]
+
+    # ----- first animation in scene file, as (times, values) per TRS track,
+    # without the keys that interpolating their neighbours reproduces
+    def track(assimp_keys, ticks_per_second, tolerance, angular):
+        return reduce_track(
+            np.array([key.mTime / ticks_per_second for key in assimp_keys]),
+            np.array([key.mValue for key in assimp_keys], np.float32),
+            tolerance, angular)
+
+    keyframes = {}
+    if scene.HasAnimations:
+        anim = scene.mAnimations[0]
+        for channel in anim.mChannels:
+            keyframes[name_of(channel.mNodeName)] = [
+                track(keys, anim.mTicksPerSecond, tolerance, angular)
+                for keys, tolerance, angular in zip(
+                    (channel.mPositionKeys, channel.mRotationKeys,
+                     channel.mScalingKeys), TOLERANCES, (False, True, False))]
+
+    # ----- node hierarchy, depth first
+    nodes = []
+
+    def add_node(assimp_node):
+        node = dict(name=name_of(assimp_node.mName),
+                    transform=np.array(assimp_node.mTransformation, np.float32),
+                    meshes=list(assimp_node.mMeshes), children=[])
+        index = len(nodes)
+        nodes.append(node)
+        node['children'] = [add_node(child) for child in assimp_node.mChildren]
+        return index
+
+    add_node(scene.mRootNode)
+
+    # ----- mesh attributes, material uniforms, texture & bones
+    meshes = []
+    for mesh in scene.mMeshes:
+        mat = scene.mMaterials[mesh.mMaterialIndex].properties
+        uniforms = dict(
+            k_d=mat.get('COLOR_DIFFUSE', (1, 1, 1)),
+            k_s=mat.get('COLOR_SPECULAR', (1, 1, 1)),
+            k_a=mat.get('COLOR_AMBIENT', (0, 0, 0)),
+            s=mat.get('SHININESS', 16.),
+        )
+        attributes = dict(position=mesh.mVertices, normal=mesh.mNormals)
+        if mesh.HasTextureCoords[0]:
+            attributes.update(tex_coord=mesh.mTextureCoords[0])
+        if mesh.HasVertexColors[0]:
+            attributes.update(color=mesh.mColors[0])
+        bones, offsets = [], None
+        if mesh.HasBones:
+            bone_ids, bone_weights = bone_attributes(mesh)
+            attributes.update(bone_ids=bone_ids, bone_weights=bone_weights)
+            bones = [name_of(bone.mName) for bone in mesh.mBones]
+            offsets = np.array([bone.mOffsetMatrix for bone in mesh.mBones],
+                               np.float32)
+        meshes.append(dict(
+            attributes={name: np.asarray(data, np.float32)
+                        for name, data in attributes.items()},
+            index=np.asarray(mesh.mFaces, np.uint32),
+            uniforms={name: np.asarray(value, np.float32).tolist()
+                      for name, value in uniforms.items()},
+            texture=textures[mesh.mMaterialIndex], bones=bones,
+            offsets=offsets))
+
+    nb_triangles = sum((mesh.mNumFaces for mesh in scene.mMeshes))
+    return dict(file=file, nodes=nodes, keyframes=keyframes, meshes=meshes,
+                stats=(scene.mNumMeshes, nb_triangles, len(nodes),
+                       scene.mNumAnimations))
+
+
+def texture_levels(file):
+    """ RGBA uint8 mipmap chain of an image file, halving down to 1x1 """
+    from PIL import Image           # load texture maps
+    image = Image.open(file).convert('RGBA')
+    levels = [np.asarray(image)]
+    while image.width > 1 or image.height > 1:
+        image = image.resize((max(image.width // 2, 1),
+                              max(image.height // 2, 1)), Image.BOX)
+        levels.append(np.asarray(image))
+    return levels
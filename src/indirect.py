@@ -0,0 +1,243 @@
+# Python built-in modules
+import ctypes                       # buffer offsets for indirect draws
+import weakref                      # pools keyed by scene owned objects
+from collections import defaultdict
+
+# External, non built-in modules
+import OpenGL.GL as GL              # standard Python OpenGL wrapper
+import numpy as np                  # all matrix manipulations & OpenGL args
+
+from atlas import ATLAS_UNIT
+from core import Shader
+from resources import RESOURCES
+from streaming import StreamBuffer
+
+# one glMultiDrawElementsIndirect command, as read by the GPU
+COMMAND = np.dtype([('count', np.uint32), ('instance_count', np.uint32),
+                    ('first_index', np.uint32), ('base_vertex', np.int32),
+                    ('base_instance', np.uint32)])
+DRAW_FLOATS = 28      # std430 Draw struct: mat4 model, vec4 k_a & s,
+                      # vec4 k_d & layer, vec4 k_s & padding
+DRAWS_BINDING = 1     # shader storage binding of the Draws block
+
+
+def indirect_supported():
+    """ True if context has multi draw indirect & storage buffers (>= 4.3) """
+    version = (GL.glGetIntegerv(GL.GL_MAJOR_VERSION),
+               GL.glGetIntegerv(GL.GL_MINOR_VERSION))
+    return version >= (4, 3) and bool(GL.glMultiDrawElementsIndirect)
+
+
+# -------------- meshes of one vertex layout packed in shared buffers ---------
+class GeometryPool:
+    """ Vertex & 32 bit index buffers shared by all vertex arrays of one
+        layout. Each pooled array is a slot, its draw command template
+        holding count, first index & base vertex in the shared buffers. """
+    def __init__(self, shader, layout, ids):
+        self.shader, self.layout, self.ids = shader, layout, ids
+        self.vertices = np.zeros(0, layout.dtype)
+        self.index = np.zeros(0, np.uint32)
+        self.templates = np.zeros(0, COMMAND)
+        self.slots = weakref.WeakKeyDictionary()   # vertex array -> slot
+        self.glid, self.buffers, self.dirty = None, [], False
+
+    def slot(self, vertex_array):
+        """ slot of vertex array, added to the pool on first use """
+        slot = self.slots.get(vertex_array)
+        if slot is None:
+            template = np.zeros(1, COMMAND)
+            template[0] = (vertex_array.index.size, 1, self.index.size,
+                           len(self.vertices), 0)
+            self.vertices = np.concatenate((self.vertices,
+                                            vertex_array.vertices))
+            self.index = np.concatenate((self.index, np.ravel(
+                vertex_array.index).astype(np.uint32)))
+            self.templates = np.concatenate((self.templates, template))
+            slot = self.slots[vertex_array] = len(self.templates) - 1
+            self.dirty = True
+
+            # pooled copy is the one drawn, own buffers are restored on demand
+            if vertex_array.glid is not None:
+                vertex_array.evict()
+        return slot
+
+    def upload(self):
+        """ (re-)create shared buffers & vertex array if slots were added """
+        if self.glid is not None:
+            GL.glDeleteVertexArrays(1, [self.glid])
+            GL.glDeleteBuffers(len(self.buffers), self.buffers)
+        self.glid = GL.glGenVertexArrays(1)
+        GL.glBindVertexArray(self.glid)
+        self.buffers = list(GL.glGenBuffers(2))
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.buffers[0])
+        GL.glBufferData(GL.GL_ARRAY_BUFFER, self.vertices.view(np.uint8),
+                        GL.GL_STATIC_DRAW)
+        for entry in self.layout.entries:
+            loc, fmt = GL.glGetAttribLocation(self.shader.glid,
+                                              entry.name), entry.format
+            if loc < 0:
+                continue
+            GL.glEnableVertexAttribArray(loc)
+            GL.glVertexAttribPointer(loc, entry.size, fmt.gl_type,
+                                     fmt.normalized, self.layout.stride,
+                                     ctypes.c_void_p(entry.offset))
+        GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, self.buffers[1])
+        GL.glBufferData(GL.GL_ELEMENT_ARRAY_BUFFER, self.index,
+                        GL.GL_STATIC_DRAW)
+
+        # per instance draw id: base instance of a command picks its Draw
+        loc = GL.glGetAttribLocation(self.shader.glid, 'draw_id')
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.ids)
+        GL.glEnableVertexAttribArray(loc)
+        GL.glVertexAttribIPointer(loc, 1, GL.GL_UNSIGNED_INT, 0, None)
+        GL.glVertexAttribDivisor(loc, 1)
+        GL.glBindVertexArray(0)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+
+        def delete(glid=self.glid, buffers=self.buffers):
+            GL.glDeleteVertexArrays(1, [glid])
+            GL.glDeleteBuffers(len(buffers), buffers)
+        RESOURCES.track(self, self.vertices.nbytes + self.index.nbytes,
+                        delete, 'buffer', evictable=False)
+        self.dirty = False
+
+
+# -------------- multi draw indirect submission -------------------------------
+class IndirectBatcher:
+    """ Submission path replacing one execute call per mesh: passed along
+        with draw uniforms as 'batcher', it takes the meshes of the program
+        it replaces and queues their model matrix & material. After the
+        scene is drawn, flush() writes all queued draws to a storage stream
+        buffer & their commands to an indirect one, and issues a single
+        multi draw per vertex layout & texture array. The occlusion culler
+        also flushes before each box query, so queued occluders are in the
+        depth buffer, and after the children of a tested node, so their
+        draws stay under its conditional rendering. Frames are bracketed by
+        begin_frame() & end_frame(), flushes in between share the frame's
+        stream regions. Needs OpenGL 4.3, see indirect_supported(): viewers
+        keep the direct path otherwise. """
+    def __init__(self, sources=('texture.vert', 'texture_array.frag')):
+        self.sources = sources                 # programs this path replaces
+        self.shader = Shader('texture_indirect.vert', 'texture_indirect.frag')
+        self.pools = {}                        # (stride, entries) -> pool
+        self.materials = weakref.WeakKeyDictionary()   # mesh -> 12 floats
+        self.queue = defaultdict(list)         # (pool, array) -> draws
+        self.capacity = 0                      # draw ids buffer size
+        self.ids = GL.glGenBuffers(1)
+        self.draws = StreamBuffer(GL.GL_SHADER_STORAGE_BUFFER, 1 << 18)
+        self.commands = StreamBuffer(GL.GL_DRAW_INDIRECT_BUFFER, 1 << 16)
+        self.stats = dict(batched=0, multidraws=0)
+        self.enabled = True
+        RESOURCES.track(self, 0, self._deleter(), 'buffer', evictable=False)
+
+    def _deleter(self):
+        """ release callback of our GL objects, holding no ref to self """
+        return lambda glid=self.ids: GL.glDeleteBuffers(1, [glid])
+
+    def begin_frame(self):
+        """ move streams on to this frame's regions, reset statistics """
+        self.draws.begin_frame()
+        self.commands.begin_frame()
+        self.stats.update(batched=0, multidraws=0)
+
+    def end_frame(self):
+        """ draw what is still queued, fence this frame's stream regions """
+        self.flush()
+        self.draws.end_frame()
+        self.commands.end_frame()
+
+    def submit(self, mesh, primitives, uniforms):
+        """ queue mesh if this path draws it, False to draw it directly """
+        vertex_array = mesh.vertex_array
+        if (not self.enabled or primitives != GL.GL_TRIANGLES or
+                mesh.shader.sources != self.sources or
+                vertex_array.index is None):
+            return False
+        layout = vertex_array.layout
+        key = (layout.stride, tuple(layout.entries))
+        pool = self.pools.get(key)
+        if pool is None:
+            pool = self.pools[key] = GeometryPool(self.shader, layout,
+                                                  self.ids)
+        material = self.materials.get(mesh)
+        if material is None:
+            material = self.materials[mesh] = self._material(
+                {**mesh.uniforms, **uniforms})
+        self.queue[pool, uniforms.get('diffuse_texture')].append(
+            (pool.slot(vertex_array), uniforms['model'], material))
+        return True
+
+    @staticmethod
+    def _material(uniforms):
+        """ constant part of a mesh's Draw struct, from its uniforms """
+        k_a, k_d, k_s = (np.resize(np.asarray(uniforms.get(name, 0),
+                                              np.float32), 3)
+                         for name in ('k_a', 'k_d', 'k_s'))
+        return np.concatenate((k_a, (uniforms.get('s', 16.),), k_d,
+                               (uniforms.get('diffuse_layer', 0),), k_s,
+                               (0,))).astype(np.float32)
+
+    @staticmethod
+    def _write(stream, data):
+        """ offset of data written to stream, moving on to its next region,
+            grown if needed, when this frame's region is full """
+        offset = stream.write(data)
+        if offset is None:
+            stream.end_frame()
+            stream.begin_frame(data.nbytes)
+            offset = stream.write(data)
+        return offset
+
+    def flush(self):
+        """ draw all queued meshes, a multi draw per pool & texture array """
+        if not self.queue:
+            return
+        groups = [(pool, array, draws) for (pool, array), draws
+                  in self.queue.items()]
+        self.queue.clear()
+        total = sum(len(draws) for _, _, draws in groups)
+        self.stats['batched'] += total
+        self.stats['multidraws'] += len(groups)
+
+        # one row per draw, whose index is the command's base instance
+        commands = np.empty(total, COMMAND)
+        draws = np.empty((total, DRAW_FLOATS), np.float32)
+        start = 0
+        for pool, _, queued in groups:
+            slots, models, materials = zip(*queued)
+            end = start + len(queued)
+            commands[start:end] = pool.templates[list(slots)]
+            draws[start:end, :16] = np.reshape(models, (-1, 16))
+            draws[start:end, 16:] = materials
+            start = end
+        commands['base_instance'] = np.arange(total)
+
+        if total > self.capacity:
+            self.capacity = max(total, 2 * self.capacity)
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.ids)
+            GL.glBufferData(GL.GL_ARRAY_BUFFER,
+                            np.arange(self.capacity, dtype=np.uint32),
+                            GL.GL_STATIC_DRAW)
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        offset = self._write(self.draws, draws)
+        self.draws.bind_range(DRAWS_BINDING, offset, draws.nbytes)
+        first = self._write(self.commands, commands)
+        GL.glBindBuffer(GL.GL_DRAW_INDIRECT_BUFFER, self.commands.glid)
+
+        GL.glUseProgram(self.shader.glid)
+        self.shader.set_uniforms(dict(diffuse_array=ATLAS_UNIT))
+        start = 0
+        for pool, array, queued in groups:
+            if pool.dirty:
+                pool.upload()
+            RESOURCES.touch(pool)
+            if array is not None:
+                array.bind()
+            GL.glBindVertexArray(pool.glid)
+            GL.glMultiDrawElementsIndirect(
+                GL.GL_TRIANGLES, GL.GL_UNSIGNED_INT,
+                ctypes.c_void_p(first + start * COMMAND.itemsize),
+                len(queued), 0)
+            start += len(queued)
+        GL.glBindVertexArray(0)
+        GL.glBindBuffer(GL.GL_DRAW_INDIRECT_BUFFER, 0)
@@ -0,0 +1,174 @@
+# Python built-in modules
+from collections import namedtuple
+
+# External, non built-in modules
+import OpenGL.GL as GL              # standard Python OpenGL wrapper
+import numpy as np                  # all matrix manipulations & OpenGL args
+
+
+# ------------ compact vertex attribute storage formats -----------------------
+class AttributeFormat(namedtuple('AttributeFormat', 'name dtype gl_type normalized')):
+    """ GPU storage of a vertex attribute: numpy & GL types, normalization """
+
+    def quantize(self, data):
+        """ convert float data to this format, as stored in the GPU buffer """
+        if np.issubdtype(self.dtype, np.floating):
+            return data.astype(self.dtype)
+        info = np.iinfo(self.dtype)
+        data = data * info.max if self.normalized else data
+        return np.clip(np.round(data), info.min, info.max).astype(self.dtype)
+
+    def dequantize(self, data):
+        """ float values as seen by the vertex shader for stored data """
+        data = data.astype(np.float32)
+        if self.normalized:  # GL >= 4.2 signed normalization rule
+            info = np.iinfo(self.dtype)
+            data = np.maximum(data / info.max, -1)
+        return data
+
+
+FLOAT32 = AttributeFormat('float32', np.float32, GL.GL_FLOAT, False)
+HALF = AttributeFormat('half', np.float16, GL.GL_HALF_FLOAT, False)
+SNORM16 = AttributeFormat('snorm16', np.int16, GL.GL_SHORT, True)
+UNORM16 = AttributeFormat('unorm16', np.uint16, GL.GL_UNSIGNED_SHORT, True)
+UNORM8 = AttributeFormat('unorm8', np.uint8, GL.GL_UNSIGNED_BYTE, True)
+UINT16 = AttributeFormat('uint16', np.uint16, GL.GL_UNSIGNED_SHORT, False)
+UINT8 = AttributeFormat('uint8', np.uint8, GL.GL_UNSIGNED_BYTE, False)
+
+# candidate formats per attribute name with the max. error each may introduce,
+# the first one reproducing the data within tolerance is used, else float32
+COMPACT_FORMATS = {
+    'normal':       ((SNORM16, 1e-4), (HALF, 1e-3)),
+    'tex_coord':    ((HALF, 1e-3),),
+    'color':        ((UNORM8, .5/255),),
+    'bone_ids':     ((UINT8, 0), (UINT16, 0)),
+    'bone_weights': ((UNORM8, .5/255), (UNORM16, .5/65535)),
+}
+
+FORMATS = {fmt.name: fmt for fmt in (FLOAT32, HALF, SNORM16, UNORM16, UNORM8,
+                                    UINT16, UINT8)}
+
+
+def choose_format(name, data, compact=True):
+    """ most compact format able to store attribute data within tolerance """
+    for fmt, tolerance in COMPACT_FORMATS.get(name, ()) if compact else ():
+        stored = fmt.dequantize(fmt.quantize(data))
+        if np.all(np.abs(stored - data) <= tolerance):
+            return fmt
+    return FLOAT32
+
+
+# ------------ interleaved vertex layout --------------------------------------
+class VertexLayout:
+    """ Interleaved layout: attribute formats, sizes and offsets in a vertex.
+        All formats are fed to shaders as floats, normalized or converted,
+        so float & vec inputs of the existing shaders match any layout. """
+    Entry = namedtuple('Entry', 'name format size components offset')
+
+    def __init__(self, entries, stride):
+        self.entries = entries    # one Entry per attribute, in buffer order
+        self.stride = stride      # bytes per vertex, multiple of 4
+
+    @property
+    def dtype(self):
+        """ numpy structured type matching one interleaved vertex """
+        return np.dtype(dict(
+            names=[e.name for e in self.entries],
+            formats=[(e.format.dtype, (e.size,)) for e in self.entries],
+            offsets=[e.offset for e in self.entries],
+            itemsize=self.stride))
+
+    def float_stride(self):
+        """ bytes per vertex this layout would take as plain float32 VBOs """
+        return sum(4 * e.components for e in self.entries)
+
+    def describe(self):
+        """ plain list & int description of this layout, e.g. for JSON """
+        return dict(stride=self.stride, entries=[
+            (e.name, e.format.name, e.size, e.components, e.offset)
+            for e in self.entries])
+
+    @classmethod
+    def from_description(cls, description):
+        """ layout from a description made by describe() """
+        return cls([cls.Entry(name, FORMATS[fmt], size, components, offset)
+                    for name, fmt, size, components, offset
+                    in description['entries']], description['stride'])
+
+    def __eq__(self, other):
+        return (isinstance(other, VertexLayout) and self.stride == other.stride
+                and self.entries == other.entries)
+
+    def __hash__(self):
+        return hash((self.stride, tuple(self.entries)))
+
+
+def pack_vertices(attributes, compact=True):
+    """ interleave attribute arrays in one buffer, as (layout, vertex array)
+        Attributes should be dict of arrays with one row per vertex. """
+    entries, columns, offset = [], [], 0
+    for name, data in attributes.items():
+        data = np.asarray(data, np.float32)
+        data = data.reshape(len(data), -1)
+        fmt = choose_format(name, data, compact)
+        components = data.shape[1]
+
+        # pad small types to 4 byte aligned attributes, as GL implementations
+        # handle misaligned attributes poorly (e.g. 3 x int16 normals -> 4)
+        size = components
+        while (size * np.dtype(fmt.dtype).itemsize) % 4:
+            size += 1
+        entries.append(VertexLayout.Entry(name, fmt, size, components, offset))
+        columns.append(fmt.quantize(data))
+        offset += size * np.dtype(fmt.dtype).itemsize
+
+    layout = VertexLayout(entries, offset)
+    vertices = np.zeros(len(columns[0]) if columns else 0, layout.dtype)
+    for entry, column in zip(entries, columns):
+        vertices[entry.name][:, :entry.components] = column
+    LAYOUT_STATS.add_vertices(layout, len(vertices))
+    return layout, vertices
+
+
+def pack_indices(index, nb_vertices):
+    """ flat index array with the smallest type addressing all vertices """
+    index = np.asarray(index).ravel()
+    dtype = np.uint16 if nb_vertices <= 1 << 16 else np.uint32
+    index = index.astype(dtype, copy=False)
+    LAYOUT_STATS.add_indices(index)
+    return index
+
+
+INDEX_TYPES = {np.dtype(np.uint16): GL.GL_UNSIGNED_SHORT,
+               np.dtype(np.uint32): GL.GL_UNSIGNED_INT}
+
+
+# ------------ memory report ---------------------------------------------------
+class LayoutStats:
+    """ Accumulates vertex & index bytes uploaded, vs. float32/int32 storage """
+    def __init__(self):
+        self.vertices = self.vertex_bytes = self.float_vertex_bytes = 0
+        self.indices = self.index_bytes = 0
+
+    def add_vertices(self, layout, count):
+        self.vertices += count
+        self.vertex_bytes += count * layout.stride
+        self.float_vertex_bytes += count * layout.float_stride()
+
+    def add_indices(self, index):
+        self.indices += index.size
+        self.index_bytes += index.nbytes
+
+    def report(self):
+        """ human readable summary of bytes per vertex and VRAM saved """
+        vertices = max(self.vertices, 1)
+        before = self.float_vertex_bytes + 4 * self.indices
+        after = self.vertex_bytes + self.index_bytes
+        return ('Vertex layout: %d vertices, %.1f -> %.1f bytes/vertex, '
+                '%d indices, %.1f -> %.1f MB total (%.1f MB saved)' % (
+                    self.vertices, self.float_vertex_bytes / vertices,
+                    self.vertex_bytes / vertices, self.indices,
+                    before / 2**20, after / 2**20, (before - after) / 2**20))
+
+
+LAYOUT_STATS = LayoutStats()
@@ -0,0 +1,172 @@
+""" Keyframe reduction & analytic motion paths, both GL free. Tracks are
+    reduced to the keys that interpolation of their neighbours cannot
+    reproduce within a tolerance. Paths compute a closed form value instead
+    of searching and interpolating keys: they have value(time) as KeyFrames
+    and a vectorized sample(times), returning one row per time. """
+# External, non built-in modules
+import numpy as np                  # all matrix manipulations & OpenGL args
+
+# default reduction tolerances: scene units, radians & scale factor
+TOLERANCES = (1e-3, 1e-3, 1e-3)
+
+
+# -------------- keyframe reduction -------------------------------------------
+def _distances(values, references, angular):
+    """ row wise distances, or angles between rotations for quaternions """
+    if not angular:
+        return np.linalg.norm(values - references, axis=1)
+    norms = np.linalg.norm(values, axis=1) * np.linalg.norm(references, axis=1)
+    dots = np.abs(np.einsum('ij,ij->i', values, references))
+    cosines = np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
+    return 2 * np.arccos(np.clip(cosines, 0, 1))
+
+
+def _errors(times, values, start, end, angular):
+    """ errors of keys strictly between start & end when lerped from them,
+        quaternions being lerped then normalized as TransformKeyFrames do """
+    fractions = (times[start + 1:end] - times[start]) / (times[end] -
+                                                          times[start])
+    approx = values[start] + fractions[:, None] * (values[end] - values[start])
+    return _distances(approx, values[start + 1:end], angular)
+
+
+def reduce_keys(times, values, tolerance, angular=False):
+    """ indices of the keys to keep so that lerping kept keys reproduces all
+        others within tolerance: distance, or angle for quaternions. Greedy,
+        each kept key reaches as far as its interpolation stays exact, the
+        span end found by exponential then binary search, O(n log n) error
+        evaluations. A constant track is reduced to its first key. """
+    times = np.asarray(times, np.float64)
+    values = np.asarray(values, np.float64).reshape(len(times), -1)
+    if len(times) < 2:
+        return np.arange(len(times))
+    if np.all(_distances(values, values[:1], angular) <= tolerance):
+        return np.arange(1)
+
+    def fits(start, end):
+        return np.all(_errors(times, values, start, end, angular) <= tolerance)
+
+    kept, start, last = [0], 0, len(times) - 1
+    while start < last:
+        good, bad, step = start + 1, last + 1, 1   # spans to good fit
+        while good + step <= last:
+            if not fits(start, good + step):
+                bad = good + step
+                break
+            good, step = good + step, 2 * step
+        while bad - good > 1:
+            middle = (good + bad) // 2
+            good, bad = (middle, bad) if fits(start, middle) else (good, middle)
+        kept.append(good)
+        start = good
+    return np.array(kept)
+
+
+def reduce_track(times, values, tolerance, angular=False):
+    """ (times, values) of a track without its redundant keys """
+    times, values = np.asarray(times), np.asarray(values)
+    kept = reduce_keys(times, values, tolerance, angular)
+    return times[kept], values[kept]
+
+
+# -------------- analytic paths -----------------------------------------------
+class Path:
+    """ Motion in closed form, value(time) of one time as KeyFrames, and
+        sample(times) for a whole array of times at once """
+    def value(self, time):
+        """ value at a given time """
+        return self.sample(np.array((time,), np.float64))[0]
+
+    def sample(self, times):
+        """ (N, ...) array of values at each of the N times """
+        raise NotImplementedError
+
+    def describe(self):
+        """ plain description, for snapshots """
+        return dict(kind=type(self).__name__, **{
+            name: np.asarray(value).tolist() if value is not None else None
+            for name, value in vars(self).items()})
+
+    @staticmethod
+    def from_description(description):
+        """ path described by describe() """
+        description = dict(description)
+        kind = PATHS[description.pop('kind')]
+        return kind(**description)
+
+
+class Line(Path):
+    """ Straight line from start at velocity, from time 0 to end_time """
+    def __init__(self, start, velocity, end_time=None):
+        self.start = np.asarray(start, np.float32)
+        self.velocity = np.asarray(velocity, np.float32)
+        self.end_time = end_time
+
+    def sample(self, times):
+        times = np.clip(times, 0, self.end_time)
+        return self.start + np.multiply.outer(times, self.velocity)
+
+
+class Circle(Path):
+    """ Horizontal circle around center, at angular speed in radians per
+        second from phase at time 0, until end_time """
+    def __init__(self, center, radius, speed=1., phase=0., end_time=None):
+        self.center = np.asarray(center, np.float32)
+        self.radius, self.speed, self.phase = radius, speed, phase
+        self.end_time = end_time
+
+    def sample(self, times):
+        angles = self.phase + self.speed * np.clip(times, 0, self.end_time)
+        points = np.zeros((len(angles), 3), np.float32)
+        points[:, 0] = self.radius * np.cos(angles)
+        points[:, 2] = self.radius * np.sin(angles)
+        return points + self.center
+
+
+class Spline(Path):
+    """ Cubic Hermite spline through points at times, with Catmull-Rom
+        tangents, clamped to the first & last points outside of times """
+    def __init__(self, times, points):
+        self.times = np.asarray(times, np.float64)
+        self.points = np.asarray(points, np.float32)
+        self.tangents = np.gradient(self.points, self.times, axis=0,
+                                    edge_order=1) if len(self.times) > 1 \
+            else np.zeros_like(self.points)
+
+    def describe(self):
+        return dict(kind='Spline', times=self.times.tolist(),
+                    points=self.points.tolist())
+
+    def sample(self, times):
+        times = np.clip(times, self.times[0], self.times[-1])
+        index = np.clip(np.searchsorted(self.times, times, 'right') - 1, 0,
+                        max(len(self.times) - 2, 0))
+        if len(self.times) < 2:
+            return np.repeat(self.points[:1], len(times), axis=0)
+        durations = self.times[index + 1] - self.times[index]
+        f = ((times - self.times[index]) / durations)[:, None]
+        f2, f3 = f * f, f * f * f
+        return ((2 * f3 - 3 * f2 + 1) * self.points[index] +
+                (f3 - 2 * f2 + f) * durations[:, None] * self.tangents[index] +
+                (-2 * f3 + 3 * f2) * self.points[index + 1] +
+                (f3 - f2) * durations[:, None] * self.tangents[index + 1]
+                ).astype(np.float32)
+
+
+class Spin(Path):
+    """ Rotation quaternions (w, x, y, z) about axis, at speed in degrees
+        per second from start angle at time 0 """
+    def __init__(self, axis, speed, start=0.):
+        axis = np.asarray(axis, np.float32)
+        self.axis = axis / np.linalg.norm(axis)
+        self.speed, self.start = speed, start
+
+    def sample(self, times):
+        halves = np.radians(self.start + self.speed * np.asarray(times)) / 2
+        quaternions = np.empty((len(halves), 4), np.float32)
+        quaternions[:, 0] = np.cos(halves)
+        quaternions[:, 1:] = np.multiply.outer(np.sin(halves), self.axis)
+        return quaternions
+
+
+PATHS = {kind.__name__: kind for kind in (Line, Circle, Spline, Spin)}
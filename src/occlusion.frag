@@ -0,0 +1,8 @@
+#version 330 core
+
+// color writes are disabled, only samples passing the depth test matter
+out vec4 out_color;
+
+void main() {
+    out_color = vec4(1);
+}
@@ -0,0 +1,143 @@
+# Python built-in modules
+from itertools import product       # unit cube corners
+
+# External, non built-in modules
+import OpenGL.GL as GL              # standard Python OpenGL wrapper
+import numpy as np                  # all matrix manipulations & OpenGL args
+
+from core import Shader, VertexArray, transform_bounds
+from resources import RESOURCES
+
+
+def query_result(glid, pname):
+    """ integer value of an occlusion query parameter """
+    return int(np.ravel(GL.glGetQueryObjectuiv(glid, pname))[0])
+
+
+def subtree(node):
+    """ all nodes below node, depth first """
+    for child in getattr(node, 'children', ()):
+        if hasattr(child, 'animated'):
+            yield child
+            yield from subtree(child)
+
+
+class NodeQuery:
+    """ Occlusion query state of one tested node """
+    def __init__(self, glid):
+        self.glid = glid          # GL query object
+        self.pending = False      # query issued, result not read back yet
+        self.visible = True       # last known result
+
+
+# -------------- Hardware occlusion culling -----------------------------------
+class OcclusionCuller:
+    """ Tests bounding boxes of flagged nodes with GL_ANY_SAMPLES_PASSED
+        queries. Results are read back a frame later, only once available,
+        so the CPU never waits on the GPU: nodes whose box was hidden last
+        frame are skipped, others are drawn with conditional rendering on
+        this frame's query, which lets the GPU skip them if still hidden.
+        Occluders should be drawn before tested nodes for best results;
+        meshes queued by a batcher are flushed before each query and
+        within conditional rendering, to take part in both. """
+    def __init__(self, margin=1.):
+        self.shader = Shader('occlusion.vert', 'occlusion.frag')
+        position = np.array(list(product((0, 1), repeat=3)), np.float32)
+        quads = np.array(((0, 1, 3, 2), (4, 6, 7, 5), (0, 4, 5, 1),
+                          (2, 3, 7, 6), (0, 2, 6, 4), (1, 5, 7, 3)))
+        index = np.concatenate((quads[:, :3], quads[:, [0, 2, 3]]))
+        self.box = VertexArray(self.shader, dict(position=position), index)
+        self.margin = margin      # camera this close to a box: always visible
+        self.queries = {}         # tested node -> NodeQuery
+        self.boxes = {}           # tested node -> local box, if static
+        self.stats = dict(tested=0, occluded=0)
+        self.enabled = True
+        self._glids_changed()
+
+    def begin_frame(self):
+        """ reset per frame statistics """
+        self.stats.update(tested=0, occluded=0)
+
+    def draw(self, node, **uniforms):
+        """ draw node's children unless its bounding box is known hidden """
+        box = self.local_bounds(node)
+        if not self.enabled or box is None:
+            node.draw_children(**uniforms)
+            return
+        box = transform_bounds(box, node.world_transform)
+        camera = np.asarray(uniforms['w_camera_position'])[:3]
+        if np.all((box[0] - self.margin <= camera) &
+                  (camera <= box[1] + self.margin)):
+            node.draw_children(**uniforms)
+            return
+
+        query = self.queries.get(node)
+        if query is None:
+            query = self.queries[node] = NodeQuery(GL.glGenQueries(1))
+            self._glids_changed()
+        self.stats['tested'] += 1
+
+        # 1. read back previous query result only if ready, never stall
+        if query.pending and query_result(query.glid,
+                                          GL.GL_QUERY_RESULT_AVAILABLE):
+            query.visible = bool(query_result(query.glid, GL.GL_QUERY_RESULT))
+            query.pending = False
+
+        # 2. issue a new box query, unless the last one is still in flight,
+        # against the depth of all occluders drawn or queued so far
+        batcher = uniforms.get('batcher')
+        issued = not query.pending
+        if issued:
+            if batcher is not None:
+                batcher.flush()
+            self._query_box(query.glid, box, uniforms)
+            query.pending = True
+
+        # 3. hidden last time: skip, the new query tells if it shows again
+        if not query.visible:
+            self.stats['occluded'] += 1
+            return
+        if issued:
+            GL.glBeginConditionalRender(query.glid, GL.GL_QUERY_NO_WAIT)
+            node.draw_children(**uniforms)
+            if batcher is not None:
+                batcher.flush()
+            GL.glEndConditionalRender()
+        else:
+            node.draw_children(**uniforms)
+
+    def local_bounds(self, node):
+        """ node's local box, computed once unless an animated node below
+            moves part of the subtree; lazy snapshot subtrees are only
+            known once they are built """
+        entry = self.boxes.get(node)
+        if entry is None:
+            nodes = [node, *subtree(node)]
+            entry = (not any(child.animated for child in nodes[1:]),
+                     node.local_bounds())
+            if all(getattr(child, 'materialized', True) for child in nodes):
+                self.boxes[node] = entry
+        static, box = entry
+        return box if static else node.local_bounds()
+
+    def _query_box(self, glid, box, uniforms):
+        """ rasterize box with color & depth writes off inside a query """
+        model = np.diag((*(box[1] - box[0]), 1)).astype(np.float32)
+        model[:3, 3] = box[0]
+        GL.glUseProgram(self.shader.glid)
+        self.shader.set_uniforms({**uniforms, 'model': model})
+        GL.glColorMask(GL.GL_FALSE, GL.GL_FALSE, GL.GL_FALSE, GL.GL_FALSE)
+        GL.glDepthMask(GL.GL_FALSE)
+        GL.glDisable(GL.GL_CULL_FACE)
+        GL.glBeginQuery(GL.GL_ANY_SAMPLES_PASSED, glid)
+        self.box.execute(GL.GL_TRIANGLES)
+        GL.glEndQuery(GL.GL_ANY_SAMPLES_PASSED)
+        GL.glEnable(GL.GL_CULL_FACE)
+        GL.glDepthMask(GL.GL_TRUE)
+        GL.glColorMask(GL.GL_TRUE, GL.GL_TRUE, GL.GL_TRUE, GL.GL_TRUE)
+
+    def _glids_changed(self):
+        """ keep the release callback up to date with live query objects """
+        glids = [query.glid for query in self.queries.values()]
+        RESOURCES.track(self, 0, lambda: GL.glDeleteQueries(
+            len(glids), glids), 'query', evictable=False)
@@ -0,0 +1,19 @@
+#version 330 core
+
+// ---- frame globals, one uniform buffer shared by all programs
+layout(std140, row_major) uniform Frame {
+    mat4 view, projection;
+    vec3 w_camera_position;
+    float time;
+    vec3 light_dir;
+};
+
+// ---- object placement
+uniform mat4 model;
+
+// ---- unit cube corners, scaled & placed on a world bounding box by model
+in vec3 position;
+
+void main() {
+    gl_Position = projection * view * model * vec4(position, 1);
+}
@@ -0,0 +1,76 @@
+# Python built-in modules
+import json                         # table of contents encoding
+import mmap                         # zero copy file access
+import os                           # os function, i.e. checking file status
+import struct                       # fixed size file header
+
+# External, non built-in modules
+import numpy as np                  # all matrix manipulations & OpenGL args
+
+ALIGNMENT = 64                      # array start offsets, cache line aligned
+
+
+def stamp(file):
+    """ what identifies a source file version without reading it """
+    stat = os.stat(file)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+# -------------- single file container of a JSON table & raw arrays ----------
+class PackWriter:
+    """ Collects arrays to store after a JSON table of contents, which
+        refers to them by descriptors returned by add() """
+    def __init__(self, magic):
+        self.magic = magic        # 8 bytes identifying the file kind
+        self.chunks = []
+        self.size = 0
+
+    def add(self, array):
+        """ schedule a (plain dtype) array for writing, return descriptor """
+        array = np.ascontiguousarray(array)
+        self.size += -self.size % ALIGNMENT
+        descriptor = dict(offset=self.size, dtype=array.dtype.str,
+                          shape=list(array.shape))
+        self.chunks.append((self.size, array))
+        self.size += array.nbytes
+        return descriptor
+
+    def add_bytes(self, data):
+        """ schedule raw bytes (e.g. another file's content) for writing """
+        return self.add(np.frombuffer(data, np.uint8))
+
+    def write(self, path, contents):
+        """ write header, JSON table of contents and arrays to path """
+        table = json.dumps(contents).encode()
+        start = len(self.magic) + 8 + len(table)
+        start += -start % ALIGNMENT
+        with open(path, 'wb') as file:
+            file.write(self.magic + struct.pack('<Q', len(table)) + table)
+            for offset, array in self.chunks:
+                file.seek(start + offset)
+                file.write(array.tobytes())
+            file.truncate(start + self.size)
+
+
+class PackReader:
+    """ Memory mapped view of a file written by PackWriter: arrays are
+        numpy views on the mapping, paged in only when accessed """
+    def __init__(self, path, magic):
+        self.path = path
+        with open(path, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(magic)] != magic:
+            raise ValueError('%s is not a %s file' % (path, magic.decode()))
+        size, = struct.unpack_from('<Q', self.map, len(magic))
+        start = len(magic) + 8
+        self.contents = json.loads(self.map[start:start + size].decode())
+        self.start = start + size + (-(start + size) % ALIGNMENT)
+
+    def array(self, descriptor):
+        """ read-only array view described by descriptor, None for None """
+        if descriptor is None:
+            return None
+        dtype = np.dtype(descriptor['dtype'])
+        count = int(np.prod(descriptor['shape']))
+        return np.frombuffer(self.map, dtype, count, self.start +
+                             descriptor['offset']).reshape(descriptor['shape'])
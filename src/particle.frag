@@ -0,0 +1,19 @@
+#version 330 core
+
+uniform sampler2D diffuse_map;
+uniform float textured;    // 1 samples diffuse_map, 0 draws a soft disc
+uniform vec4 color;
+
+in vec2 frag_uv;
+in float frag_age;
+
+out vec4 out_color;
+
+void main() {
+    vec4 base = textured > 0.5 ? texture(diffuse_map, frag_uv)
+              : vec4(1, 1, 1, 1 - smoothstep(0.2, 0.5, length(frag_uv - 0.5)));
+    out_color = base * color;
+    out_color.a *= 1 - frag_age;       // fade out over lifetime
+    if (out_color.a < 0.01)
+        discard;
+}
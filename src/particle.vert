@@ -0,0 +1,35 @@
+#version 330 core
+
+// ---- frame globals, one uniform buffer shared by all programs
+layout(std140, row_major) uniform Frame {
+    mat4 view, projection;
+    vec3 w_camera_position;
+    float time;
+    vec3 light_dir;
+};
+
+// ---- billboard quad corner, per vertex, and particle state, per instance
+layout(location = 0) in vec2 corner;
+layout(location = 1) in vec4 position_age;
+layout(location = 2) in vec4 velocity_life;
+
+uniform vec2 size_range;   // world size at birth & at death
+
+out vec2 frag_uv;
+out float frag_age;        // fraction of lifetime, in [0, 1)
+
+void main() {
+    frag_age = position_age.w / max(velocity_life.w, 1e-6);
+    frag_uv = corner + 0.5;
+    if (frag_age >= 1) {               // dead: degenerate, clipped quad
+        gl_Position = vec4(2, 2, 2, 1);
+        return;
+    }
+
+    // camera right & up axes in world space: first rows of the view matrix
+    vec3 right = vec3(view[0][0], view[1][0], view[2][0]);
+    vec3 up = vec3(view[0][1], view[1][1], view[2][1]);
+    float size = mix(size_range.x, size_range.y, frag_age);
+    vec3 w_position = position_age.xyz + size * (corner.x * right + corner.y * up);
+    gl_Position = projection * view * vec4(w_position, 1);
+}
@@ -0,0 +1,54 @@
+#version 330 core
+
+// ---- particle state: position & age, velocity & lifetime, in seconds
+layout(location = 0) in vec4 position_age;
+layout(location = 1) in vec4 velocity_life;
+
+// ---- simulation step and forces
+uniform float dt, drag;
+uniform vec3 gravity;
+
+// ---- emission: dead particles whose index is in the ring window
+// [emit_start, emit_start + emit_count) respawn at the emitter this step
+uniform mat4 emitter;
+uniform float emit_start, emit_count, capacity, seed;
+uniform vec3 emit_velocity;
+uniform float spread, emit_radius;
+uniform vec2 life_range;
+
+// ---- new state, captured by transform feedback
+out vec4 out_position_age;
+out vec4 out_velocity_life;
+
+// cheap integer hash to [0, 1), different per particle, step and channel
+float random(float channel) {
+    uint h = uint(gl_VertexID) * 747796405u + uint(seed) * 2891336453u
+           + uint(channel) * 277803737u;
+    h = ((h >> ((h >> 28u) + 4u)) ^ h) * 277803737u;
+    return float((h >> 22u) ^ h) / 4294967296.0;
+}
+
+vec3 random_direction(float channel) {
+    float z = 2 * random(channel) - 1;
+    float angle = 6.2831853 * random(channel + 1);
+    return vec3(sqrt(1 - z * z) * vec2(cos(angle), sin(angle)), z);
+}
+
+void main() {
+    vec3 position = position_age.xyz, velocity = velocity_life.xyz;
+    float age = position_age.w + dt, life = velocity_life.w;
+
+    float slot = mod(float(gl_VertexID) - emit_start + capacity, capacity);
+    if (age >= life && slot < emit_count) {
+        vec3 offset = emit_radius * random(0) * random_direction(1);
+        position = (emitter * vec4(offset, 1)).xyz;
+        velocity = mat3(emitter) * (emit_velocity + spread * random_direction(3));
+        life = mix(life_range.x, life_range.y, random(5));
+        age = 0;
+    } else if (age < life) {
+        velocity = (velocity + gravity * dt) * (1 - min(drag * dt, 1));
+        position += velocity * dt;
+    }
+    out_position_age = vec4(position, age);
+    out_velocity_life = vec4(velocity, life);
+}
@@ -0,0 +1,152 @@
+# Python built-in modules
+import ctypes                       # buffer offsets for attribute pointers
+
+# External, non built-in modules
+import OpenGL.GL as GL              # standard Python OpenGL wrapper
+import glfw                         # lean window system wrapper for OpenGL
+import numpy as np                  # all matrix manipulations & OpenGL args
+
+from resources import RESOURCES
+
+# particle state, two vec4 per particle: position & age, velocity & lifetime
+PARTICLE = np.dtype([('position_age', np.float32, 4),
+                     ('velocity_life', np.float32, 4)])
+CORNERS = np.array(((-.5, -.5), (.5, -.5), (-.5, .5), (.5, .5)), np.float32)
+
+
+# -------------- GPU simulated particles --------------------------------------
+class ParticleSystem:
+    """ Particles whose state lives in two GPU buffers: each step, transform
+        feedback reads one buffer and writes the next state to the other,
+        which is then drawn as instanced camera facing quads. Dead particles
+        respawn at the emitter, in a window of the pool sliding by the
+        number of particles emitted per step, so CPU work per frame is a
+        few GL calls whatever the capacity. """
+    def __init__(self, update_shader, shader, capacity=10000, rate=1000,
+                 life=(1., 3.), velocity=(0, 2, 0), spread=1., radius=.5,
+                 gravity=(0, -9.81, 0), drag=.1, size=(.2, .6),
+                 color=(1, 1, 1, 1), texture=None, additive=False):
+        self.update_shader, self.shader = update_shader, shader
+        self.capacity, self.rate = capacity, rate
+        self.texture, self.additive = texture, additive
+        self.uniforms = dict(life_range=life, emit_velocity=velocity,
+                             spread=spread, emit_radius=radius,
+                             gravity=gravity, drag=drag, size_range=size,
+                             color=color, capacity=capacity,
+                             textured=float(texture is not None))
+        self.emitter = np.identity(4, dtype=np.float32)
+        self.emit_start, self.emit_carry = 0, 0.
+        self.step, self.last_time = 0, None
+        self.current = 0          # index of buffer holding current state
+
+        # all particles start dead: age 1 past a lifetime of 0
+        particles = np.zeros(capacity, PARTICLE)
+        particles['position_age'][:, 3] = 1
+        self.buffers = list(GL.glGenBuffers(2))
+        for buffer in self.buffers:
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, buffer)
+            GL.glBufferData(GL.GL_ARRAY_BUFFER, particles, GL.GL_DYNAMIC_COPY)
+        self.quad = GL.glGenBuffers(1)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.quad)
+        GL.glBufferData(GL.GL_ARRAY_BUFFER, CORNERS, GL.GL_STATIC_DRAW)
+
+        # one update & one draw vertex array per source buffer
+        self.update_arrays = list(GL.glGenVertexArrays(2))
+        self.draw_arrays = list(GL.glGenVertexArrays(2))
+        for buffer, update, draw in zip(self.buffers, self.update_arrays,
+                                        self.draw_arrays):
+            GL.glBindVertexArray(update)
+            self._state_attributes(buffer, first=0, divisor=0)
+            GL.glBindVertexArray(draw)
+            GL.glEnableVertexAttribArray(0)
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.quad)
+            GL.glVertexAttribPointer(0, 2, GL.GL_FLOAT, False, 0, None)
+            self._state_attributes(buffer, first=1, divisor=1)
+        GL.glBindVertexArray(0)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        RESOURCES.track(self, 2 * particles.nbytes + CORNERS.nbytes,
+                        self._deleter(), 'buffer', evictable=False)
+
+    def _deleter(self):
+        """ release callback of our GL objects, holding no ref to self """
+        buffers = self.buffers + [self.quad]
+        arrays = self.update_arrays + self.draw_arrays
+        return lambda: (GL.glDeleteBuffers(len(buffers), buffers),
+                        GL.glDeleteVertexArrays(len(arrays), arrays))
+
+    @staticmethod
+    def _state_attributes(buffer, first, divisor):
+        """ particle state of buffer as attributes first & first + 1 """
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, buffer)
+        for index, field in enumerate(PARTICLE.names):
+            location = first + index
+            GL.glEnableVertexAttribArray(location)
+            GL.glVertexAttribPointer(location, 4, GL.GL_FLOAT, False,
+                                     PARTICLE.itemsize, ctypes.c_void_p(
+                                         PARTICLE.fields[field][1]))
+            GL.glVertexAttribDivisor(location, divisor)
+
+    def update(self, dt):
+        """ advance simulation by dt seconds, emitting at the emitter """
+        emitted = self.rate * dt + self.emit_carry
+        count = min(int(emitted), self.capacity)
+        self.emit_carry = emitted - int(emitted)
+        self.step += 1
+
+        GL.glUseProgram(self.update_shader.glid)
+        self.update_shader.set_uniforms(dict(
+            self.uniforms, dt=dt, emitter=self.emitter, seed=self.step,
+            emit_start=self.emit_start, emit_count=count))
+        target = 1 - self.current
+        GL.glEnable(GL.GL_RASTERIZER_DISCARD)
+        GL.glBindVertexArray(self.update_arrays[self.current])
+        GL.glBindBufferBase(GL.GL_TRANSFORM_FEEDBACK_BUFFER, 0,
+                            self.buffers[target])
+        GL.glBeginTransformFeedback(GL.GL_POINTS)
+        GL.glDrawArrays(GL.GL_POINTS, 0, self.capacity)
+        GL.glEndTransformFeedback()
+        GL.glBindBufferBase(GL.GL_TRANSFORM_FEEDBACK_BUFFER, 0, 0)
+        GL.glDisable(GL.GL_RASTERIZER_DISCARD)
+        self.current = target
+        self.emit_start = (self.emit_start + count) % self.capacity
+
+    def draw(self, **uniforms):
+        """ draw current state as blended billboards, depth tested only """
+        GL.glUseProgram(self.shader.glid)
+        if self.texture is not None:
+            GL.glActiveTexture(GL.GL_TEXTURE0)
+            self.texture.bind()
+            uniforms['diffuse_map'] = 0
+        self.shader.set_uniforms({**self.uniforms, **uniforms})
+        GL.glEnable(GL.GL_BLEND)
+        GL.glBlendFunc(GL.GL_SRC_ALPHA, GL.GL_ONE if self.additive else
+                       GL.GL_ONE_MINUS_SRC_ALPHA)
+        GL.glDepthMask(GL.GL_FALSE)
+        GL.glBindVertexArray(self.draw_arrays[self.current])
+        GL.glDrawArraysInstanced(GL.GL_TRIANGLE_STRIP, 0, 4, self.capacity)
+        GL.glBindVertexArray(0)
+        GL.glDepthMask(GL.GL_TRUE)
+        GL.glDisable(GL.GL_BLEND)
+
+    def render(self, **uniforms):
+        """ one simulation step since last call, then draw """
+        now = glfw.get_time()
+        dt = 0. if self.last_time is None else now - self.last_time
+        self.last_time = now
+        self.update(min(max(dt, 0.), .1))   # clock reset or long stall
+        self.draw(**uniforms)
+
+
+class Emitter:
+    """ Scene graph leaf placing a particle system's emitter: drawn with the
+        scene, it records its world transform and queues the system, which
+        the viewer renders after opaque geometry. A subtree that is culled
+        does not simulate its particles. """
+    def __init__(self, system):
+        self.system = system
+
+    def draw(self, model=None, effects=None, **_uniforms):
+        self.system.emitter = np.asarray(
+            np.identity(4) if model is None else model, np.float32)
+        if effects is not None:
+            effects.append(self.system)
@@ -0,0 +1,184 @@
+# Python built-in modules
+import ctypes                       # buffer offsets & mapped memory copies
+import os                           # os function, i.e. checking file status
+import queue                        # frames handed to the writer thread
+import threading                    # disk writes off the render thread
+
+# External, non built-in modules
+import OpenGL.GL as GL              # standard Python OpenGL wrapper
+import numpy as np                  # all matrix manipulations & OpenGL args
+
+from resources import RESOURCES
+
+
+class ReadbackSlot:
+    """ One pixel pack buffer of the ring, with the fence of its readback """
+    def __init__(self, glid):
+        self.glid = glid          # GL pixel buffer object
+        self.fence = None         # sync object, None when slot is free
+        self.frame = -1           # number of the frame read into it
+
+
+# -------------- asynchronous framebuffer recording ---------------------------
+class FrameRecorder:
+    """ Records the window framebuffer without stalling: each frame is read
+        into the next pixel buffer object of a ring, and copied back only
+        once its fence tells the GPU is done, several frames later. Copies
+        go to a writer thread saving PNG files, or appending to one raw
+        RGBA stream per framebuffer size. If the ring or the writer queue
+        is full, the frame is dropped and counted instead of waiting, as
+        are readbacks in flight when the framebuffer is resized. """
+    def __init__(self, directory, ring=3, encoding='png', queue_size=8):
+        assert encoding in ('png', 'raw'), 'encoding is png or raw'
+        os.makedirs(directory, exist_ok=True)
+        self.directory, self.encoding = directory, encoding
+        self.slots = [ReadbackSlot(glid) for glid in
+                      np.atleast_1d(GL.glGenBuffers(ring))]
+        self.next = 0             # slot receiving the next readback
+        self.size = (0, 0)        # framebuffer size the buffers are sized for
+        self.frame = 0
+        self.stats = dict(recorded=0, written=0, dropped_gpu=0,
+                          dropped_disk=0)
+
+        # writer thread fed through a bounded queue of frames, whose pixel
+        # arrays come from, and return to, a fixed pool: no steady allocation
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.pool = queue.Queue()
+        self.writer = threading.Thread(target=self._write, daemon=True)
+        self.writer.start()
+        RESOURCES.track(self, 0, self._deleter(), 'buffer', evictable=False)
+
+    def _deleter(self):
+        """ release callback of our GL objects, holding no ref to self """
+        glids = [slot.glid for slot in self.slots]
+        return lambda: GL.glDeleteBuffers(len(glids), glids)
+
+    def _resize(self, width, height):
+        """ (re-)size ring buffers & pixel pool for a new framebuffer size,
+            dropping readbacks of the old size still in flight. Queued old
+            size frames are written, but not returned to the new pool """
+        for slot in self.slots:
+            if slot.fence is not None:
+                GL.glDeleteSync(slot.fence)
+                slot.fence = None
+                self.stats['dropped_gpu'] += 1
+        self.size = (width, height)
+        nbytes = 4 * width * height
+        for slot in self.slots:
+            GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, slot.glid)
+            GL.glBufferData(GL.GL_PIXEL_PACK_BUFFER, nbytes, None,
+                            GL.GL_STREAM_READ)
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, 0)
+        self.pool = queue.Queue()
+        for _ in range(self.frames.maxsize + len(self.slots)):
+            self.pool.put(np.empty((height, width, 4), np.uint8))
+        RESOURCES.track(self, nbytes * len(self.slots), self._deleter(),
+                        'buffer', evictable=False)
+
+    def capture(self, width, height):
+        """ queue readback of the current framebuffer, call before swap """
+        if (width, height) != self.size:
+            self._resize(width, height)
+        self._drain()
+        slot = self.slots[self.next]
+        self.frame += 1
+        if slot.fence is not None:            # GPU still busy with it
+            self.stats['dropped_gpu'] += 1
+            return
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, slot.glid)
+        GL.glPixelStorei(GL.GL_PACK_ALIGNMENT, 4)
+        GL.glReadBuffer(GL.GL_BACK)
+        GL.glReadPixels(0, 0, width, height, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE,
+                        ctypes.c_void_p(0))
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, 0)
+        slot.fence = GL.glFenceSync(GL.GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        slot.frame = self.frame
+        self.next = (self.next + 1) % len(self.slots)
+
+    def _drain(self, wait=False):
+        """ hand finished readbacks to writer thread, oldest first """
+        ready = (GL.GL_ALREADY_SIGNALED, GL.GL_CONDITION_SATISFIED)
+        timeout = 10 ** 9 if wait else 0        # in nanoseconds
+        for offset in range(len(self.slots)):
+            slot = self.slots[(self.next + offset) % len(self.slots)]
+            if slot.fence is None:
+                continue
+            flags = GL.GL_SYNC_FLUSH_COMMANDS_BIT if wait else 0
+            if GL.glClientWaitSync(slot.fence, flags, timeout) not in ready:
+                break                           # later slots are newer
+            GL.glDeleteSync(slot.fence)
+            slot.fence = None
+            self._copy(slot)
+
+    def _copy(self, slot):
+        """ copy a finished readback to a pooled array for the writer """
+        try:
+            pixels = self.pool.get_nowait()
+        except queue.Empty:                     # writer too slow
+            self.stats['dropped_disk'] += 1
+            return
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, slot.glid)
+        address = GL.glMapBufferRange(GL.GL_PIXEL_PACK_BUFFER, 0,
+                                      pixels.nbytes, GL.GL_MAP_READ_BIT)
+        ctypes.memmove(pixels.ctypes.data, address, pixels.nbytes)
+        GL.glUnmapBuffer(GL.GL_PIXEL_PACK_BUFFER)
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, 0)
+        try:
+            self.frames.put_nowait((slot.frame, pixels))
+            self.stats['recorded'] += 1
+        except queue.Full:
+            self.pool.put(pixels)
+            self.stats['dropped_disk'] += 1
+
+    def _write(self):
+        """ writer thread: save frames until None is received, or an error
+            stops recording, later frames then being dropped """
+        try:
+            self._encode()
+        except Exception as error:          # e.g. disk full, PIL missing
+            print('Recording to', self.directory, 'stopped:', error)
+
+    def _encode(self):
+        """ encode & save frames until None is received """
+        from PIL import Image           # PNG encoding, loaded when recording
+        stream, shape = None, None
+        try:
+            while True:
+                item = self.frames.get()
+                if item is None:
+                    break
+                frame, pixels = item
+                if self.encoding == 'png':
+                    Image.fromarray(pixels[::-1]).save(os.path.join(
+                        self.directory, 'frame_%06d.png' % frame),
+                        compress_level=1)
+                else:
+                    if pixels.shape != shape:   # one raw file per size
+                        if stream is not None:
+                            stream.close()
+                        shape = pixels.shape
+                        name = 'frames_%dx%d.rgba' % shape[1::-1]
+                        stream = open(os.path.join(self.directory, name),
+                                      'ab')
+                    stream.write(pixels[::-1].tobytes())
+                if pixels.shape[:2] == self.size[::-1]:  # else old pool
+                    self.pool.put(pixels)
+                self.stats['written'] += 1
+        finally:
+            if stream is not None:
+                stream.close()
+
+    def stop(self):
+        """ flush in flight readbacks, wait for the writer to finish, unless
+            it stopped on an error """
+        self._drain(wait=True)
+        while self.writer.is_alive():
+            try:
+                self.frames.put(None, timeout=.1)
+                break
+            except queue.Full:
+                continue
+        self.writer.join()
+        print('Recorded %(recorded)d frames, %(written)d written, dropped '
+              '%(dropped_gpu)d (GPU) %(dropped_disk)d (disk)' % self.stats,
+              'to', self.directory)
@@ -0,0 +1,155 @@
+# Python built-in modules
+from collections import deque       # recent GPU frame times
+
+# External, non built-in modules
+import OpenGL.GL as GL              # standard Python OpenGL wrapper
+import numpy as np                  # all matrix manipulations & OpenGL args
+
+from resources import RESOURCES
+
+
+# -------------- GPU frame timing without stalls ------------------------------
+class GpuTimer:
+    """ GL_TIME_ELAPSED queries in a small ring: a query is read back
+        several frames after it was issued, once its result is available,
+        so timing never makes the CPU wait on the GPU """
+    def __init__(self, depth=4):
+        self.glids = list(GL.glGenQueries(depth))
+        self.pending = deque()    # issued queries, oldest first
+        self.free = deque(self.glids)
+        self.active = None        # query timing the current frame
+        RESOURCES.track(self, 0, lambda glids=self.glids: GL.glDeleteQueries(
+            len(glids), glids), 'query', evictable=False)
+
+    def begin(self):
+        """ start timing GPU commands, unless every query is in flight """
+        self.active = self.free.popleft() if self.free else None
+        if self.active is not None:
+            GL.glBeginQuery(GL.GL_TIME_ELAPSED, self.active)
+
+    def end(self):
+        """ stop timing, return list of ms durations of finished frames """
+        if self.active is not None:
+            GL.glEndQuery(GL.GL_TIME_ELAPSED)
+            self.pending.append(self.active)
+        durations = []
+        while self.pending and GL.glGetQueryObjectuiv(
+                self.pending[0], GL.GL_QUERY_RESULT_AVAILABLE):
+            glid = self.pending.popleft()
+            nanoseconds = GL.glGetQueryObjectui64v(glid, GL.GL_QUERY_RESULT)
+            durations.append(int(np.ravel(nanoseconds)[0]) * 1e-6)
+            self.free.append(glid)
+        return durations
+
+
+# -------------- offscreen scene rendering at an adaptive scale ---------------
+class DynamicResolution:
+    """ Renders the scene to an offscreen framebuffer at a fraction of the
+        window resolution, adjusted from measured GPU frame time toward a
+        target, then upscaled to the window with a linear filtered blit.
+        The framebuffer is allocated at max_scale, so scale changes only
+        move the viewport. A change happens when the averaged GPU time
+        leaves the target band by more than hysteresis, and no sooner than
+        cooldown frames after the previous change, to avoid oscillation. """
+    def __init__(self, target_ms=1000 / 60, min_scale=.5, max_scale=1.,
+                 hysteresis=.1, max_step=.1, average=8, cooldown=15):
+        self.target_ms, self.hysteresis = target_ms, hysteresis
+        self.min_scale, self.max_scale = min_scale, max_scale
+        self.max_step, self.cooldown = max_step, cooldown
+        self.scale = max_scale
+        self.times = deque(maxlen=average)
+        self.since_change = 0
+        self.timer = GpuTimer()
+        self.enabled = True
+        self.stats = dict(scale=self.scale, gpu_ms=0., changes=0)
+        self.size = (0, 0)        # allocated framebuffer size, in pixels
+        self.fbo = GL.glGenFramebuffers(1)
+        self.color, self.depth = GL.glGenTextures(1), GL.glGenRenderbuffers(1)
+        RESOURCES.track(self, 0, self._deleter(), 'framebuffer',
+                        evictable=False)
+
+    def _deleter(self):
+        """ release callback of our GL objects, holding no ref to self """
+        fbo, color, depth = self.fbo, self.color, self.depth
+        return lambda: (GL.glDeleteFramebuffers(1, [fbo]),
+                        GL.glDeleteTextures([color]),
+                        GL.glDeleteRenderbuffers(1, [depth]))
+
+    def allocate(self, width, height):
+        """ (re-)create framebuffer storage for a max_scale render """
+        self.size = (width, height)
+        full = [max(int(side * self.max_scale), 1) for side in self.size]
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self.color)
+        GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA8, *full, 0,
+                        GL.GL_RGBA, GL.GL_UNSIGNED_BYTE, None)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER,
+                           GL.GL_LINEAR)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER,
+                           GL.GL_LINEAR)
+        GL.glBindRenderbuffer(GL.GL_RENDERBUFFER, self.depth)
+        GL.glRenderbufferStorage(GL.GL_RENDERBUFFER, GL.GL_DEPTH_COMPONENT24,
+                                 *full)
+        GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, self.fbo)
+        GL.glFramebufferTexture2D(GL.GL_FRAMEBUFFER, GL.GL_COLOR_ATTACHMENT0,
+                                  GL.GL_TEXTURE_2D, self.color, 0)
+        GL.glFramebufferRenderbuffer(GL.GL_FRAMEBUFFER,
+                                     GL.GL_DEPTH_ATTACHMENT,
+                                     GL.GL_RENDERBUFFER, self.depth)
+        status = GL.glCheckFramebufferStatus(GL.GL_FRAMEBUFFER)
+        assert status == GL.GL_FRAMEBUFFER_COMPLETE, 'incomplete framebuffer'
+        GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, 0)
+        RESOURCES.track(self, (4 + 4) * full[0] * full[1], self._deleter(),
+                        'framebuffer', evictable=False)
+
+    def viewport(self):
+        """ rendered area size in pixels, at current scale """
+        return [max(int(side * self.scale), 1) for side in self.size]
+
+    def begin(self, width, height):
+        """ redirect rendering of a width x height frame to our framebuffer,
+            call before clearing """
+        if not self.enabled:
+            GL.glViewport(0, 0, width, height)
+            return
+        if (width, height) != self.size:
+            self.allocate(width, height)
+        GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, self.fbo)
+        GL.glViewport(0, 0, *self.viewport())
+        self.timer.begin()
+
+    def end(self):
+        """ upscale rendered area to the window, adapt scale for next frame """
+        if not self.enabled:
+            return
+        durations = self.timer.end()  # scene only, blit cost is constant
+        GL.glBindFramebuffer(GL.GL_READ_FRAMEBUFFER, self.fbo)
+        GL.glBindFramebuffer(GL.GL_DRAW_FRAMEBUFFER, 0)
+        GL.glBlitFramebuffer(0, 0, *self.viewport(), 0, 0, *self.size,
+                             GL.GL_COLOR_BUFFER_BIT, GL.GL_LINEAR)
+        GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, 0)
+        GL.glViewport(0, 0, *self.size)
+        self.adapt(durations)
+
+    def adapt(self, durations):
+        """ pick next scale from averaged GPU times of finished frames """
+        self.times.extend(durations)
+        self.since_change += 1
+        if not self.times:
+            return
+        gpu_ms = sum(self.times) / len(self.times)
+        self.stats['gpu_ms'] = gpu_ms
+        error = gpu_ms / self.target_ms
+        if (abs(error - 1) <= self.hysteresis or self.since_change <
+                self.cooldown or len(self.times) < self.times.maxlen):
+            return
+
+        # GPU time roughly follows the pixel count, i.e. the squared scale
+        scale = self.scale / np.sqrt(error)
+        scale = np.clip(scale, self.scale - self.max_step,
+                        self.scale + self.max_step)
+        scale = float(np.clip(scale, self.min_scale, self.max_scale))
+        if abs(scale - self.scale) > 1e-3:
+            self.scale = scale
+            self.times.clear()    # times measured at old scale are stale
+            self.since_change = 0
+            self.stats.update(scale=scale, changes=self.stats['changes'] + 1)
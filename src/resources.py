@@ -0,0 +1,115 @@
+# Python built-in modules
+import weakref                      # track resources without keeping them alive
+from collections import OrderedDict, defaultdict
+
+
+# ------------ GPU memory accounting & deterministic release ------------------
+class Record:
+    """ Bookkeeping of one GPU resource: size, origin, GL deleter, last use """
+    def __init__(self, ref, kind, source, evictable):
+        self.ref = ref                # weak reference to the owning object
+        self.kind = kind              # 'buffer', 'texture', 'program'...
+        self.source = source          # asset file it comes from, if any
+        self.evictable = evictable    # owner can re-create its GL objects
+        self.nbytes = 0               # bytes currently resident on the GPU
+        self.resident = False         # GL objects exist for this resource
+        self.deleter = None           # frees owner's GL objects, no owner ref
+        self.last_frame = -1          # last frame the resource was drawn
+
+
+class ResourceManager:
+    """ Accounts bytes of every GPU buffer and texture, enforces a VRAM budget
+        by evicting least recently drawn resources, and frees GL objects only
+        at well defined points where the OpenGL context is known current. """
+    def __init__(self, budget=None):
+        self.budget = budget              # max. resident bytes, None: no limit
+        self.records = OrderedDict()      # id -> Record, least recent first
+        self.pending = []                 # deleters of garbage collected owners
+        self.frame = 0
+        self.closed = False
+
+    def track(self, owner, nbytes, deleter, kind, source=None, evictable=True):
+        """ (re-)declare owner's GL objects once uploaded, with their size """
+        key = id(owner)
+        record = self.records.get(key)
+        if record is None:
+            ref = weakref.ref(owner, lambda _, key=key: self._collected(key))
+            record = self.records[key] = Record(ref, kind, source, evictable)
+        record.nbytes, record.deleter = nbytes, deleter
+        record.resident = True
+        record.last_frame = self.frame
+        self.records.move_to_end(key)
+
+    def touch(self, owner):
+        """ owner is drawn this frame, making it the most recently used """
+        record = self.records.get(id(owner))
+        if record is not None and record.last_frame != self.frame:
+            record.last_frame = self.frame
+            self.records.move_to_end(id(owner))
+
+    def evicted(self, owner):
+        """ owner released its GL objects but can restore them on demand """
+        record = self.records.get(id(owner))
+        if record is not None:
+            record.nbytes, record.deleter, record.resident = 0, None, False
+
+    def _collected(self, key):
+        """ owner was garbage collected: delete its GL objects later on """
+        record = self.records.pop(key, None)
+        if record is not None and record.deleter and not self.closed:
+            self.pending.append(record.deleter)
+
+    @property
+    def used(self):
+        """ total bytes currently resident on the GPU """
+        return sum(record.nbytes for record in self.records.values())
+
+    def collect(self):
+        """ end of frame: free dead resources, evict down to budget """
+        for deleter in self.pending:
+            deleter()
+        self.pending.clear()
+
+        if self.budget is not None:
+            used = self.used
+            for record in list(self.records.values()):
+                if used <= self.budget:
+                    break
+                owner = record.ref()
+                if (owner is not None and record.evictable and record.nbytes
+                        and record.last_frame < self.frame):
+                    used -= record.nbytes
+                    owner.evict()
+        self.frame += 1
+
+    def release_all(self):
+        """ free every GL object still alive, while context is still current """
+        for deleter in self.pending:
+            deleter()
+        for record in self.records.values():
+            if record.deleter:
+                record.deleter()
+            record.nbytes, record.deleter, record.resident = 0, None, False
+        self.pending.clear()
+        self.closed = True
+
+    def report(self):
+        """ per asset file summary of resident and evicted GPU resources """
+        files = defaultdict(lambda: [0, 0, 0])  # bytes, resources, evicted
+        for record in self.records.values():
+            entry = files[record.source or '<generated>']
+            entry[0] += record.nbytes
+            entry[1] += 1
+            entry[2] += not record.resident
+        lines = ['%8.2f MB %4d resources %4d evicted  %s' %
+                 (nbytes / 2**20, count, evicted, source) for source,
+                 (nbytes, count, evicted) in sorted(files.items(),
+                                                    key=lambda i: -i[1][0])]
+        budget = 'none' if self.budget is None else \
+            '%.1f MB' % (self.budget / 2**20)
+        lines.append('%8.2f MB total GPU memory, budget %s' %
+                     (self.used / 2**20, budget))
+        return '\n'.join(lines)
+
+
+RESOURCES = ResourceManager()
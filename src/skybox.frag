@@ -0,0 +1,11 @@
+#version 330 core
+
+uniform samplerCube sky_map;
+
+in vec3 direction;
+
+out vec4 out_color;
+
+void main() {
+    out_color = texture(sky_map, direction);
+}
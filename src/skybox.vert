@@ -0,0 +1,22 @@
+#version 330 core
+
+// ---- frame globals, one uniform buffer shared by all programs
+layout(std140, row_major) uniform Frame {
+    mat4 view, projection;
+    vec3 w_camera_position;
+    float time;
+    vec3 light_dir;
+};
+
+// ---- unit cube corners, used as cube map look up directions
+in vec3 position;
+
+out vec3 direction;
+
+void main() {
+    direction = position;
+
+    // rotation only camera, and z = w to land exactly on the far plane
+    vec4 clip_position = projection * mat4(mat3(view)) * vec4(position, 1);
+    gl_Position = clip_position.xyww;
+}
@@ -0,0 +1,344 @@
+# Python built-in modules
+import os                           # os function, i.e. checking file status
+import sys                          # source files of stored classes
+import time                         # pacing of streamed subtree builds
+
+# External, non built-in modules
+import numpy as np                  # all matrix manipulations & OpenGL args
+
+from core import Node, Mesh, Shader, VertexArray, transform_bounds
+from layout import VertexLayout
+from pack import PackWriter, PackReader, stamp
+from texture import Texture, CubeMap, Textured
+from atlas import TextureAtlas, ArrayTextured
+from animation import KeyFrameControlNode, Skinned
+from motion import Path
+from transform import identity
+
+MAGIC = b'SNAPSHOT'
+VERSION = 2                         # bump when snapshot records change
+
+
+def plain(value):
+    """ JSON friendly copy of a uniform value, None if it has no such form """
+    if isinstance(value, (bool, int, float, str)):
+        return value
+    try:
+        array = np.asarray(value, np.float64)
+    except (TypeError, ValueError):
+        return None
+    return array.tolist() if array.dtype.kind == 'f' else None
+
+
+# -------------- scene graph to single file snapshot --------------------------
+class SnapshotWriter:
+    """ Serializes top level subtrees to one file: JSON records for nodes,
+        drawables, shared shaders and textures, raw packed GPU arrays. Nodes
+        and drawables of classes with their own draw() (e.g. Ocean) or
+        key_handler() (e.g. interactive texture modes) are procedural, they
+        are skipped and should be re-created by the app. """
+    NODE_TYPES = (Node, KeyFrameControlNode)
+    DRAWABLE_TYPES = (Mesh, Textured, ArrayTextured, Skinned)
+
+    def __init__(self):
+        self.pack = PackWriter(MAGIC)
+        self.shaders, self.textures = {}, {}   # key -> index in lists below
+        self.contents = dict(version=VERSION, shaders=[], textures=[],
+                             subtrees=[])
+        self.skipped = set()
+        self.files = set()        # sources the recorded scene depends on
+
+    def shader(self, shader):
+        """ index of shader in the shared shader table """
+        if shader.sources not in self.shaders:
+            self.shaders[shader.sources] = len(self.contents['shaders'])
+            self.contents['shaders'].append(list(shader.sources))
+            self.files.update(source for source in shader.sources
+                              if source and os.path.exists(source))
+        return self.shaders[shader.sources]
+
+    def texture(self, texture):
+        """ index of texture in the shared texture table """
+        record = dict(kind=type(texture).__name__, file=texture.tex_file,
+                      modes=[int(mode) for mode in texture.modes],
+                      type=int(texture.type))
+        key = repr(record)
+        if key not in self.textures:
+            self.textures[key] = len(self.contents['textures'])
+            self.contents['textures'].append(record)
+            self.files.add(texture.tex_file)
+        return self.textures[key]
+
+    def supported(self, item, types):
+        """ item draws & handles keys as one of the base types, else it is
+            skipped """
+        cls = type(item)
+        if any(cls.draw is base.draw and getattr(cls, 'key_handler', None) is
+               getattr(base, 'key_handler', None) for base in types):
+            return True
+        self.skipped.add(type(item).__name__)
+        return False
+
+    def add_subtree(self, root):
+        """ record root's subtree: nodes depth first, then drawables """
+        nodes, node_ids, drawables, drawable_ids = [], {}, [], {}
+
+        def visit_node(node):
+            node_ids[id(node)] = len(nodes)
+            record = dict(transform=np.asarray(node.transform).tolist(),
+                          occlusion_test=node.occlusion_test, children=[])
+            nodes.append(record)
+            if isinstance(node, KeyFrameControlNode):
+                record['keyframes'] = self.keyframes(node)
+            for child in node.children:
+                if isinstance(child, Node):
+                    if self.supported(child, self.NODE_TYPES):
+                        record['children'].append(('node', visit_node(child)))
+                elif self.supported(child, self.DRAWABLE_TYPES):
+                    record['children'].append(('drawable', child))
+            return node_ids[id(node)]
+
+        def visit_drawable(drawable):
+            """ index of drawable record, inner decorated drawables first """
+            if id(drawable) in drawable_ids:
+                return drawable_ids[id(drawable)]
+            if isinstance(drawable, Mesh):
+                array = drawable.vertex_array
+                record = dict(
+                    kind='mesh', shader=self.shader(drawable.shader),
+                    uniforms={name: plain(value) for name, value
+                              in drawable.uniforms.items()
+                              if plain(value) is not None},
+                    layout=array.layout.describe(),
+                    vertices=self.pack.add(array.vertices.view(np.uint8)),
+                    index=None if array.index is None else
+                    self.pack.add(array.index),
+                    bounds=None if array.bounds is None else
+                    np.asarray(array.bounds).tolist(),
+                    source=array.source)
+                self.files.add(array.source)
+            elif isinstance(drawable, Textured):
+                record = dict(kind='textured',
+                              drawable=visit_drawable(drawable.drawable),
+                              textures={name: self.texture(texture) for
+                                        name, texture in
+                                        drawable.textures.items()})
+            elif isinstance(drawable, ArrayTextured):
+                record = dict(kind='layered',
+                              drawable=visit_drawable(drawable.drawable),
+                              file=drawable.layer.file, name=drawable.name)
+                self.files.add(drawable.layer.file)
+            else:
+                record = dict(kind='skinned',
+                              drawable=visit_drawable(drawable.mesh),
+                              bones=[node_ids[id(node)] for node
+                                     in drawable.bone_nodes],
+                              offsets=self.pack.add(drawable.bone_offsets))
+            drawable_ids[id(drawable)] = len(drawables)
+            drawables.append(record)
+            return drawable_ids[id(drawable)]
+
+        visit_node(root)
+        for record in nodes:
+            record['children'] = [(kind, child if kind == 'node' else
+                                   visit_drawable(child))
+                                  for kind, child in record['children']]
+        # keyframed nodes leave their saved pose: no box, built on first draw
+        animated = any('keyframes' in record for record in nodes)
+        box = None if animated else root.bounds
+        self.contents['subtrees'].append(dict(
+            nodes=nodes, drawables=drawables,
+            bounds=None if box is None else box.tolist()))
+
+    def keyframes(self, node):
+        """ translation, rotation & scale keys or paths of a keyframed node """
+        keyframes = node.keyframes
+        tracks = [dict(path=keys.describe()) if isinstance(keys, Path) else
+                  dict(times=self.pack.add(np.array(keys.times, np.float64)),
+                       values=self.pack.add(np.array(keys.values, np.float32)))
+                  for keys in (keyframes.translate_keys, keyframes.rotate_keys,
+                               keyframes.scale_keys)]
+        name = node.name if isinstance(node.name, str) else None
+        return dict(tracks=tracks, boucle=keyframes.boucle, name=name)
+
+    def write(self, path, code=()):
+        """ write snapshot file, stamping the sources it was built from and
+            the code files that built it """
+        files = (self.files | set(code_files(code))) - {None}
+        self.contents['stamps'] = {file: stamp(file) for file in sorted(files)
+                                   if os.path.exists(file)}
+        self.pack.write(path, self.contents)
+
+
+def code_files(extra=()):
+    """ source files of the classes a snapshot stores, and extra files """
+    classes = (*SnapshotWriter.NODE_TYPES, *SnapshotWriter.DRAWABLE_TYPES,
+               VertexLayout, Path, SnapshotWriter)
+    return sorted({sys.modules[cls.__module__].__file__ for cls in classes} |
+                  set(extra))
+
+
+def current(path, code=()):
+    """ True if snapshot at path has our version, and none of its sources
+        or code files changed since it was saved """
+    try:
+        contents = PackReader(path, MAGIC).contents
+    except (OSError, ValueError):
+        return False
+    stamps = contents.get('stamps', {})
+    if contents.get('version') != VERSION or \
+            not set(code_files(code)) <= stamps.keys():
+        return False
+    return all(os.path.exists(file) and stamp(file) == value
+               for file, value in stamps.items())
+
+
+def save(path, roots, code=()):
+    """ snapshot each of the given subtree roots to path, code lists the
+        files of the app code building them, checked by current() """
+    writer = SnapshotWriter()
+    for root in roots:
+        writer.add_subtree(root)
+    writer.write(path, code)
+    if writer.skipped:
+        print('Snapshot %s skips procedural %s' % (path, ', '.join(
+            sorted(writer.skipped))))
+    print('Saved', path, '\t(%d subtrees, %d shaders, %d textures)' % (
+        len(roots), len(writer.shaders), len(writer.textures)))
+
+
+# -------------- lazy snapshot restore ----------------------------------------
+class SnapshotReader:
+    """ Rebuilds subtrees of a memory mapped snapshot on demand. Vertex and
+        index buffers are uploaded straight from the mapping, shaders and
+        textures are created once, by the first subtree using them. Far
+        subtrees stream in one at a time, nearest first, interval seconds
+        apart. """
+    def __init__(self, path, interval=.05):
+        self.pack = PackReader(path, MAGIC)
+        self.contents = self.pack.contents
+        self.shaders = [None] * len(self.contents['shaders'])
+        self.textures = [None] * len(self.contents['textures'])
+        self.atlas = TextureAtlas()   # texture arrays of layered drawables
+        self.waiting = {}             # far lazy node -> its camera distance
+        self.interval = interval
+        self.last = time.perf_counter()   # end of the last subtree build
+
+    def due(self, node, distance):
+        """ True if far node, at distance from the camera, is to be built
+            now: nearest of the waiting ones, with the interval elapsed """
+        self.waiting[node] = distance
+        return (time.perf_counter() - self.last >= self.interval and
+                distance <= min(self.waiting.values()))
+
+    def shader(self, index):
+        if self.shaders[index] is None:
+            self.shaders[index] = Shader(*self.contents['shaders'][index])
+        return self.shaders[index]
+
+    def texture(self, index):
+        if self.textures[index] is None:
+            record = self.contents['textures'][index]
+            if record['kind'] == 'CubeMap':
+                texture = CubeMap(record['file'], *record['modes'][1:])
+            else:
+                texture = Texture(record['file'], *record['modes'],
+                                  record['type'])
+            self.textures[index] = texture
+        return self.textures[index]
+
+    def build(self, subtree):
+        """ root node of the given subtree index, with all its content """
+        records = self.contents['subtrees'][subtree]
+        nodes = [self.node(record) for record in records['nodes']]
+        drawables = []
+        for record in records['drawables']:
+            drawables.append(self.drawable(record, nodes, drawables))
+        for node, record in zip(nodes, records['nodes']):
+            node.add(*((nodes if kind == 'node' else drawables)[child]
+                       for kind, child in record['children']))
+        self.last = time.perf_counter()
+        return nodes[0]
+
+    def node(self, record):
+        transform = np.array(record['transform'], np.float32)
+        keyframes = record.get('keyframes')
+        if keyframes is None:
+            node = Node(transform=transform)
+        else:
+            tracks = [Path.from_description(track['path']) if 'path' in track
+                      else dict(zip(self.pack.array(track['times']),
+                                    self.pack.array(track['values'])))
+                      for track in keyframes['tracks']]
+            node = KeyFrameControlNode(*tracks, keyframes['name'], transform)
+            node.keyframes.boucle = keyframes['boucle']
+        node.occlusion_test = record['occlusion_test']
+        return node
+
+    def drawable(self, record, nodes, drawables):
+        if record['kind'] == 'textured':
+            return Textured(drawables[record['drawable']], **{
+                name: self.texture(index)
+                for name, index in record['textures'].items()})
+        if record['kind'] == 'layered':
+            return self.atlas.decorate(drawables[record['drawable']],
+                                       record['file'], record['name'])
+        if record['kind'] == 'skinned':
+            return Skinned(drawables[record['drawable']],
+                           [nodes[bone] for bone in record['bones']],
+                           self.pack.array(record['offsets']))
+        layout = VertexLayout.from_description(record['layout'])
+        vertices = self.pack.array(record['vertices']).view(layout.dtype)
+        bounds = record['bounds']
+        shader = self.shader(record['shader'])
+        vertex_array = VertexArray.from_packed(
+            shader, layout, vertices, self.pack.array(record['index']),
+            None if bounds is None else np.array(bounds, np.float32),
+            source=record['source'])
+        return Mesh.from_vertex_array(shader, vertex_array, record['uniforms'])
+
+
+class LazyNode(Node):
+    """ Placeholder of a snapshot subtree, built on first draw with the
+        camera within radius of its box: start up only pays for what is near,
+        farther ones stream in next, paced by the reader. Subtrees saved
+        without a box, such as animated ones, are built on first draw """
+    def __init__(self, reader, subtree, radius=150.):
+        super().__init__()
+        self.reader, self.subtree, self.radius = reader, subtree, radius
+        box = reader.contents['subtrees'][subtree]['bounds']
+        self.box = None if box is None else np.array(box, np.float32)
+        self.materialized = False
+
+    def materialize(self):
+        """ build the subtree now, if not done yet """
+        if not self.materialized:
+            self.add(self.reader.build(self.subtree))
+            self.materialized = True
+            self.reader.waiting.pop(self, None)
+
+    def draw(self, model=None, **other_uniforms):
+        model = identity() if model is None else model
+        if not self.materialized:
+            camera = other_uniforms.get('w_camera_position')
+            camera = None if camera is None else np.asarray(camera)[:3]
+            box = None if self.box is None else \
+                transform_bounds(self.box, model @ self.transform)
+            distance = 0. if box is None or camera is None else \
+                np.linalg.norm(np.maximum(box[0] - camera, 0) +
+                               np.maximum(camera - box[1], 0))
+            if distance <= self.radius or self.reader.due(self, distance):
+                self.materialize()
+        super().draw(model=model, **other_uniforms)
+
+    def local_bounds(self):
+        return super().local_bounds() if self.materialized else self.box
+
+
+def restore(path, radius=150.):
+    """ lazily restored subtrees of snapshot file, as nodes to add to scene """
+    reader = SnapshotReader(path)
+    print('Restoring', path, '\t(%d subtrees)' % len(
+        reader.contents['subtrees']))
+    return [LazyNode(reader, subtree, radius)
+            for subtree in range(len(reader.contents['subtrees']))]
@@ -0,0 +1,71 @@
+""" Startup trace: wall time spent in each startup phase, from the first
+    import of this module up to the first presented frame. Import it first
+    so module imports are measured; python -X importtime viewer.py gives
+    the per module detail. """
+# Python built-in modules
+import time                         # phase timing
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class StartupTrace:
+    """ Phase durations, nested phases not counted in their parent phase """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.seconds = defaultdict(float)   # phase name -> seconds
+        self.stack = []                     # [name, start, nested seconds]
+        self.finished = False
+
+    def begin(self, name):
+        """ start timing a phase, ended by the matching end() call """
+        if not self.finished:
+            self.stack.append([name, time.perf_counter(), 0.])
+
+    def end(self):
+        """ end innermost phase, its time is not counted in enclosing ones """
+        if self.finished or not self.stack:
+            return
+        name, start, nested = self.stack.pop()
+        elapsed = time.perf_counter() - start
+        self.seconds[name] += elapsed - nested
+        if self.stack:
+            self.stack[-1][2] += elapsed
+
+    @contextmanager
+    def phase(self, name):
+        """ add time spent in the with block to the named phase """
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end()
+
+    def since_start(self, name):
+        """ time since trace start not yet in any phase goes to name """
+        if not self.finished:
+            self.seconds[name] += self.elapsed() - sum(self.seconds.values())
+
+    def elapsed(self):
+        """ seconds since trace start """
+        return time.perf_counter() - self.start
+
+    def finish(self):
+        """ end open phases & tracing, print each phase share of startup """
+        if self.finished:
+            return
+        while self.stack:
+            self.end()
+        self.finished = True
+        total = self.elapsed()
+        print(self.report(total))
+
+    def report(self, total):
+        """ one line summary of phase durations over total seconds """
+        other = total - sum(self.seconds.values())
+        phases = list(self.seconds.items()) + [('other', other)]
+        return 'Startup %.2fs: ' % total + ', '.join(
+            '%s %.2fs (%d%%)' % (name, seconds, 100 * seconds / total)
+            for name, seconds in phases)
+
+
+STARTUP = StartupTrace()
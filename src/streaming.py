@@ -0,0 +1,123 @@
+# Python built-in modules
+import ctypes                       # raw copies to mapped buffer memory
+
+# External, non built-in modules
+import OpenGL.GL as GL              # standard Python OpenGL wrapper
+import numpy as np                  # all matrix manipulations & OpenGL args
+
+from resources import RESOURCES
+
+# offsets bound as buffer ranges must be multiples of these limits
+OFFSET_ALIGNMENTS = {
+    GL.GL_UNIFORM_BUFFER: GL.GL_UNIFORM_BUFFER_OFFSET_ALIGNMENT,
+    GL.GL_SHADER_STORAGE_BUFFER: GL.GL_SHADER_STORAGE_BUFFER_OFFSET_ALIGNMENT,
+}
+PERSISTENT = (GL.GL_MAP_WRITE_BIT | GL.GL_MAP_PERSISTENT_BIT |
+              GL.GL_MAP_COHERENT_BIT)
+
+
+def persistent_supported():
+    """ True if context has immutable, persistently mappable storage """
+    version = (GL.glGetIntegerv(GL.GL_MAJOR_VERSION),
+               GL.glGetIntegerv(GL.GL_MINOR_VERSION))
+    return version >= (4, 4) and bool(GL.glBufferStorage)
+
+
+# -------------- ring buffers for per frame dynamic data ----------------------
+class StreamBuffer:
+    """ Buffer split in a ring of regions, one per frame in flight: the CPU
+        writes the frame being built to one region while the GPU still
+        reads the previous ones, a fence per region telling when it can be
+        reused. Writes return an offset, bound as a buffer range or used as
+        indirect offset. On 4.4+ contexts the buffer is mapped once,
+        persistently, and writes are plain memory copies; otherwise each
+        write is a glBufferSubData to a region the GPU is done with. """
+    def __init__(self, target, frame_bytes, frames=3):
+        self.target, self.frames = target, frames
+        self.persistent = persistent_supported()
+        self.alignment = max(GL.glGetIntegerv(OFFSET_ALIGNMENTS[target]), 4) \
+            if target in OFFSET_ALIGNMENTS else 4
+        self.fences = [None] * frames
+        self.region, self.start, self.cursor = frames - 1, 0, 0
+        self.needed = 0           # bytes asked during frame, to grow if over
+        self.stats = dict(stream_kb=0., stalls=0)
+        self.glid, self.address = None, None
+        self._create(frame_bytes)
+
+    def _create(self, frame_bytes):
+        """ allocate frames regions of frame_bytes, mapped if persistent """
+        self.frame_bytes = self._aligned(frame_bytes)
+        size = self.frame_bytes * self.frames
+        self.glid = GL.glGenBuffers(1)
+        GL.glBindBuffer(self.target, self.glid)
+        if self.persistent:
+            GL.glBufferStorage(self.target, size, None, PERSISTENT)
+            self.address = ctypes.cast(GL.glMapBufferRange(
+                self.target, 0, size, PERSISTENT), ctypes.c_void_p).value
+        else:
+            GL.glBufferData(self.target, size, None, GL.GL_STREAM_DRAW)
+        GL.glBindBuffer(self.target, 0)
+        RESOURCES.track(self, size, lambda glid=self.glid:
+                        GL.glDeleteBuffers(1, [glid]), 'buffer',
+                        evictable=False)
+
+    def _aligned(self, offset):
+        """ offset rounded up to the next multiple of our alignment """
+        return -(-offset // self.alignment) * self.alignment
+
+    def _wait(self, region):
+        """ block until the GPU is done reading region, counting stalls """
+        fence = self.fences[region]
+        if fence is None:
+            return
+        ready = (GL.GL_ALREADY_SIGNALED, GL.GL_CONDITION_SATISFIED)
+        if GL.glClientWaitSync(fence, 0, 0) not in ready:
+            self.stats['stalls'] += 1
+            while GL.glClientWaitSync(fence, GL.GL_SYNC_FLUSH_COMMANDS_BIT,
+                                      10 ** 9) not in ready:
+                pass
+        GL.glDeleteSync(fence)
+        self.fences[region] = None
+
+    def begin_frame(self, nbytes=0):
+        """ move on to the next region, growing the ring first if last frame
+            or this one, needing nbytes, does not fit in a region """
+        needed = max(nbytes, self.needed)
+        if needed > self.frame_bytes:
+            for region in range(self.frames):
+                self._wait(region)
+            GL.glDeleteBuffers(1, [self.glid])
+            self._create(max(needed, 2 * self.frame_bytes))
+        self.region = (self.region + 1) % self.frames
+        self._wait(self.region)
+        self.start = self.cursor = self.region * self.frame_bytes
+        self.stats['stream_kb'] = self.needed / 1024
+        self.needed = 0
+
+    def end_frame(self):
+        """ fence region, signaled once the GPU is done reading it """
+        self.fences[self.region] = GL.glFenceSync(
+            GL.GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+
+    def write(self, data, nbytes=None):
+        """ copy data array to this frame's region, reserving nbytes if more,
+            and return its offset in buffer, None if the region is full """
+        data = np.ascontiguousarray(data)
+        offset = self._aligned(self.cursor)
+        end = offset + max(nbytes or 0, data.nbytes)
+        self.needed += end - self.cursor
+        if end > self.start + self.frame_bytes:
+            return None
+        self.cursor = end
+        if self.persistent:
+            ctypes.memmove(self.address + offset, data.ctypes.data,
+                           data.nbytes)
+        else:
+            GL.glBindBuffer(self.target, self.glid)
+            GL.glBufferSubData(self.target, offset, data.nbytes, data)
+            GL.glBindBuffer(self.target, 0)
+        return offset
+
+    def bind_range(self, index, offset, nbytes):
+        """ bind written range to an indexed binding point of our target """
+        GL.glBindBufferRange(self.target, index, self.glid, offset, nbytes)
@@ -0,0 +1,343 @@
+# Python built-in modules
+import ctypes                       # buffer offsets for index ranges
+from collections import OrderedDict
+
+# External, non built-in modules
+import OpenGL.GL as GL              # standard Python OpenGL wrapper
+import numpy as np                  # all matrix manipulations & OpenGL args
+
+from bvh import ray_boxes
+from core import Node, VertexArray
+from layout import pack_vertices
+from resources import RESOURCES
+from transform import identity
+
+# edge bits of a chunk whose neighbour across that edge is one level coarser
+NORTH, SOUTH, WEST, EAST = 1, 2, 4, 8
+NEIGHBOURS = ((NORTH, -1, 0), (SOUTH, 1, 0), (WEST, 0, -1), (EAST, 0, 1))
+
+
+def heightmap_from_image(file, height_scale=1., offset=0.):
+    """ heights from a grey level image file, in [offset, offset + scale] """
+    from PIL import Image           # load height maps, on first use
+    with Image.open(file) as image:
+        grey = np.asarray(image.convert('I;16') if image.mode == 'I;16'
+                          else image.convert('L'), np.float32)
+    return offset + height_scale * grey / (65535 if grey.max() > 255 else 255)
+
+
+def grid_triangles(cells):
+    """ (cells^2 * 2, 3) triangles of a (cells+1)^2 vertex grid, facing +y """
+    corner = (np.arange(cells)[:, None] * (cells + 1) +
+              np.arange(cells)[None, :]).ravel()
+    return np.stack((corner, corner + cells + 1, corner + 1,
+                     corner + 1, corner + cells + 1, corner + cells + 2),
+                    axis=-1).reshape(-1, 3)
+
+
+def stitched_triangles(cells, mask):
+    """ grid triangles with odd vertices of edges in mask collapsed onto
+        their even neighbour: those edges match the next coarser level """
+    remap = np.arange((cells + 1) ** 2).reshape(cells + 1, cells + 1)
+    odd = np.arange(1, cells, 2)
+    if mask & NORTH:
+        remap[0, odd] = remap[0, odd - 1]
+    if mask & SOUTH:
+        remap[cells, odd] = remap[cells, odd - 1]
+    if mask & WEST:
+        remap[odd, 0] = remap[odd - 1, 0]
+    if mask & EAST:
+        remap[odd, cells] = remap[odd - 1, cells]
+    triangles = remap.ravel()[grid_triangles(cells)]
+    degenerate = ((triangles[:, 0] == triangles[:, 1]) |
+                  (triangles[:, 1] == triangles[:, 2]) |
+                  (triangles[:, 2] == triangles[:, 0]))
+    return triangles[~degenerate]
+
+
+# -------------- chunk geometry, shares one index buffer ----------------------
+class ChunkArray(VertexArray):
+    """ Vertex array of one terrain chunk, drawn with any of the 16 stitching
+        variants of the index buffer shared by all chunks """
+    def __init__(self, terrain, attributes, bounds):
+        self.terrain = terrain
+        layout, vertices = pack_vertices(attributes)
+        self.setup(terrain.shader, layout, vertices, None, bounds,
+                   GL.GL_STATIC_DRAW, None)
+
+    def upload(self):
+        """ vertex array object with its own vertices & the shared index """
+        super().upload()
+        GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, self.terrain.index_buffer)
+        GL.glBindVertexArray(0)
+
+    def execute_variant(self, mask):
+        """ draw chunk triangles, stitched on the edges given by mask """
+        if self.glid is None:
+            self.upload()
+        RESOURCES.touch(self)
+        GL.glBindVertexArray(self.glid)
+        count, offset = self.terrain.variants[mask]
+        GL.glDrawElements(GL.GL_TRIANGLES, count, GL.GL_UNSIGNED_SHORT,
+                          ctypes.c_void_p(offset))
+
+
+# -------------- quadtree of heightmap chunks ---------------------------------
+class Terrain(Node):
+    """ Heightmap terrain as a quadtree of chunks of cells x cells quads.
+        Level L splits the map in 2^L x 2^L chunks, sampling every
+        2^(levels-1-L) height, so every chunk has the same vertex count.
+        Each frame, chunks closer than lod_distance times their size are
+        split, the result is balanced so that neighbours differ by at most
+        one level, and edges next to a coarser chunk use an index variant
+        collapsing their odd vertices: no cracks. Chunks outside the view
+        frustum are skipped, geometry is generated on first use with numpy
+        and kept in a cache of the cache_size most recently drawn chunks.
+        heights rows go along z, columns along x, spacing apart. """
+    def __init__(self, shader, heights, spacing=1., cells=32, lod_distance=2.,
+                 cache_size=256, texture=None, tex_scale=4., transform=None,
+                 **uniforms):
+        super().__init__(transform=transform)
+        heights = np.asarray(heights, np.float32)
+        size = heights.shape[0] - 1
+        levels = int(np.log2(max(size // cells, 1))) + 1
+        assert heights.shape == (size + 1, size + 1) and \
+            size == cells * 2 ** (levels - 1), \
+            'heights must be (n+1, n+1) with n = cells * power of two'
+        assert cells <= 254, 'chunk vertices must fit 16 bit indices'
+        self.shader, self.texture, self.uniforms = shader, texture, uniforms
+        self.heights, self.spacing, self.tex_scale = heights, spacing, tex_scale
+        self.cells, self.levels, self.lod_distance = cells, levels, lod_distance
+        self.normals = self._normals()
+        self.ranges = self._ranges()
+        self.chunks = OrderedDict()       # (level, row, col) -> ChunkArray
+        self.cache_size = cache_size
+        self.stats = dict(chunks=0, culled=0)
+
+        # 16 stitching variants in one index buffer, as (count, byte offset)
+        variants = [stitched_triangles(cells, mask).astype(np.uint16)
+                    for mask in range(16)]
+        offsets = np.cumsum([0] + [variant.nbytes for variant in variants])
+        self.variants = [(variant.size, int(offset))
+                         for variant, offset in zip(variants, offsets)]
+        index = np.concatenate([variant.ravel() for variant in variants])
+        self.index_buffer = GL.glGenBuffers(1)
+        GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, self.index_buffer)
+        GL.glBufferData(GL.GL_ELEMENT_ARRAY_BUFFER, index, GL.GL_STATIC_DRAW)
+        GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, 0)
+        RESOURCES.track(self, index.nbytes, lambda glid=self.index_buffer:
+                        GL.glDeleteBuffers(1, [glid]), 'buffer',
+                        evictable=False)
+
+    def _normals(self):
+        """ per sample normals of the full resolution heightmap """
+        slope_z, slope_x = np.gradient(self.heights, self.spacing)
+        normals = np.stack((-slope_x, np.ones_like(slope_x), -slope_z), -1)
+        return normals / np.linalg.norm(normals, axis=-1, keepdims=True)
+
+    def _ranges(self):
+        """ per level (2^L, 2^L, 2) arrays of chunk min & max heights """
+        h = self.heights
+        cell_min = np.minimum(np.minimum(h[:-1, :-1], h[1:, :-1]),
+                              np.minimum(h[:-1, 1:], h[1:, 1:]))
+        cell_max = np.maximum(np.maximum(h[:-1, :-1], h[1:, :-1]),
+                              np.maximum(h[:-1, 1:], h[1:, 1:]))
+        count = 2 ** (self.levels - 1)
+        blocks = (count, self.cells, count, self.cells)
+        ranges = [np.stack((cell_min.reshape(blocks).min(axis=(1, 3)),
+                            cell_max.reshape(blocks).max(axis=(1, 3))), -1)]
+        for _ in range(self.levels - 1):
+            finer = ranges[0]
+            count = len(finer) // 2
+            quads = finer.reshape(count, 2, count, 2, 2)
+            ranges.insert(0, np.stack((quads[..., 0].min(axis=(1, 3)),
+                                       quads[..., 1].max(axis=(1, 3))), -1))
+        return ranges
+
+    def chunk_size(self, level):
+        """ world size of chunks of a level, in terrain coordinates """
+        return self.cells * 2 ** (self.levels - 1 - level) * self.spacing
+
+    def boxes(self, level, rows, cols):
+        """ (N, 2, 3) bounding boxes of chunks of a level """
+        size = self.chunk_size(level)
+        heights = self.ranges[level][rows, cols]
+        return np.stack((np.stack((cols * size, heights[:, 0], rows * size), -1),
+                         np.stack(((cols + 1) * size, heights[:, 1],
+                                   (rows + 1) * size), -1)), 1)
+
+    # ------------ level of detail selection --------------------------------
+    def select(self, camera):
+        """ set of (level, row, col) leaves for a camera in terrain space """
+        leaves = set()
+        rows, cols = np.zeros(1, int), np.zeros(1, int)
+        for level in range(self.levels):
+            box = self.boxes(level, rows, cols)
+            gap = np.maximum(np.maximum(box[:, 0] - camera, camera - box[:, 1]),
+                             0)
+            split = np.linalg.norm(gap, axis=1) < \
+                self.lod_distance * self.chunk_size(level)
+            if level == self.levels - 1:
+                split[:] = False
+            leaves.update((level, int(row), int(col)) for row, col in
+                          zip(rows[~split], cols[~split]))
+            rows = (2 * rows[split, None] + (0, 0, 1, 1)).ravel()
+            cols = (2 * cols[split, None] + (0, 1, 0, 1)).ravel()
+        return self.balance(leaves)
+
+    @staticmethod
+    def balance(leaves):
+        """ split leaves until edge neighbours differ by one level at most """
+        pending = list(leaves)
+        while pending:
+            leaf = level, row, col = pending.pop()
+            if leaf not in leaves:
+                continue
+            for _, d_row, d_col in NEIGHBOURS:
+                row_n, col_n = row + d_row, col + d_col
+                if not (0 <= row_n < 2 ** level and 0 <= col_n < 2 ** level):
+                    continue
+                for coarse in range(level - 2, -1, -1):
+                    shift = level - coarse
+                    key = (coarse, row_n >> shift, col_n >> shift)
+                    if key in leaves:
+                        leaves.remove(key)
+                        children = [(coarse + 1, 2 * key[1] + i, 2 * key[2] + j)
+                                    for i in (0, 1) for j in (0, 1)]
+                        leaves.update(children)
+                        pending.extend(children + [leaf])
+                        break
+        return leaves
+
+    @staticmethod
+    def masks(leaves):
+        """ leaf -> edge bits of its neighbours one level coarser """
+        return {(level, row, col): sum(
+            bit for bit, d_row, d_col in NEIGHBOURS
+            if (level - 1, (row + d_row) >> 1, (col + d_col) >> 1) in leaves)
+                for level, row, col in leaves}
+
+    # ------------ chunk geometry -------------------------------------------
+    def chunk(self, key):
+        """ cached vertex array of a chunk, generated on first use """
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.chunks[key] = self.generate(*key)
+            while len(self.chunks) > self.cache_size:
+                self.chunks.popitem(last=False)   # GL objects freed on collect
+        self.chunks.move_to_end(key)
+        return chunk
+
+    def generate(self, level, row, col):
+        """ vertex array of a chunk, sampling every step-th height """
+        step = 2 ** (self.levels - 1 - level)
+        first_row, first_col = row * self.cells * step, col * self.cells * step
+        rows = first_row + step * np.arange(self.cells + 1)
+        cols = first_col + step * np.arange(self.cells + 1)
+        grid_z, grid_x = np.meshgrid(rows * self.spacing, cols * self.spacing,
+                                     indexing='ij')
+        heights = self.heights[np.ix_(rows, cols)]
+        position = np.stack((grid_x, heights, grid_z), -1).reshape(-1, 3)
+        attributes = dict(
+            position=position,
+            normal=self.normals[np.ix_(rows, cols)].reshape(-1, 3),
+            tex_coord=position[:, [0, 2]] / self.tex_scale)
+        return ChunkArray(self, attributes, self.boxes(
+            level, np.array([row]), np.array([col]))[0])
+
+    def height(self, x, z):
+        """ bilinear terrain height at (x, z) terrain coordinates """
+        size = self.heights.shape[0] - 1
+        u = np.clip(np.asarray(x) / self.spacing, 0, size)
+        v = np.clip(np.asarray(z) / self.spacing, 0, size)
+        col, row = np.minimum(u.astype(int), size - 1), \
+            np.minimum(v.astype(int), size - 1)
+        fu, fv = u - col, v - row
+        h = self.heights
+        return ((1 - fv) * ((1 - fu) * h[row, col] + fu * h[row, col + 1]) +
+                fv * ((1 - fu) * h[row + 1, col] + fu * h[row + 1, col + 1]))
+
+    def local_bounds(self):
+        """ box around the whole terrain, in terrain coordinates """
+        return self.boxes(0, np.zeros(1, int), np.zeros(1, int))[0]
+
+    def intersect_rays(self, origins, directions, refine=16):
+        """ first hit parameter t of rays origin + t * direction with the
+            height field, in terrain coordinates, inf where missed. Rays are
+            marched a cell at a time inside the terrain box, all together,
+            then the crossing is refined by bisection """
+        origins = np.asarray(origins, np.float64).reshape(-1, 3)
+        directions = np.asarray(directions, np.float64).reshape(-1, 3)
+        box = self.local_bounds()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_near, t_far = ray_boxes(origins, 1 / directions, *box)
+        t_near = np.maximum(t_near, 0)
+        step = self.spacing / np.maximum(np.linalg.norm(directions, axis=1),
+                                         1e-30)
+
+        def below(rays, t):
+            points = origins[rays] + t[:, None] * directions[rays]
+            return points[:, 1] <= self.height(points[:, 0], points[:, 2])
+
+        best = np.full(len(origins), np.inf)
+        rays = np.flatnonzero(t_near <= t_far)
+        t, last = t_near[rays], t_near[rays]
+        while len(rays):
+            hit = below(rays, t)
+            # crossing between last & t, bisect it; origin under ground: t
+            low, high, hit_rays = last[hit], t[hit], rays[hit]
+            for _ in range(refine):
+                middle = (low + high) / 2
+                under = below(hit_rays, middle)
+                low, high = np.where(under, low, middle), \
+                    np.where(under, middle, high)
+            best[hit_rays] = high
+            # others go on, up to the far side of the box
+            rays, last = rays[~hit], t[~hit]
+            t = np.minimum(last + step[rays], t_far[rays])
+            going = last < t_far[rays]
+            rays, last, t = rays[going], last[going], t[going]
+        return best
+
+    # ------------ drawing --------------------------------------------------
+    def draw(self, model=None, **other_uniforms):
+        """ draw selected chunks inside the view frustum """
+        model = identity() if model is None else model
+        self.world_transform = model @ self.transform
+        camera = np.append(np.asarray(other_uniforms['w_camera_position'])[:3],
+                           1)
+        camera = (np.linalg.inv(self.world_transform) @ camera)[:3]
+        leaves = self.select(camera)
+        masks = self.masks(leaves)
+
+        # cull every selected chunk at once against the clip volume; sorted
+        # keys come grouped by level, as boxes computed level by level
+        keys = sorted(leaves)
+        levels, rows, cols = (np.array(column) for column in zip(*keys))
+        boxes = np.concatenate([self.boxes(level, rows[levels == level],
+                                           cols[levels == level])
+                                for level in range(self.levels)])
+        corners = boxes[:, [[0, 0, 0], [0, 0, 1], [0, 1, 0], [0, 1, 1],
+                            [1, 0, 0], [1, 0, 1], [1, 1, 0], [1, 1, 1]],
+                        [0, 1, 2]]
+        clip = np.asarray(other_uniforms['projection']) @ \
+            np.asarray(other_uniforms['view']) @ self.world_transform
+        corners = np.concatenate((corners, np.ones(corners.shape[:2] + (1,))),
+                                 -1) @ clip.T
+        w = corners[..., 3:]
+        outside = np.concatenate((corners[..., :3] < -w, corners[..., :3] > w),
+                                 -1).all(axis=1).any(axis=1)
+
+        GL.glUseProgram(self.shader.glid)
+        if self.texture is not None:
+            GL.glActiveTexture(GL.GL_TEXTURE0)
+            self.texture.bind()
+            other_uniforms['diffuse_map'] = 0
+        self.shader.set_uniforms({**self.uniforms, **other_uniforms,
+                                  'model': self.world_transform})
+        for key, hidden in zip(keys, outside):
+            if not hidden:
+                self.chunk(key).execute_variant(masks[key])
+        GL.glBindVertexArray(0)
+        self.stats.update(chunks=int((~outside).sum()),
+                          culled=int(outside.sum()))
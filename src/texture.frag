@@ -1,9 +1,15 @@
 #version 330 core
 
+// ---- frame globals, one uniform buffer shared by all programs
+layout(std140, row_major) uniform Frame {
+    mat4 view, projection;
+    vec3 w_camera_position;
+    float time;
+    vec3 light_dir;
+};
+
 uniform sampler2D diffuse_map;
-uniform vec3 light_dir;
 uniform vec3 k_a, k_d, k_s;
-uniform vec3 w_camera_position;
 uniform float s;
 
 in vec2 frag_tex_coords;
@@ -17,7 +23,7 @@ void main() {
     vec3 r = reflect(light_dir, n);
     vec3 v = normalize(w_camera_position - w_position);
     vec3 d = k_d * max(0, dot(n, light_obj));
-    vec3 q = k_s * pow(dot(r, v), s);
+    vec3 q = k_s * pow(max(dot(r, v), 0), s);
     vec4 color = vec4(k_a + d + q, 1);
     out_color = texture(diffuse_map, frag_tex_coords) * color;
 }
@@ -1,18 +1,29 @@
 import OpenGL.GL as GL              # standard Python OpenGL wrapper
-from PIL import Image               # load texture maps
+
+from resources import RESOURCES     # GPU memory accounting
 
 
 # -------------- OpenGL Texture Wrapper ---------------------------------------
 class Texture:
-    """ Helper class to create and automatically destroy textures """
+    """ Helper class to create textures, whose GPU storage can be evicted and
+        reloaded on demand from their source file """
     def __init__(self, tex_file, wrap_mode=GL.GL_REPEAT,
                  mag_filter=GL.GL_LINEAR, min_filter=GL.GL_LINEAR_MIPMAP_LINEAR,
                  tex_type=GL.GL_TEXTURE_2D):
+        self.tex_file, self.type = tex_file, tex_type
+        self.modes = (wrap_mode, mag_filter, min_filter)
+        self.glid = None
+        self.upload(verbose=True)
+
+    def upload(self, verbose=False):
+        """ (re-)load texture file to a new GL texture object """
+        wrap_mode, mag_filter, min_filter = self.modes
+        tex_type, nbytes = self.type, 0
         self.glid = GL.glGenTextures(1)
-        self.type = tex_type
+        from PIL import Image           # load texture maps, on first use
         try:
             # imports image as a numpy array in exactly right format
-            tex = Image.open(tex_file).convert('RGBA')
+            tex = Image.open(self.tex_file).convert('RGBA')
             GL.glBindTexture(tex_type, self.glid)
             GL.glTexImage2D(tex_type, 0, GL.GL_RGBA, tex.width, tex.height,
                             0, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE, tex.tobytes())
@@ -21,15 +32,76 @@ class Texture:
             GL.glTexParameteri(tex_type, GL.GL_TEXTURE_MIN_FILTER, min_filter)
             GL.glTexParameteri(tex_type, GL.GL_TEXTURE_MAG_FILTER, mag_filter)
             GL.glGenerateMipmap(tex_type)
-            print(f'Loaded texture {tex_file} ({tex.width}x{tex.height}'
-                  f' wrap={str(wrap_mode).split()[0]}'
-                  f' min={str(min_filter).split()[0]}'
-                  f' mag={str(mag_filter).split()[0]})')
+            nbytes = 4 * tex.width * tex.height * 4 // 3  # with mipmap chain
+            if verbose:
+                print(f'Loaded texture {self.tex_file} ({tex.width}x{tex.height}'
+                      f' wrap={str(wrap_mode).split()[0]}'
+                      f' min={str(min_filter).split()[0]}'
+                      f' mag={str(mag_filter).split()[0]})')
         except FileNotFoundError:
-            print("ERROR: unable to load texture file %s" % tex_file)
+            print("ERROR: unable to load texture file %s" % self.tex_file)
+        RESOURCES.track(self, nbytes, lambda glid=self.glid:
+                        GL.glDeleteTextures([glid]), 'texture', self.tex_file)
+
+    def evict(self):
+        """ free GPU storage, texture gets reloaded from file when bound """
+        GL.glDeleteTextures([self.glid])
+        self.glid = None
+        RESOURCES.evicted(self)
+
+    def bind(self):
+        """ bind texture to active texture unit, reloading it if evicted """
+        if self.glid is None:
+            self.upload()
+        RESOURCES.touch(self)
+        GL.glBindTexture(self.type, self.glid)
 
-    def __del__(self):  # delete GL texture from GPU when object dies
-        GL.glDeleteTextures(self.glid)
+
+# -------------- Cube map texture ---------------------------------------------
+class CubeMap(Texture):
+    """ Cube map texture, from 6 face files in +x, -x, +y, -y, +z, -z order,
+        or from a single image holding the faces as a horizontal cross """
+    CROSS = ((2, 1), (0, 1), (1, 0), (1, 2), (1, 1), (3, 1))  # (column, row)
+
+    def __init__(self, tex_files, mag_filter=GL.GL_LINEAR,
+                 min_filter=GL.GL_LINEAR_MIPMAP_LINEAR):
+        super().__init__(tex_files, GL.GL_CLAMP_TO_EDGE, mag_filter,
+                         min_filter, GL.GL_TEXTURE_CUBE_MAP)
+
+    def upload(self, verbose=False):
+        """ (re-)load the 6 faces to a new GL cube map texture object """
+        wrap_mode, mag_filter, min_filter = self.modes
+        files = [self.tex_file] if isinstance(self.tex_file, str) else \
+            list(self.tex_file)
+        tex_type, nbytes = self.type, 0
+        self.glid = GL.glGenTextures(1)
+        from PIL import Image           # load texture maps, on first use
+        try:
+            faces = [Image.open(file).convert('RGBA') for file in files]
+            if len(faces) == 1:  # split horizontal cross into its 6 faces
+                size = faces[0].width // 4
+                faces = [faces[0].crop((col * size, row * size, (col + 1) * size,
+                                        (row + 1) * size))
+                         for col, row in self.CROSS]
+            GL.glBindTexture(tex_type, self.glid)
+            for index, face in enumerate(faces):
+                GL.glTexImage2D(GL.GL_TEXTURE_CUBE_MAP_POSITIVE_X + index, 0,
+                                GL.GL_RGBA, face.width, face.height, 0,
+                                GL.GL_RGBA, GL.GL_UNSIGNED_BYTE, face.tobytes())
+                nbytes += 4 * face.width * face.height * 4 // 3
+            for wrap in (GL.GL_TEXTURE_WRAP_S, GL.GL_TEXTURE_WRAP_T,
+                         GL.GL_TEXTURE_WRAP_R):
+                GL.glTexParameteri(tex_type, wrap, wrap_mode)
+            GL.glTexParameteri(tex_type, GL.GL_TEXTURE_MIN_FILTER, min_filter)
+            GL.glTexParameteri(tex_type, GL.GL_TEXTURE_MAG_FILTER, mag_filter)
+            GL.glGenerateMipmap(tex_type)
+            if verbose:
+                print(f'Loaded cube map {files[0]} ({len(files)} file(s), '
+                      f'{faces[0].width}x{faces[0].height} faces)')
+        except FileNotFoundError:
+            print("ERROR: unable to load cube map file(s) %s" % files)
+        RESOURCES.track(self, nbytes, lambda glid=self.glid:
+                        GL.glDeleteTextures([glid]), 'texture', files[0])
 
 
 # -------------- Textured mesh decorator --------------------------------------
@@ -39,9 +111,14 @@ class Textured:
         self.drawable = drawable
         self.textures = textures
 
+    @property
+    def bounds(self):
+        """ box around the decorated drawable, if it has one """
+        return getattr(self.drawable, 'bounds', None)
+
     def draw(self, primitives=GL.GL_TRIANGLES, **uniforms):
         for index, (name, texture) in enumerate(self.textures.items()):
             GL.glActiveTexture(GL.GL_TEXTURE0 + index)
-            GL.glBindTexture(texture.type, texture.glid)
+            texture.bind()
             uniforms[name] = index
         self.drawable.draw(primitives=primitives, **uniforms)
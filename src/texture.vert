@@ -1,8 +1,14 @@
 #version 330 core
 
+// ---- frame globals, one uniform buffer shared by all programs
+layout(std140, row_major) uniform Frame {
+    mat4 view, projection;
+    vec3 w_camera_position;
+    float time;
+    vec3 light_dir;
+};
+
 uniform mat4 model;
-uniform mat4 view;
-uniform mat4 projection;
 
 in vec3 position;
 in vec3 normal;
@@ -12,7 +18,9 @@ out vec3 w_position, w_normal;
 out vec2 frag_tex_coords;
 
 void main() {
-    gl_Position = projection * view * model * vec4(position, 1);
+    vec4 w_position4 = model * vec4(position, 1);
+    gl_Position = projection * view * w_position4;
+    w_position = w_position4.xyz / w_position4.w;
     frag_tex_coords = tex_coord;
     w_normal = (model * vec4(normal, 0)).xyz;
 }
@@ -0,0 +1,30 @@
+#version 430 core
+
+// ---- frame globals, one uniform buffer shared by all programs
+layout(std140, row_major) uniform Frame {
+    mat4 view, projection;
+    vec3 w_camera_position;
+    float time;
+    vec3 light_dir;
+};
+
+// ---- diffuse texture: one layer of a texture array, layer & material per draw
+uniform sampler2DArray diffuse_array;
+
+in vec2 frag_tex_coords;
+in vec3 w_position, w_normal;
+flat in vec3 k_a, k_d, k_s;
+flat in float s, layer;
+
+out vec4 out_color;
+
+void main() {
+    vec3 n = normalize(w_normal);
+    vec3 light_obj = normalize(-light_dir);
+    vec3 r = reflect(light_dir, n);
+    vec3 v = normalize(w_camera_position - w_position);
+    vec3 d = k_d * max(0, dot(n, light_obj));
+    vec3 q = k_s * pow(max(dot(r, v), 0), s);
+    vec4 color = vec4(k_a + d + q, 1);
+    out_color = texture(diffuse_array, vec3(frag_tex_coords, layer)) * color;
+}
@@ -0,0 +1,42 @@
+#version 430 core
+
+// ---- frame globals, one uniform buffer shared by all programs
+layout(std140, row_major) uniform Frame {
+    mat4 view, projection;
+    vec3 w_camera_position;
+    float time;
+    vec3 light_dir;
+};
+
+// ---- per draw model matrix & material, indexed by the command's draw id
+struct Draw {
+    mat4 model;
+    vec4 k_a_s, k_d_layer, k_s;
+};
+layout(std430, row_major, binding = 1) readonly buffer Draws {
+    Draw draws[];
+};
+
+in vec3 position;
+in vec3 normal;
+in vec2 tex_coord;
+in uint draw_id;
+
+out vec3 w_position, w_normal;
+out vec2 frag_tex_coords;
+flat out vec3 k_a, k_d, k_s;
+flat out float s, layer;
+
+void main() {
+    Draw draw = draws[draw_id];
+    vec4 w_position4 = draw.model * vec4(position, 1);
+    gl_Position = projection * view * w_position4;
+    w_position = w_position4.xyz / w_position4.w;
+    frag_tex_coords = tex_coord;
+    w_normal = (draw.model * vec4(normal, 0)).xyz;
+    k_a = draw.k_a_s.xyz;
+    s = draw.k_a_s.w;
+    k_d = draw.k_d_layer.xyz;
+    layer = draw.k_d_layer.w;
+    k_s = draw.k_s.xyz;
+}
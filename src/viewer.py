@@ -1,26 +1,28 @@
 #!/usr/bin/env python3
 
-from re import S
+from startup import STARTUP         # first, so imports are part of the trace
+import os
 import sys
-from itertools import cycle
+from itertools import cycle, product
 import OpenGL.GL as GL              # standard Python OpenGL wrapper
 import glfw                         # lean window system wrapper for OpenGL
-import numpy as np
-import scipy as sp                  # all matrix manipulations & OpenGL args
+import numpy as np                  # all matrix manipulations & OpenGL args
 from core import Node, Shader, Viewer, Mesh, load, Mannequin
 from animation import KeyFrameControlNode, Skinned, sens_rotation
-from texture import Texture, Textured
+from texture import Texture, Textured, CubeMap
+from atlas import TextureAtlas
+from layout import LAYOUT_STATS
+from water import Ocean
+from occlusion import OcclusionCuller
+from resolution import DynamicResolution
+from snapshot import save, restore, current
+from bundle import mount
+from particles import ParticleSystem, Emitter
+from terrain import Terrain
+from indirect import IndirectBatcher, indirect_supported
 from transform import identity, rotate, vec, sincos, quaternion, quaternion_from_euler, scale, translate
 from math import cos, sin
 
-# For the drawing of the sphere
-try:
-    from OpenGL.GL import *
-    from OpenGL.GLU import *
-    from OpenGL.GLUT import *
-except:
-    print("OpenGL wrapper for python not found")
-
 M_PI =  3.14159265358979323846
 
 # -------------- Example textured plane class ---------------------------------
@@ -65,20 +67,6 @@ class TexturedPlane(Textured):
                 self.textures.update(diffuse_map=texture1)
 
 
-# ------------------ Water class ----------------
-
-class Water(Node):
-    """ Water class """
-    def __init__(self, children=(), transform=identity()):
-        super().__init__(children, transform)
-
-    def draw(self, model=identity(), **other_uniforms):
-        """ Recursive draw, passing down updated model matrix. """
-        other_uniforms['constante'] = 0.01 * glfw.get_time()
-        super().draw(model, **other_uniforms)
-
-
-
 # -------------- Deformable Cylinder Mesh  ------------------------------------
 
 
@@ -222,73 +210,46 @@ class TexturedForm(Textured):
             self.textures.update(diffuse_map=texture)
 
 
-class Skybox1(Mesh):
-    def __init__(self, shader, file): 
-       
-        self.position = np.array(((-50, -50, -50), (50, -50, -50), (50, 50, -50), (-50, 50, -50),
-                        (50, -50, 50), (-50, -50, 50), (-50, 50, 50), (50, 50, 50)), 'f')
-        self.index = np.array((0, 1, 2, 0, 2, 3, 4, 5, 6, 4, 6, 7), 'f')
-        # , 4, 5, 6, 4, 6, 7, 8, 9, 10, 8, 10, 11, 12, 13, 14, 12, 14, 15, 16, 17, 18, 16, 18, 19, 20, 21, 22, 20, 22, 23), 'f')
-        self.color = (1, 1, 1)
-        self.attributes = dict(position=self.position, color=self.color)
-        super().__init__(shader, attributes=self.attributes, index=self.index)
-        self.cube = Node(transform=translate(25, -10, -10) @ scale(20, 20, 20))
-        self.cube.add(TexturedForm(shader, file, self.position, self.index))
-    
-    def draw(self, primitives=GL.GL_TRIANGLES, **uniforms):
-        super().draw(primitives=primitives, global_color=self.color, **uniforms)
+class Skybox(Textured):
+    """ Cube mapped sky, drawn in a single call after opaque geometry with its
+        depth on the far plane, so early-z rejects every covered pixel """
+    def __init__(self, shader, cubemap):
+        # unit cube, corner i has coordinates given by the bits of i
+        position = np.array(list(product((-1, 1), repeat=3)), np.float32)
+        quads = np.array(((0, 1, 3, 2), (4, 6, 7, 5), (0, 4, 5, 1),
+                          (2, 3, 7, 6), (0, 2, 6, 4), (1, 5, 7, 3)))
+        index = np.concatenate((quads[:, :3], quads[:, [0, 2, 3]]))
 
-    def getCarre(self):
-        return self.cube
-    def getIndex(self):
-        return self.index
+        # we look at the cube from inside: orient all triangles inwards
+        corners = position[index]
+        normals = np.cross(corners[:, 1] - corners[:, 0],
+                           corners[:, 2] - corners[:, 0])
+        outwards = np.einsum('ij,ij->i', normals, corners.sum(axis=1)) > 0
+        index[outwards] = index[outwards][:, ::-1]
 
-class Skybox2(Mesh):
-    def __init__(self, shader, file):
-        self.position = np.array(((-50, -50, -50), (-50, 50, -50), (-50, 50, 50), (-50, -50, 50),
-                        (50, -50, -50), (50, -50, 50), (50, 50, 50), (50, 50, -50)), 'f')
-        self.index = np.array((0, 1, 2, 0, 2, 3, 4, 5, 6, 4, 6, 7), 'f')
-        self.attributes = dict(position=self.position, color=(1, 1, 1))
-        super().__init__(shader, attributes=self.attributes, index=self.index)
-        self.cube = Node(transform=translate(25, -10, -10) @ scale(20, 20, 20))
-        self.cube.add(TexturedForm(shader, file, self.position, self.index))
-       
-    def draw(self, primitives=GL.GL_TRIANGLES, **uniforms):
-        super().draw(primitives=primitives, global_color=self.color, **uniforms)
+        mesh = Mesh(shader, attributes=dict(position=position), index=index)
+        super().__init__(mesh, sky_map=cubemap)
 
-    def getCarre(self):
-        return self.cube
-    def getIndex(self):
-        return self.index
+    def draw(self, primitives=GL.GL_TRIANGLES, **uniforms):
+        GL.glDepthFunc(GL.GL_LEQUAL)  # sky fragments have depth exactly 1
+        super().draw(primitives=primitives, **uniforms)
+        GL.glDepthFunc(GL.GL_LESS)
 
-class Skybox3(Mesh):
-    def __init__(self, shader, file): 
-        self.position = np.array(((-50, 50, -50), (50, 50, -50), (50, 50, 50), (-50, 50, 50),
-                        (-50, -50, 50), (50, -50, 50), (50, -50, -50), (-50, -50, -50)), 'f')
-        self.index = np.array((0, 1, 2, 0, 2, 3, 4, 5, 6, 4, 6, 7), 'f')
-        self.attributes = dict(position=self.position, color=(1, 1, 1))
-        super().__init__(shader, attributes=self.attributes, index=self.index)
-        self.cube = Node(transform=translate(25, -10, -10) @ scale(20, 20, 20))
-        self.cube.add(TexturedForm(shader, file, self.position, self.index))
 
-    def draw(self, primitives=GL.GL_TRIANGLES, **uniforms):
-        super().draw(primitives=primitives, global_color=self.color, **uniforms)
+# -------------- island scene, built from assets or restored from snapshot ----
+SNAPSHOT = 'island.snapshot'
+BUNDLE = 'assets.bundle'        # built by compiler.py, used when present
 
-    def getCarre(self):
-        return self.cube
-    def getIndex(self):
-        return self.index         
 
-# -------------- main program and scene setup --------------------------------
-def main():
-    """ create a window, add scene objects, then run rendering loop """
-    viewer = Viewer()
+def build_island(viewer, light_dir):
+    """ load and place all island objects, adding them to viewer """
     shader = Shader("skinning.vert", "texture2.frag")
     shader2 = Shader("texture2.vert", "texture2.frag")
+
+    # static props sample one texture array layer each, no per-mesh binds
+    shader_static = Shader("texture.vert", "texture_array.frag")
+    atlas = TextureAtlas()
     shader3 = Shader("texture3.vert", "texture2.frag")
-    shader4 = Shader("skinning.vert", "mer.frag")
-    shader_soleil = Shader("skinning.vert", "texture2.frag")
-    shader_sphere = Shader("texture2.vert", "texture2.frag")
     shader_dino = Shader("skinning.vert", "texture2.frag")
     shader_seagull = Shader("skinning.vert", "texture2.frag")
     shader_rogalic = Shader("skinning.vert", "texture2.frag")
@@ -297,10 +258,204 @@ def main():
     shader_arm = Shader("skinning.vert", "texture2.frag")
     shader_mannequin = Shader("phong.vert", "lambertian.frag")
 
+    # sun has interactive texture modes, added by main() as it is not
+    # snapshotted
+
+    central_island_1 = Node(transform=translate(-60, -10, -40) @ scale(4, 4, 4))
+    central_island_1.add(*load("central_Island/Groupofpalms.obj", shader_static, atlas=atlas, light_dir=light_dir))
+    viewer.add(central_island_1)
+    central_island_2 = Node(transform=translate(60, -10, 40) @ scale(4, 4, 4))
+    central_island_2.add(*load("central_Island/Groupofpalms.obj", shader_static, atlas=atlas, light_dir=light_dir))
+    viewer.add(central_island_2)
+
+    # sand islands are a Terrain, added by main() as it is not snapshotted
+
+
+    arm = Node(transform=translate(-15, 22, 50) @ rotate((0, 0, 1), 45) @ scale(1, 1, 1))
+    arm.add(SkinnedCylinder(shader_arm))
+    viewer.add(arm)
+
+    viewer.add(Mannequin(shader_mannequin, light_dir, transform=translate(-41, 29, 100) @ rotate((0, 1, 0), 180) @ scale(.3, .3, .3)))
+
+
+    tree2 = Node(transform=translate(-90, 40, 120) @ scale(0.5, 0.5, 0.5))
+    tree2.add(*load("FantasyWorld/NatureAssets/Tree_03.FBX", shader_static, atlas=atlas, light_dir=light_dir)) #, tex_file='FantasyWorld/NatureAssets/Textures/Nature_Atlas_1.tga'))
+    tree2.occlusion_test = True
+    viewer.add(tree2)
+
+    hen = Node(transform= translate(28, -2.6, 20) @ rotate((1, 0, 0), 45) @ scale(0.5, 0.5, 0.5))
+    hen.add(*load("FantasyWorld/Animated/Hen/hen.FBX", shader_hen, light_dir=light_dir))
+    hen.occlusion_test = True
+    viewer.add(hen)
+
+    dino = Node(transform=translate(55, 5, 20) @ scale(0.3, 0.3, 0.3))
+    dino.add(*load("FantasyCharacters/Dino/Dino_attack_1.fbx", shader_dino, light_dir=light_dir))
+    dino.occlusion_test = True
+    viewer.add(dino)
+
+    rogalic = Node(transform= translate(-30, 19, 72) @ scale(0.3, 0.3, 0.3))
+    rogalic.add(*load("FantasyCharacters/Rogalic/Rogalic_attack_1.fbx", shader_rogalic, light_dir=light_dir))
+    rogalic.occlusion_test = True
+    viewer.add(rogalic)
+
+    bridge = Node(transform= translate(-470, -2, -855) @ scale(0.5, 0.5, 0.5))
+    bridge.add(*load("FantasyWorld/Constructed/Constructed_BridgeWood02.FBX", shader2, light_dir=light_dir, tex_file="FantasyWorld/Constructed/Textures/All_Assets.tga"))
+    bridge.occlusion_test = True
+    viewer.add(bridge)
+
+
+    for i in range(3):
+        rock = Node(transform=translate(70 + i*10, -2.5, -200) @ scale(0.4, 0.4, 0.4))
+        rock.add(*load("FantasyWorld/NatureAssets/Rock_01.FBX", shader_static, atlas=atlas, light_dir=light_dir, tex_file='FantasyWorld/NatureAssets/Textures/Nature_Atlas_1.tga'))
+        rock.occlusion_test = True
+        viewer.add(rock)
+        viewer.add(*[mesh for file in sys.argv[1:]
+                for mesh in load(file, shader, light_dir=light_dir, tex_file='FantasyWorld/NatureAssets/Textures/Nature_Atlas_1.tga')])
+
+        house_mush = Node(transform=translate(-50 - i*6, 5, 25) @ scale(0.2, 0.2, 0.2))
+        house_mush.add(*load("FantasyWorld/Constructable_Elements/HouseMushroom.FBX", shader_static, atlas=atlas, light_dir=light_dir, tex_file='FantasyWorld/NatureAssets/Textures/Nature_Atlas_1.tga'))
+        house_mush.occlusion_test = True
+        viewer.add(house_mush)
+
+    for i in range(1, 6):
+        tree1 = Node(transform=translate(-90, 35-i*2 , 120-i*15) @ scale(0.5, 0.5, 0.5))
+        tree1.add(*load("FantasyWorld/NatureAssets/Tree_0{}.FBX".format(i), shader_static, atlas=atlas, light_dir=light_dir)) #, tex_file='FantasyWorld/NatureAssets/Textures/Nature_Atlas_1.tga'))
+        tree1.occlusion_test = True
+        viewer.add(tree1)
+
+    N=10
+    for i in range(0, N):
+        angle = 2*i*np.pi / N 
+        mother_tree = Node(transform=translate(-10 + 30*np.cos(angle), 1, 10 + 30*np.sin(angle)) @ scale(0.05, 0.05, 0.05))
+        mother_tree.add(*load("FantasyWorld/NatureAssets/Mother_Tree.FBX", shader_static, atlas=atlas))
+        mother_tree.occlusion_test = True
+        viewer.add(mother_tree)
+
+    """ ------------------------- Animations de nos objets ---------------------------------------------------- """ 
+
+    for i in range(6):
+        angle = 2*i*np.pi / 10
+        seagull = Node(transform=translate(10 + 30*np.cos(angle), 20, 100 + 30*np.sin(angle)) @ rotate((1, 0, 0), angle=45) @ scale(0.8, 0.8, 0.8))
+        seagull.add(*load("FantasyWorld/Animated/Seagull/seagul.FBX", shader_seagull, light_dir=light_dir))
+        seagull.occlusion_test = True
+        transkey, rotkey, scalekey = sens_rotation(-1, 0, 'seagull')
+        keynode = KeyFrameControlNode(transkey, rotkey, scalekey, 'seagull')         
+        keynode.add(seagull)
+        viewer.add(keynode)
+
+
+    pointeur = Node(transform=translate(100, 30, 40) @ scale(1, 1, 1))
+    pointeur.add(*load("FantasyWorld/NatureAssets/Crystal_05.FBX", shader_pointeur, light_dir=light_dir))
+    transkey, rotkey, scalekey = sens_rotation(1, 0, 'pointeur', move=False)
+    keynode = KeyFrameControlNode(transkey, rotkey, scalekey, 'pointeur')         
+    keynode.add(pointeur)
+    viewer.add(keynode)
+
+
+    boat = Node(transform=translate(-10, -1, -40) @ scale(0.3, 0.3, 0.3))
+    boat.add(*load("FantasyWorld/Boats/Galleon.FBX", shader_static, atlas=atlas, light_dir=light_dir, tex_file='FantasyWorld/Boats/Textures/Ships_1.tga'))
+    boat.occlusion_test = True
+    transkey, rotkey, scalekey = sens_rotation(1, -180, 'boat')
+    keynode = KeyFrameControlNode(transkey, rotkey, scalekey)         
+    keynode.add(boat)
+    viewer.add(keynode)
+
+
+# island domes, formerly whole spheres: center x, y, z & radius
+ISLANDS = ((-65, -20, 90, 50), (-15, -20, 90, 35), (-115, -20, 40, 40))
+
+
+def island_heights(origin=(-160, -20), extent=180., samples=513, floor=-20.):
+    """ heightmap of the visible caps of the island domes, with dunes """
+    x = origin[0] + np.linspace(0, extent, samples)
+    z = origin[1] + np.linspace(0, extent, samples)
+    grid_z, grid_x = np.meshgrid(z, x, indexing='ij')
+    heights = np.full(grid_x.shape, floor, np.float32)
+    for center_x, center_y, center_z, radius in ISLANDS:
+        squared = radius ** 2 - (grid_x - center_x) ** 2 - \
+            (grid_z - center_z) ** 2
+        heights = np.maximum(heights, center_y + np.sqrt(np.maximum(squared,
+                                                                    0)))
+    dunes = .15 * np.sin(.9 * grid_x + np.sin(.3 * grid_z))
+    return heights + dunes * (heights > floor)
+
+
+def add_terrain(viewer, origin=(-160, -20), extent=180.):
+    """ sand islands as a chunked heightmap terrain """
+    heights = island_heights(origin, extent)
+    terrain = Terrain(Shader("texture.vert", "texture.frag"), heights,
+                      spacing=extent / (len(heights) - 1),
+                      texture=Texture("sand.png"), tex_scale=4.,
+                      transform=translate(origin[0], 0, origin[1]),
+                      k_a=(.4, .4, .4), k_d=(.7, .7, .7), k_s=(.1, .1, .1),
+                      s=16.)
+    viewer.add(terrain)
+    return terrain
+
+
+def add_sun(viewer):
+    """ textured sun, whose F6/F7 texture modes the snapshot does not keep """
+    shader_sphere = Shader("texture2.vert", "texture2.frag")
+    sphere = Sphere2(shader_sphere, 100, 40, 5, -100, -10, 50)
+    soleil = Node(transform=translate(100, 300, -500) @ scale(5, 5, 5))
+    soleil.add(TexturedForm(shader_sphere, "soleil.png", sphere.getPosition(), sphere.getIndex()))
+    viewer.add(soleil)
+    return soleil
+
+
+def add_particles(viewer):
+    """ sea spray, sand and seagull feathers, simulated on the GPU; not in
+        the snapshot since emitters are procedural """
+    update = Shader("particle_update.vert", None,
+                    varyings=('out_position_age', 'out_velocity_life'))
+    shader = Shader("particle.vert", "particle.frag")
+
+    spray = Node(transform=translate(-10, -1, -40))
+    spray.add(Emitter(ParticleSystem(
+        update, shader, capacity=200000, rate=40000, life=(1, 3),
+        velocity=(0, 4, 0), spread=3, radius=30, drag=.5, size=(.15, .5),
+        color=(.9, .95, 1, .5), additive=True)))
+    viewer.add(spray)
+
+    sand = Node(transform=translate(28, -2.6, 20))
+    sand.add(Emitter(ParticleSystem(
+        update, shader, capacity=50000, rate=5000, life=(2, 5),
+        velocity=(1.5, .3, 0), spread=.8, radius=15, gravity=(0, -.5, 0),
+        drag=.2, size=(.05, .1), color=(.85, .75, .55, .8))))
+    viewer.add(sand)
+
+    # feathers follow the first seagull along its path
+    feathers = KeyFrameControlNode(*sens_rotation(-1, 0, 'seagull'))
+    seagull = Node(transform=translate(40, 20, 100))
+    seagull.add(Emitter(ParticleSystem(
+        update, shader, capacity=2000, rate=20, life=(4, 8),
+        velocity=(0, -.2, 0), spread=.5, radius=1, gravity=(0, -.3, 0),
+        drag=1.5, size=(.3, .3), color=(1, 1, 1, 1),
+        texture=Texture('feather.png') if os.path.exists('feather.png')
+        else None)))
+    feathers.add(seagull)
+    viewer.add(feathers)
+
+
+# -------------- main program and scene setup --------------------------------
+def main():
+    """ create a window, add scene objects, then run rendering loop """
+    STARTUP.since_start('import')
+    viewer = Viewer()
+    viewer.culler = OcclusionCuller()
+    viewer.resolution = DynamicResolution(target_ms=1000 / 60)
+    # static props go through multi draw indirect when the driver gave us a
+    # 4.3+ context for our 3.3 core request, else through Mesh.draw as usual
+    if indirect_supported():
+        viewer.batcher = IndirectBatcher()
+    if os.path.exists(BUNDLE):
+        mount(BUNDLE)
     #light_dir = (10, -5, -10)
     light_dir = (0, -0.707, 0.707)
+    viewer.light_dir = light_dir
 
-
+    # scene building, without its shader compiles, traced as asset load
+    STARTUP.begin('asset load')
     if len(sys.argv) < 2:
         
         print('Usage:\n\t%s [3dfile]*\n\n3dfile\t\t the filename of a model in'
@@ -312,160 +467,39 @@ def main():
         # viewer.add(TexturedPlane(shader2, "rose-millenial.png", ((-2000, 2000, -2000), (2000, 2000, -2000), (2000, 2000, 2000), (-2000, 2000, 2000))))
         # viewer.add(TexturedPlane(shader2, "rose-millenial.png", ((-2000, -2000, 2000), (2000, -2000, 2000), (2000, -2000, -2000), (-2000, -2000, -2000))))
 
-        mer_cube = Node(transform=translate(-163, -90, 163) @ scale(320, 91, 0))
-        mer_cube.add(TexturedPlane(shader2, "mer.png", ((0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0))))
-        viewer.add(mer_cube)
-        mer_cube = Node(transform=translate(157, -90, 163) @ rotate((0, 1, 0), 90) @ scale(320, 91, 0))
-        mer_cube.add(TexturedPlane(shader2, "mer.png", ((0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0))))
-        viewer.add(mer_cube)
-        mer_cube = Node(transform=translate(157, -90, -157) @ rotate((0, 1, 0), 180) @ scale(320, 91, 0))
-        mer_cube.add(TexturedPlane(shader2, "mer.png", ((0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0))))
-        viewer.add(mer_cube)
-        mer_cube = Node(transform=translate(-163, -90, -157) @ rotate((0, 1, 0), -90) @ scale(320, 91, 0))
-        mer_cube.add(TexturedPlane(shader2, "mer.png", ((0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0))))
-        viewer.add(mer_cube)
-        mer_cube = Node(transform=translate(-163, -90, -157) @ rotate((1, 0, 0), 90) @ scale(320, 320, 0))
-        mer_cube.add(TexturedPlane(shader2, "mer.png", ((0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0))))
-        viewer.add(mer_cube)
-        viewer.add(TexturedPlane(shader2, "mer.png", ((157, -90, -157), (-163, -90, -157), (-163, 1, -157), (157, 1, -157))))
-        viewer.add(TexturedPlane(shader2, "mer.png", ((-163, -90, -157), (-163, -90, 163), (-163, 1, 163), (-163, 1, -157))))
-        viewer.add(TexturedPlane(shader2, "mer.png", ((-163, -90, -157), (157, -90, -157), (157, -90, 163), (-163, -90, 163))))
-        
-
-
         """ ------------------------- Définition de nos objets ---------------------------------------------------- """ 
-        skybox = Skybox1(shader, 'skybox.png')
-        # cube = Node(transform=translate(25, -10, -10) @ scale(100, 100, 100))
-        # cube.add(TexturedForm(shader_sphere, "skybox.png", skybox.getPosition(), skybox.getIndex()))
-        viewer.add(skybox.getCarre())
-        skybox = Skybox2(shader, 'skybox.png')
-        viewer.add(skybox.getCarre())
-        skybox = Skybox3(shader, 'skybox.png')
-        viewer.add(skybox.getCarre())
-
-
-        mer = Water(transform=translate(-3, 0, 3) @ scale(80, 20, 80))
-        mer.add(*load("Ocean/Ocean.obj", shader4, light_dir=light_dir))
-        viewer.add(mer)
-        
-
-        sphere = Sphere2(shader_sphere, 100, 40, 5, -100, -10, 50)
-        soleil = Node(transform=translate(100, 300, -500) @ scale(5, 5, 5))
-        soleil.add(TexturedForm(shader_sphere, "soleil.png", sphere.getPosition(), sphere.getIndex()))
-        # soleil.add(*load("wooden_sphere.obj", shader_soleil, light_dir=light_dir))
-        viewer.add(soleil)
-        
-        central_island_1 = Node(transform=translate(-60, -10, -40) @ scale(4, 4, 4))
-        central_island_1.add(*load("central_Island/Groupofpalms.obj", shader, light_dir=light_dir))
-        viewer.add(central_island_1)
-        central_island_2 = Node(transform=translate(60, -10, 40) @ scale(4, 4, 4))
-        central_island_2.add(*load("central_Island/Groupofpalms.obj", shader, light_dir=light_dir))
-        viewer.add(central_island_2)
-        
-        sphere = Sphere2(shader_sphere, 100, 40, 50, -90, -10, 100)
-        island = Node(transform=translate(25, -10, -10))
-        island.add(TexturedForm(shader_sphere, "sand.png", sphere.getPosition(), sphere.getIndex()))
-        viewer.add(island)
-
-        sphere = Sphere2(shader_sphere, 100, 40, 35, -40, -10, 100)
-        island = Node(transform=translate(25, -10, -10))
-        island.add(TexturedForm(shader_sphere, "sand.png", sphere.getPosition(), sphere.getIndex()))
-        viewer.add(island)
-
-        sphere = Sphere2(shader_sphere, 100, 40, 40, -100, -10, 50)
-        island = Node(transform=translate(-15, -10, -10))
-        island.add(TexturedForm(shader_sphere, "sand.png", sphere.getPosition(), sphere.getIndex()))
-        viewer.add(island)
-            
-            
-        arm = Node(transform=translate(-15, 22, 50) @ rotate((0, 0, 1), 45) @ scale(1, 1, 1))
-        arm.add(SkinnedCylinder(shader_arm))
-        viewer.add(arm)
+        viewer.skybox = Skybox(Shader("skybox.vert", "skybox.frag"),
+                               CubeMap('skybox.png'))
 
-        viewer.add(Mannequin(shader_mannequin, light_dir, transform=translate(-41, 29, 100) @ rotate((0, 1, 0), 180) @ scale(.3, .3, .3)))
 
-    
-        tree2 = Node(transform=translate(-90, 40, 120) @ scale(0.5, 0.5, 0.5))
-        tree2.add(*load("FantasyWorld/NatureAssets/Tree_03.FBX", shader, light_dir=light_dir)) #, tex_file='FantasyWorld/NatureAssets/Textures/Nature_Atlas_1.tga'))
-        viewer.add(tree2)
-
-        hen = Node(transform= translate(28, -2.6, 20) @ rotate((1, 0, 0), 45) @ scale(0.5, 0.5, 0.5))
-        hen.add(*load("FantasyWorld/Animated/Hen/hen.FBX", shader_hen, light_dir=light_dir))
-        viewer.add(hen)
-
-        dino = Node(transform=translate(55, 5, 20) @ scale(0.3, 0.3, 0.3))
-        dino.add(*load("FantasyCharacters/Dino/Dino_attack_1.fbx", shader_dino, light_dir=light_dir))
-        viewer.add(dino)
-
-        rogalic = Node(transform= translate(-30, 19, 72) @ scale(0.3, 0.3, 0.3))
-        rogalic.add(*load("FantasyCharacters/Rogalic/Rogalic_attack_1.fbx", shader_rogalic, light_dir=light_dir))
-        viewer.add(rogalic)
-        
-        bridge = Node(transform= translate(-470, -2, -855) @ scale(0.5, 0.5, 0.5))
-        bridge.add(*load("FantasyWorld/Constructed/Constructed_BridgeWood02.FBX", shader2, light_dir=light_dir, tex_file="FantasyWorld/Constructed/Textures/All_Assets.tga"))
-        viewer.add(bridge)
-        
-        
-        for i in range(3):
-            rock = Node(transform=translate(70 + i*10, -2.5, -200) @ scale(0.4, 0.4, 0.4))
-            rock.add(*load("FantasyWorld/NatureAssets/Rock_01.FBX", shader, light_dir=light_dir, tex_file='FantasyWorld/NatureAssets/Textures/Nature_Atlas_1.tga'))
-            viewer.add(rock)
-            viewer.add(*[mesh for file in sys.argv[1:]
-                    for mesh in load(file, shader, light_dir=light_dir, tex_file='FantasyWorld/NatureAssets/Textures/Nature_Atlas_1.tga')])
-
-            house_mush = Node(transform=translate(-50 - i*6, 5, 25) @ scale(0.2, 0.2, 0.2))
-            house_mush.add(*load("FantasyWorld/Constructable_Elements/HouseMushroom.FBX", shader, light_dir=light_dir, tex_file='FantasyWorld/NatureAssets/Textures/Nature_Atlas_1.tga'))
-            viewer.add(house_mush)
-            
-        for i in range(1, 6):
-            tree1 = Node(transform=translate(-90, 35-i*2 , 120-i*15) @ scale(0.5, 0.5, 0.5))
-            tree1.add(*load("FantasyWorld/NatureAssets/Tree_0{}.FBX".format(i), shader, light_dir=light_dir)) #, tex_file='FantasyWorld/NatureAssets/Textures/Nature_Atlas_1.tga'))
-            viewer.add(tree1)
-
-        N=10
-        for i in range(0, N):
-            angle = 2*i*np.pi / N 
-            mother_tree = Node(transform=translate(-10 + 30*np.cos(angle), 1, 10 + 30*np.sin(angle)) @ scale(0.05, 0.05, 0.05))
-            mother_tree.add(*load("FantasyWorld/NatureAssets/Mother_Tree.FBX", shader))
-            viewer.add(mother_tree)
-
-        """ ------------------------- Animations de nos objets ---------------------------------------------------- """ 
-
-        for i in range(6):
-            angle = 2*i*np.pi / 10
-            seagull = Node(transform=translate(10 + 30*np.cos(angle), 20, 100 + 30*np.sin(angle)) @ rotate((1, 0, 0), angle=45) @ scale(0.8, 0.8, 0.8))
-            seagull.add(*load("FantasyWorld/Animated/Seagull/seagul.FBX", shader_seagull, light_dir=light_dir))
-            transkey, rotkey, scalekey = sens_rotation(-1, 0, 'seagull')
-            keynode = KeyFrameControlNode(transkey, rotkey, scalekey, 'seagull')         
-            keynode.add(seagull)
-            viewer.add(keynode)
-
-
-        pointeur = Node(transform=translate(100, 30, 40) @ scale(1, 1, 1))
-        pointeur.add(*load("FantasyWorld/NatureAssets/Crystal_05.FBX", shader_pointeur, light_dir=light_dir))
-        transkey, rotkey, scalekey = sens_rotation(1, 0, 'pointeur', move=False)
-        keynode = KeyFrameControlNode(transkey, rotkey, scalekey, 'pointeur')         
-        keynode.add(pointeur)
-        viewer.add(keynode)
+        mer = Ocean(Shader("water.vert", "water.frag"))
+        viewer.add(mer)
 
+        # sand islands are the main occluders: drawn before tested props
+        add_terrain(viewer)
+        add_sun(viewer)
 
-        boat = Node(transform=translate(-10, -1, -40) @ scale(0.3, 0.3, 0.3))
-        boat.add(*load("FantasyWorld/Boats/Galleon.FBX", shader, light_dir=light_dir, tex_file='FantasyWorld/Boats/Textures/Ships_1.tga'))
-        transkey, rotkey, scalekey = sens_rotation(1, -180, 'boat')
-        keynode = KeyFrameControlNode(transkey, rotkey, scalekey)         
-        keynode.add(boat)
-        viewer.add(keynode)
+        # snapshot is rebuilt when this file, its sources or format changed
+        if current(SNAPSHOT, code=[__file__]):
+            viewer.add(*restore(SNAPSHOT))
+        else:
+            first = len(viewer.children)
+            build_island(viewer, light_dir)
+            save(SNAPSHOT, viewer.children[first:], code=[__file__])
+        add_particles(viewer)
 
         
     else:
         #viewer.add(*[mesh for file in sys.argv[1:]
         #             for mesh in load(file, shader_mannequin, light_dir=light_dir, tex_file='FantasyWorld/NatureAssets/Textures/Nature_Atlas_1.tga')])
+        shader_mannequin = Shader("phong.vert", "lambertian.frag")
         mannequin = Mannequin(shader_mannequin, light_dir=(0,0,-1))
         mannequin.pousse()
         viewer.add(mannequin)
-    
-        
-    # start rendering loop
+    STARTUP.end()
+
+    # report GPU geometry footprint of the loaded assets, start rendering loop
+    print(LAYOUT_STATS.report())
     viewer.run()
 
 
@@ -0,0 +1,39 @@
+#version 330 core
+
+// ---- frame globals, one uniform buffer shared by all programs
+layout(std140, row_major) uniform Frame {
+    mat4 view, projection;
+    vec3 w_camera_position;
+    float time;
+    vec3 light_dir;
+};
+
+// ---- FFT slope tiles, looping over time
+uniform sampler2DArray slope_map;
+uniform float period, layers;
+
+// ---- lighting
+uniform vec3 deep_color = vec3(0.02, 0.12, 0.2);
+uniform vec3 sky_color = vec3(0.55, 0.7, 0.85);
+
+in vec3 w_position;
+in vec2 tile_coords;
+in vec2 swell_slope;
+
+out vec4 out_color;
+
+void main() {
+    float layer = fract(time / period) * layers;
+    vec2 slope = swell_slope + mix(
+        texture(slope_map, vec3(tile_coords, floor(layer))).xy,
+        texture(slope_map, vec3(tile_coords, mod(floor(layer) + 1, layers))).xy,
+        fract(layer));
+
+    vec3 n = normalize(vec3(-slope.x, 1, -slope.y));
+    vec3 l = normalize(-light_dir);
+    vec3 v = normalize(w_camera_position - w_position);
+    float fresnel = 0.02 + 0.98 * pow(1 - max(dot(n, v), 0), 5);
+    float specular = pow(max(dot(reflect(-l, n), v), 0), 200);
+    vec3 diffuse = deep_color * (0.3 + 0.7 * max(dot(n, l), 0));
+    out_color = vec4(mix(diffuse, sky_color, fresnel) + vec3(specular), 1);
+}
@@ -0,0 +1,173 @@
+# External, non built-in modules
+import OpenGL.GL as GL              # standard Python OpenGL wrapper
+import numpy as np                  # all matrix manipulations & OpenGL args
+
+from core import Node, VertexArray
+from resources import RESOURCES
+from transform import identity
+
+GRAVITY = 9.81
+
+
+# -------------- FFT wave spectrum, precomputed to looping tiles --------------
+class WaveSpectrum:
+    """ Phillips spectrum ocean synthesized by FFT at startup, as a looping
+        sequence of periodic displacement and slope tiles """
+    def __init__(self, size=128, length=64., wind=(12, 5), height=.6,
+                 choppiness=1.2, period=24., frames=48, seed=7):
+        self.size, self.length, self.period = size, length, period
+
+        # wave vectors of the periodic tile, rows along z and columns along x
+        k_1d = 2 * np.pi * np.fft.fftfreq(size, length / size)
+        k_x, k_z = np.meshgrid(k_1d, k_1d)
+        k = np.maximum(np.hypot(k_x, k_z), 1e-6)
+
+        # Phillips spectrum: waves aligned with wind, largest ones L = V^2 / g
+        speed = np.hypot(*wind)
+        largest = speed ** 2 / GRAVITY
+        alignment = (k_x * wind[0] + k_z * wind[1]) / (k * speed)
+        spectrum = np.exp(-1 / (k * largest) ** 2) / k ** 4 * alignment ** 2
+        spectrum *= np.exp(-(k * largest / 1000) ** 2)  # damp tiny ripples
+        spectrum[alignment < 0] *= .07                  # few waves upwind
+        spectrum[0, 0] = 0
+
+        rng = np.random.default_rng(seed)
+        gauss = rng.standard_normal((2, size, size))
+        h0 = (gauss[0] + 1j * gauss[1]) * np.sqrt(spectrum / 2)
+        opposite = -np.arange(size) % size                # index of -k
+        h0_opposite = np.conj(h0[opposite][:, opposite])
+
+        # dispersion quantized to multiples of the loop frequency
+        omega_0 = 2 * np.pi / period
+        omega = np.floor(np.sqrt(GRAVITY * k) / omega_0) * omega_0
+        times = np.arange(frames) * period / frames
+        phase = np.exp(1j * omega * times[:, None, None])
+        h_k = h0 * phase + h0_opposite * np.conj(phase)
+
+        # height, choppy horizontal displacement and slopes for each frame
+        ifft = lambda spectrum_k: np.fft.ifft2(spectrum_k).real
+        heights = ifft(h_k)
+        unit = height / max(np.abs(heights).max(), 1e-9)
+        self.displacement = np.stack((
+            -choppiness * unit * ifft(1j * k_x / k * h_k),
+            unit * heights,
+            -choppiness * unit * ifft(1j * k_z / k * h_k),
+            np.zeros_like(heights)), axis=-1).astype(np.float32)
+        self.slope = np.stack((
+            unit * ifft(1j * k_x * h_k),
+            unit * ifft(1j * k_z * h_k),
+            np.zeros_like(heights),
+            np.zeros_like(heights)), axis=-1).astype(np.float32)
+
+
+class WaveTiles:
+    """ GPU texture arrays holding a WaveSpectrum, one layer per frame """
+    def __init__(self, spectrum):
+        self.spectrum = spectrum
+        self.frames = len(spectrum.displacement)
+        self.glids = GL.glGenTextures(2)
+        for glid, data in zip(self.glids, (spectrum.displacement,
+                                           spectrum.slope)):
+            GL.glBindTexture(GL.GL_TEXTURE_2D_ARRAY, glid)
+            GL.glTexImage3D(GL.GL_TEXTURE_2D_ARRAY, 0, GL.GL_RGBA16F,
+                            spectrum.size, spectrum.size, self.frames, 0,
+                            GL.GL_RGBA, GL.GL_FLOAT, data)
+            GL.glTexParameteri(GL.GL_TEXTURE_2D_ARRAY, GL.GL_TEXTURE_WRAP_S,
+                               GL.GL_REPEAT)
+            GL.glTexParameteri(GL.GL_TEXTURE_2D_ARRAY, GL.GL_TEXTURE_WRAP_T,
+                               GL.GL_REPEAT)
+            GL.glTexParameteri(GL.GL_TEXTURE_2D_ARRAY,
+                               GL.GL_TEXTURE_MIN_FILTER,
+                               GL.GL_LINEAR_MIPMAP_LINEAR)
+            GL.glTexParameteri(GL.GL_TEXTURE_2D_ARRAY,
+                               GL.GL_TEXTURE_MAG_FILTER, GL.GL_LINEAR)
+            GL.glGenerateMipmap(GL.GL_TEXTURE_2D_ARRAY)
+        nbytes = 2 * 8 * spectrum.size ** 2 * self.frames * 4 // 3
+        RESOURCES.track(self, nbytes, lambda glids=self.glids:
+                        GL.glDeleteTextures(glids), 'texture', evictable=False)
+
+    def bind(self, first_unit=0):
+        """ bind displacement and slope arrays to two consecutive units """
+        for unit, glid in enumerate(self.glids, first_unit):
+            GL.glActiveTexture(GL.GL_TEXTURE0 + unit)
+            GL.glBindTexture(GL.GL_TEXTURE_2D_ARRAY, glid)
+
+
+# -------------- camera centered nested grid ocean ----------------------------
+class Ocean(Node):
+    """ Unbounded sea surface: nested grid rings of doubling cell size
+        follow the camera and are displaced in the vertex shader, so the
+        triangle count is constant and no geometry is updated per frame """
+    def __init__(self, shader, spectrum=None, levels=8, resolution=64,
+                 cell=.5, swell=None, transform=None, **uniforms):
+        super().__init__(transform=transform)
+        assert resolution % 4 == 0, 'ring hole must fall on coarse vertices'
+        self.shader, self.uniforms = shader, uniforms
+        self.levels, self.resolution, self.cell = levels, resolution, cell
+        self.tiles = WaveTiles(spectrum or WaveSpectrum())
+
+        # large swell as Gerstner waves: direction x & z, steepness, length
+        self.swell = np.array(swell or ((1, .3, .25, 60), (.7, .7, .2, 31),
+                                        (.2, 1, .15, 18), (-.4, .9, .1, 9)),
+                              np.float32)
+        self.swell[:, :2] /= np.linalg.norm(self.swell[:, :2], axis=1)[:, None]
+
+        # one (n+1)^2 grid of integer cell coordinates, shared by every level
+        half = resolution // 2
+        coords = np.arange(-half, half + 1)
+        grid_x, grid_z = np.meshgrid(coords, coords)
+        position = np.stack((grid_x.ravel(), grid_z.ravel()), axis=-1)
+
+        # quads of the full grid as triangle pairs facing up (+y)
+        corner = (np.arange(resolution)[:, None] * (resolution + 1) +
+                  np.arange(resolution)[None, :])
+        quads = np.stack((corner, corner + resolution + 1, corner + 1,
+                          corner + 1, corner + resolution + 1,
+                          corner + resolution + 2), axis=-1)
+
+        # innermost level is the full grid, outer levels are rings whose hole
+        # is covered by the finer level, offset by 0 or 1 cell on each axis
+        # depending on how the finer level snapped to its own grid
+        quad_x, quad_z = np.meshgrid(coords[:-1], coords[:-1])
+        self.patches = {None: VertexArray(shader, dict(position=position),
+                                          quads.reshape(-1, 3))}
+        for offset_x in (0, 1):
+            for offset_z in (0, 1):
+                hole = ((quad_x >= -half // 2 + offset_x) &
+                        (quad_x < half // 2 + offset_x) &
+                        (quad_z >= -half // 2 + offset_z) &
+                        (quad_z < half // 2 + offset_z))
+                self.patches[offset_x, offset_z] = VertexArray(
+                    shader, dict(position=position),
+                    quads[~hole].reshape(-1, 3))
+
+    def draw(self, model=None, **other_uniforms):
+        """ draw every level around camera, at this node's world height """
+        model = identity() if model is None else model
+        self.world_transform = model @ self.transform
+        camera = np.asarray(other_uniforms['w_camera_position'])[[0, 2]]
+        spectrum = self.tiles.spectrum
+
+        GL.glUseProgram(self.shader.glid)
+        self.tiles.bind()
+        self.shader.set_uniforms({
+            **self.uniforms, **other_uniforms,
+            'sea_level': self.world_transform[1, 3],
+            'period': spectrum.period, 'layers': self.tiles.frames,
+            'tile_length': spectrum.length,
+            'half_size': self.resolution // 2, 'morph_cells': 8,
+            'waves': self.swell, 'displacement_map': 0, 'slope_map': 1})
+
+        inner_origin = None
+        for level in range(self.levels):
+            # snap each level to twice its cell size, so that its vertices
+            # always land on vertices of the next coarser level
+            cell = self.cell * 2 ** level
+            origin = np.floor(camera / (2 * cell)) * 2 * cell
+            offset = None if inner_origin is None else \
+                tuple(np.round((inner_origin - origin) / cell).astype(int))
+            self.shader.set_uniforms(dict(
+                cell=cell, origin=origin,
+                morph_enabled=float(level < self.levels - 1)))
+            self.patches[offset].execute(GL.GL_TRIANGLES)
+            inner_origin = origin
@@ -0,0 +1,60 @@
+#version 330 core
+
+// ---- frame globals, one uniform buffer shared by all programs
+layout(std140, row_major) uniform Frame {
+    mat4 view, projection;
+    vec3 w_camera_position;
+    float time;
+    vec3 light_dir;
+};
+
+// ---- ocean level placement: snapped origin and cell size of this level
+uniform vec2 origin;
+uniform float cell, half_size, morph_cells, morph_enabled, sea_level;
+
+// ---- precomputed FFT tiles, looping over time, and Gerstner swell
+uniform sampler2DArray displacement_map;
+uniform float period, layers, tile_length;
+uniform vec4 waves[4];     // direction x, direction z, steepness, wavelength
+
+// ---- vertex attributes: integer grid coordinates in cells
+in vec2 position;
+
+// ----- interpolated attribute variables to be passed to fragment shader
+out vec3 w_position;
+out vec2 tile_coords;
+out vec2 swell_slope;
+
+void main() {
+    // collapse odd vertices onto even ones near the level border, where
+    // the next coarser level only has every other vertex: no T-junctions
+    float border = half_size - max(abs(position.x), abs(position.y));
+    float morph = morph_enabled * clamp(1.0 - border / morph_cells, 0, 1);
+    vec2 grid = position - mod(position, 2.0) * morph;
+    vec2 xz = origin + grid * cell;
+
+    // FFT detail, blended between the two tiles around current time
+    float layer = fract(time / period) * layers;
+    float blend = fract(layer);
+    tile_coords = xz / tile_length;
+    vec3 offset = mix(
+        textureLod(displacement_map, vec3(tile_coords, floor(layer)), 0).xyz,
+        textureLod(displacement_map,
+                   vec3(tile_coords, mod(floor(layer) + 1, layers)), 0).xyz,
+        blend);
+
+    // long Gerstner swell waves, evaluated analytically
+    swell_slope = vec2(0);
+    for (int i = 0; i < 4; i++) {
+        float k = 6.2831853 / waves[i].w;
+        float phase = k * (dot(waves[i].xy, xz) - sqrt(9.81 / k) * time);
+        float amplitude = waves[i].z / k;
+        offset += vec3(waves[i].x * amplitude * cos(phase),
+                       amplitude * sin(phase),
+                       waves[i].y * amplitude * cos(phase));
+        swell_slope += waves[i].xy * waves[i].z * cos(phase);
+    }
+
+    w_position = vec3(xz.x, sea_level, xz.y) + offset;
+    gl_Position = projection * view * vec4(w_position, 1);
+}